@@ -0,0 +1,73 @@
+# api/middleware.py
+import time
+from core.config import settings
+from core.instrumentation import HTTP_REQUEST_SECONDS, SamplingProfiler, profile_store
+
+# Rótulo das requisições que não casaram com nenhuma rota (evita uma série por URL inválida)
+UNMATCHED_ROUTE = "<sem rota>"
+
+class InstrumentationMiddleware:
+    """
+    Middleware ASGI: histograma de latência por método, rota (o modelo, ex. /ativos/{ativo}) e status.
+    Com PROFILING_ENABLED, o cabeçalho `X-Profile` liga o profiler por amostragem durante a requisição;
+    se ela levar mais que PROFILE_SLOW_MS (ou `X-Profile-Min-Ms`), o perfil fica em /perfis/{id}
+    e a resposta traz `X-Profile-Id`. Só requisições perfiladas têm a resposta retida até o fim.
+    """
+
+    def __init__(self, app, profiling: bool = None, slow_ms: float = None, interval_ms: float = None):
+        self.app = app
+        self.profiling = settings.PROFILING_ENABLED if profiling is None else profiling
+        self.slow_ms = settings.PROFILE_SLOW_MS if slow_ms is None else slow_ms
+        self.interval_ms = settings.PROFILE_INTERVAL_MS if interval_ms is None else interval_ms
+
+    @staticmethod
+    def _header(scope, nome: bytes):
+        return next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == nome), None)
+
+    def _min_ms(self, scope) -> float:
+        try:
+            return float(self._header(scope, b"x-profile-min-ms"))
+        except (TypeError, ValueError):
+            return self.slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        if self.profiling and self._header(scope, b"x-profile") is not None:
+            profiler = SamplingProfiler(self.interval_ms / 1000)
+            if not profiler.start():
+                profiler = None  # outro perfil em andamento: segue sem perfilar
+
+        status = 500
+        retidas = []
+
+        async def enviar(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            if profiler is None:
+                await send(message)
+            else:
+                retidas.append(message)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            segundos = time.perf_counter() - inicio
+            rota = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            HTTP_REQUEST_SECONDS.observe(segundos, method=scope["method"], route=rota, status=status)
+            folded = profiler.stop() if profiler is not None else None
+
+        if profiler is None:
+            return
+        if segundos * 1000 >= self._min_ms(scope):
+            perfil_id = profile_store.add(f"{scope['method']} {rota}", segundos, profiler.samples, folded)
+            for message in retidas:
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-id", str(perfil_id).encode())]
+        for message in retidas:
+            await send(message)
@@ -0,0 +1,139 @@
+import gzip
+import importlib.util
+import json
+from email.utils import formatdate, parsedate_to_datetime
+import numpy as np
+import pandas as pd
+from fastapi import Request
+from fastapi.responses import Response
+from core.constants import ResponseConfig
+
+# Dependências opcionais: sem elas, json da biblioteca padrão e só gzip
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+def columnar(df: pd.DataFrame) -> dict:
+    """Uma lista por coluna, direto dos arrays NumPy (sem um dict por linha)."""
+    return {col: df[col].to_numpy() for col in df.columns}
+
+def dumps(content) -> bytes:
+    """JSON com orjson, serializando arrays NumPy nativamente (NaN vira null)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, allow_nan=False, separators=(",", ":")).encode()
+
+def _default(obj):
+    """Tipos que o encoder não conhece: arrays de objetos (texto) e escalares NumPy."""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f":
+            return [None if np.isnan(v) else v for v in obj.tolist()]
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+def arrow_available() -> bool:
+    """pyarrow instalado (procurado sem importar: o import é pesado e fica para a primeira resposta Arrow)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def arrow_ipc(df: pd.DataFrame) -> bytes:
+    """DataFrame no formato Arrow IPC (stream), para clientes programáticos."""
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Escolhe br > gzip > identity conforme o Accept-Encoding (respeitando q=0)."""
+    aceitos = {}
+    for parte in (accept_encoding or "").split(","):
+        nome, _, params = parte.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitos[nome.lower()] = q
+    for nome in (["br"] if brotli is not None else []) + ["gzip"]:
+        if aceitos.get(nome, aceitos.get("*", 0)) > 0:
+            return nome
+    return "identity"
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=ResponseConfig.BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=ResponseConfig.GZIP_LEVEL)
+    return body
+
+def encoded_response(body: bytes, media_type: str, request: Request, headers: dict = None) -> Response:
+    """Resposta com compressão negociada (payloads pequenos vão sem compressão)."""
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = "identity"
+    if len(body) >= ResponseConfig.MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding != "identity":
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def dataframe_response(df: pd.DataFrame, formato: str, request: Request) -> Response:
+    """
+    Serializa o DataFrame no formato pedido: registros (uma linha por objeto, compatível),
+    colunas (uma lista por coluna) ou arrow (IPC stream). O Accept do Arrow também seleciona o formato
+    (sem pyarrow, a negociação pelo Accept cai no JSON).
+    """
+    if formato == "arrow" or (ARROW_MEDIA_TYPE in request.headers.get("accept", "") and arrow_available()):
+        return encoded_response(arrow_ipc(df), ARROW_MEDIA_TYPE, request)
+    if formato == "colunas":
+        return encoded_response(dumps(columnar(df)), "application/json", request)
+    return encoded_response(dumps(df.to_dict(orient="records")), "application/json", request)
+
+def batch_response(lote: dict, layout: str, request: Request) -> Response:
+    """
+    Histórico de vários ativos alinhado por data: em `colunas`, uma lista por ativo e campo; em `matriz`,
+    por campo, uma linha por data com um valor por ativo. Datas sem negócio do ativo saem como null.
+    """
+    corpo = {"datas": lote["datas"], "campos": lote["campos"], "ausentes": lote["ausentes"]}
+    if layout == "matriz":
+        corpo["tickers"] = lote["tickers"]
+        corpo["valores"] = {c: np.ascontiguousarray(m.T) for c, m in lote["valores"].items()}
+    else:
+        corpo["ativos"] = {t: {c: lote["valores"][c][j] for c in lote["campos"]} for j, t in enumerate(lote["tickers"])}
+    return encoded_response(dumps(corpo), "application/json", request)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match contém o ETag (ou *)."""
+    valores = [v.strip().removeprefix("W/") for v in request.headers.get("if-none-match", "").split(",")]
+    return "*" in valores or f'"{etag}"' in valores
+
+def not_modified_since(request: Request, modificado: float) -> bool:
+    """If-Modified-Since posterior à gravação (só vale quando não há If-None-Match)."""
+    valor = request.headers.get("if-modified-since")
+    if not valor or "if-none-match" in request.headers:
+        return False
+    try:
+        return int(modificado) <= parsedate_to_datetime(valor).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+def validator_headers(etag: str, modificado: float = None) -> dict:
+    """Validadores de cache HTTP; no-cache obriga o cliente a revalidar (os dados mudam a cada ETL)."""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if modificado is not None:
+        headers["Last-Modified"] = formatdate(modificado, usegmt=True)
+    return headers
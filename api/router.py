@@ -7,16 +7,35 @@ root_path = str(Path(__file__).resolve().parent.parent)
 if root_path not in sys.path:
     sys.path.append(root_path)
 
-from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Dict
+from contextlib import asynccontextmanager
+import asyncio
+from datetime import date
+import numpy as np
 
 from services.market_service import MarketService
 from services.analysis_service import AnalysisService
 from services.chart_service import ChartService
-from core.constants import ChartConfig, ErrorMessages
-from core.config import settings as config
+from services.ticker_cache import ticker_cache
+from services.market_snapshot import market_snapshot
+from services.chart_cache import chart_cache
+from services.chart_renderer import RendererBusy, chart_renderer
+from services.indicator_service import IndicatorService, indicator_service
+from services.screener_service import ScreenerService, screener_service
+from services.correlation_service import CorrelationService
+from services.warmup import warmup
+from core.constants import (
+    ChartConfig, IndicatorConfig, ScreenerConfig, TickerIndexConfig, CorrelationConfig, SamplingConfig, ResponseConfig,
+    BatchConfig, ErrorMessages
+)
+from api.responses import arrow_available, batch_response, dataframe_response, etag_matches, not_modified_since, validator_headers
+from core.config import settings as config, setup_logging
+from core.async_database import async_db_manager
+from core.instrumentation import registry, profile_store
+from api.middleware import InstrumentationMiddleware
 
 router = APIRouter()
 
@@ -33,6 +52,15 @@ def get_analysis_service():
 def get_chart_service():
     return ChartService()
 
+def get_indicator_service():
+    return indicator_service
+
+def get_screener_service():
+    return screener_service
+
+def get_correlation_service():
+    return CorrelationService()
+
 #---------------------
 # --- ENDPOINTS    ---
 #---------------------
@@ -46,34 +74,119 @@ def raiz():
 # Ativos Disponíveis
 
 @router.get("/ativos", summary="Listar Ativos Disponíveis", tags=["Ativos"])
-def listar_ativos(
-    limit: int = Query(500, description="Limite de ativos"), 
+async def listar_ativos(
+    limit: int = Query(500, ge=1, le=5000, description="Limite de ativos"), 
+    offset: int = Query(0, ge=0, description="Ativos pulados (paginação, do mais para o menos líquido)"),
     service: MarketService = Depends(get_market_service)
 ):
     try:
         # IMPORTANTE: No MarketService, o método deve aceitar content_limit
         # E certifique-se de que a função no service tem o (self, content_limit)
-        ativos = service.list_available_tickers(content_limit=limit)
-        return {"total": len(ativos), "ativos": ativos}
+        ativos = await service.list_available_tickers_async(content_limit=limit, offset=offset)
+        total = await service.count_available_tickers_async()
+        return {"total": total, "offset": offset, "limit": limit, "ativos": ativos}
     except Exception as e:
         print(f"Erro no endpoint /ativos: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+# Busca de Ativos (declarada antes de /ativos/{ativo}, senão "busca" seria lido como ticker)
+
+@router.get("/ativos/busca", summary="Buscar Ativos", tags=["Ativos"])
+async def buscar_ativos(
+    q: str = Query(..., min_length=1, max_length=40, description="Prefixo ou trecho do ticker ou do nome da empresa"),
+    limite: int = Query(TickerIndexConfig.SEARCH_LIMIT, ge=1, le=TickerIndexConfig.MAX_SEARCH_LIMIT),
+    service: MarketService = Depends(get_market_service)
+):
+    ativos = await service.search_tickers_async(q, limite)
+    return {"q": q, "total": len(ativos), "ativos": ativos}
+
+# Histórico de Vários Ativos numa só requisição (também declarada antes de /ativos/{ativo})
+
+@router.get("/ativos/lote", summary="Histórico de Vários Ativos", tags=["Ativos"])
+async def obter_historico_lote(
+    request: Request,
+    tickers: str = Query(..., description="Ativos separados por vírgula (ex.: PETR4,VALE3,ITUB4)"),
+    campos: str = Query(",".join(BatchConfig.DEFAULT_FIELDS), description="Campos numéricos separados por vírgula"),
+    ajustado: bool = Query(False, description="Preços ajustados por proventos e desdobramentos"),
+    inicio: date = Query(None, description="Primeiro pregão (AAAA-MM-DD)"),
+    fim: date = Query(None, description="Último pregão (AAAA-MM-DD)"),
+    ultimos: int = Query(None, ge=1, le=ResponseConfig.MAX_LAST_SESSIONS, description="Só as N datas mais recentes"),
+    layout: str = Query("colunas", description="colunas (uma série por ativo) ou matriz (data x ativo por campo)"),
+    service: MarketService = Depends(get_market_service)
+):
+    if layout not in BatchConfig.LAYOUTS:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_LAYOUT(layout))
+    lista = list(dict.fromkeys(t.strip().upper() for t in tickers.split(",") if t.strip()))
+    if not 1 <= len(lista) <= BatchConfig.MAX_TICKERS:
+        raise HTTPException(status_code=400, detail=ErrorMessages.BATCH_SIZE)
+    lista_campos = [c.strip().lower() for c in campos.split(",") if c.strip()]
+    invalidos = [c for c in lista_campos if c not in BatchConfig.FIELDS]
+    if invalidos or not lista_campos:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_BATCH_FIELDS(invalidos))
+
+    lote = await service.get_batch_async(
+        lista, campos=lista_campos, inicio=inicio and inicio.isoformat(), fim=fim and fim.isoformat(),
+        ultimos=ultimos, ajustado=ajustado,
+    )
+    if not lote["tickers"]:
+        raise HTTPException(status_code=404, detail=ErrorMessages.NOT_FOUND(", ".join(lote["ausentes"])))
+    return await asyncio.to_thread(batch_response, lote, layout, request)
+
 # Dados Históricos do Ativo
 
 @router.get("/ativos/{ativo}", summary="Dados Históricos", tags=["Ativos"])
-def obter_historico_ativo(ativo: str, service: MarketService = Depends(get_market_service)):
-    df = service.get_ticker_data(ativo.upper())
+async def obter_historico_ativo(
+    request: Request,
+    ativo: str,
+    ajustado: bool = Query(False, description="Preços ajustados por proventos e desdobramentos"),
+    inicio: date = Query(None, description="Primeiro pregão (AAAA-MM-DD)"),
+    fim: date = Query(None, description="Último pregão (AAAA-MM-DD)"),
+    max_pontos: int = Query(None, ge=3, le=100_000, description="Máximo de pontos devolvidos"),
+    amostragem: str = Query("lttb", description="lttb (pregões reais) ou ohlc (candles agregados)"),
+    serie: str = Query("fechamento", description="Série usada pelo LTTB"),
+    ultimos: int = Query(None, ge=1, le=ResponseConfig.MAX_LAST_SESSIONS, description="Só os N pregões mais recentes"),
+    campos: str = Query(None, description="Campos separados por vírgula (ex.: fechamento,volume); a data sempre vem"),
+    formato: str = Query("registros", description="registros, colunas (uma lista por coluna) ou arrow (IPC)"),
+    service: MarketService = Depends(get_market_service)
+):
+    if formato not in ResponseConfig.FORMATS:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_FORMAT(formato))
+    if formato == "arrow" and not arrow_available():
+        raise HTTPException(status_code=501, detail=ErrorMessages.ARROW_UNAVAILABLE)
+    lista_campos = [c.strip().lower() for c in campos.split(",") if c.strip()] if campos else None
+    invalidos = [c for c in lista_campos or [] if c not in ResponseConfig.FIELDS]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_FIELDS(invalidos))
+    if amostragem not in SamplingConfig.MODES:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_SAMPLING(amostragem))
+    if serie not in SamplingConfig.SERIES:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_SERIES(serie))
+
+    # Leitura pelo driver assíncrono: a espera pelo banco não prende uma thread do servidor
+    df = await service.get_history_async(
+        ativo.upper(), inicio=inicio and inicio.isoformat(), fim=fim and fim.isoformat(),
+        max_pontos=max_pontos, amostragem=amostragem, serie=serie, ajustado=ajustado,
+        ultimos=ultimos, campos=lista_campos,
+    )
     if df.empty:
         raise HTTPException(status_code=404, detail=ErrorMessages.NOT_FOUND(ativo))
-    return df.to_dict(orient="records")
+    # Serializado direto dos arrays (orjson), com gzip/brotli conforme o Accept-Encoding, fora do event loop
+    return await asyncio.to_thread(dataframe_response, df, formato, request)
 
 # Gráfico do Ativo
 
 @router.get("/ativos/{ativo}/graficos", tags=["Visualização"])
-def obter_grafico_imagem(
+async def obter_grafico_imagem(
     ativo: str, 
+    request: Request,
     tipo: str = "fechamento",
+    ajustado: bool = Query(False, description="Preços ajustados por proventos e desdobramentos"),
+    inicio: date = Query(None, description="Primeiro pregão (AAAA-MM-DD)"),
+    fim: date = Query(None, description="Último pregão (AAAA-MM-DD)"),
+    max_pontos: int = Query(SamplingConfig.CHART_MAX_POINTS, ge=3, le=10_000, description="Máximo de pontos no gráfico"),
+    formato: str = Query("png", description="png ou svg"),
+    largura: int = Query(ChartConfig.DEFAULT_WIDTH, ge=200, le=4000, description="Largura em pixels"),
+    altura: int = Query(ChartConfig.DEFAULT_HEIGHT, ge=100, le=4000, description="Altura em pixels"),
     service: ChartService = Depends(get_chart_service)
 ):
     
@@ -83,11 +196,166 @@ def obter_grafico_imagem(
             status_code=400, 
             detail=ErrorMessages.INVALID_TYPE(tipo)
         )
-    
-    fig = service.generate_styled_chart(ativo.upper(), tipo.lower())
-    if fig is None:
+    formato = formato.lower()
+    if formato not in ChartConfig.FORMATS:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_CHART_FORMAT(formato))
+
+    params = dict(
+        ticker=ativo.upper(), chart_type=tipo, ajustado=ajustado,
+        inicio=inicio and inicio.isoformat(), fim=fim and fim.isoformat(), max_pontos=max_pontos,
+        formato=formato, largura=largura, altura=altura,
+    )
+    # O ETag é o endereço no cache: o 304 sai sem renderizar nem ler o disco
+    versao, chave = service.chart_key(**params)
+    if etag_matches(request, chave):
+        return Response(status_code=304, headers=validator_headers(chave))
+
+    try:
+        imagem = await service.get_chart_async(**params, versao=versao, chave=chave)
+    except RendererBusy:
+        # A espera pelo pool não ocupa threads do servidor; excedente (ou acima do tempo limite) volta com 503
+        raise HTTPException(status_code=503, detail=ErrorMessages.RENDERER_BUSY,
+                            headers={"Retry-After": str(ChartConfig.RETRY_AFTER)})
+    if imagem is None:
+        raise HTTPException(status_code=404, detail=ErrorMessages.NOT_FOUND(ativo))
+    conteudo, modificado = imagem
+    headers = validator_headers(chave, modificado)
+    if not_modified_since(request, modificado):
+        return Response(status_code=304, headers=headers)
+    return Response(content=conteudo, media_type=ChartConfig.FORMATS[formato], headers=headers)
+
+# Indicadores Técnicos (aceita vários ativos separados por vírgula)
+
+@router.get("/ativos/{ativo}/indicadores", summary="Indicadores Técnicos", tags=["Análise"])
+def obter_indicadores(
+    ativo: str,
+    tipo: str = Query("sma", description="sma, ema, rsi, bollinger, atr, volatilidade ou drawdown"),
+    janela: int = Query(IndicatorConfig.DEFAULT_WINDOW, ge=1, le=1000, description="Janela em pregões"),
+    service: IndicatorService = Depends(get_indicator_service)
+):
+    tipo = tipo.lower()
+    if tipo not in IndicatorConfig.ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_INDICATOR(tipo))
+
+    tickers = [t.strip().upper() for t in ativo.split(",") if t.strip()]
+    resultado = service.get_indicators(tickers, tipo, janela)
+    if not resultado:
         raise HTTPException(status_code=404, detail=ErrorMessages.NOT_FOUND(ativo))
-    return service.create_streaming_response(fig)
+
+    # NaN (período de aquecimento da janela) vira null no JSON
+    ativos = {
+        ticker: df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        for ticker, df in resultado.items()
+    }
+    return {"tipo": tipo, "janela": janela, "ativos": ativos}
+
+# Screener Transversal (todos os ativos numa única passada)
+
+@router.get("/screener", summary="Screener de Ativos", tags=["Análise"])
+def screener(
+    janela: int = Query(ScreenerConfig.DEFAULT_WINDOW, ge=1, le=252, description="Janela em pregões"),
+    bdi: str = Query(None, description="Códigos BDI separados por vírgula (padrão: os permitidos)"),
+    volume_min: float = Query(None, description="Volume médio mínimo na janela"),
+    retorno_min: float = Query(None, description="Retorno mínimo na janela (0.1 = 10%)"),
+    retorno_max: float = Query(None, description="Retorno máximo na janela"),
+    nova_maxima: bool = Query(False, description="Apenas ativos que renovaram a máxima de 52 semanas"),
+    nova_minima: bool = Query(False, description="Apenas ativos que renovaram a mínima de 52 semanas"),
+    ordenar: str = Query("retorno", description="Campo de ordenação"),
+    ordem: str = Query("desc", pattern="^(asc|desc)$"),
+    limite: int = Query(ScreenerConfig.DEFAULT_LIMIT, ge=1, le=5000),
+    service: ScreenerService = Depends(get_screener_service)
+):
+    if ordenar not in ScreenerConfig.SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_SORT(ordenar))
+
+    bdi_codes = [b.strip().zfill(2) for b in bdi.split(",") if b.strip()] if bdi else None
+    resultado = service.screen(
+        janela=janela, bdi_codes=bdi_codes, volume_min=volume_min,
+        retorno_min=retorno_min, retorno_max=retorno_max,
+        nova_maxima=nova_maxima, nova_minima=nova_minima,
+        ordenar=ordenar, ordem=ordem, limite=limite,
+    )
+    df = resultado["ativos"]
+    ativos = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    return {"data_referencia": resultado["data_referencia"], "janela": janela,
+            "total": resultado["total"], "ativos": ativos}
+
+# Correlação entre Ativos (sobre a matriz de retornos gerada pelo ETL)
+
+def _matriz_json(m):
+    return [[None if np.isnan(v) else float(v) for v in linha] for linha in m]
+
+@router.get("/correlacao", summary="Correlação e Covariância entre Ativos", tags=["Análise"])
+def correlacao(
+    tickers: str = Query(None, description="Ativos separados por vírgula (padrão: todos os líquidos)"),
+    janela: int = Query(CorrelationConfig.DEFAULT_WINDOW, ge=2, le=5000, description="Janela em pregões"),
+    modo: str = Query("matriz", description="matriz ou movel"),
+    pontos: int = Query(CorrelationConfig.DEFAULT_POINTS, ge=1, le=10000, description="Sessões da série móvel"),
+    service: CorrelationService = Depends(get_correlation_service)
+):
+    if modo not in CorrelationConfig.MODES:
+        raise HTTPException(status_code=400, detail=ErrorMessages.INVALID_MODE(modo))
+    lista = [t.strip().upper() for t in tickers.split(",") if t.strip()] if tickers else []
+
+    if modo == "movel":
+        if not 2 <= len(lista) <= CorrelationConfig.MAX_ROLLING_TICKERS:
+            raise HTTPException(status_code=400, detail=ErrorMessages.ROLLING_TICKERS)
+        resultado = service.rolling(lista, janela, pontos)
+    else:
+        resultado = service.correlation(lista, janela)
+
+    if resultado is None:
+        raise HTTPException(status_code=503, detail=ErrorMessages.MATRIX_UNAVAILABLE)
+    if len(resultado["tickers"]) < 2:
+        raise HTTPException(status_code=404, detail=ErrorMessages.NOT_FOUND(", ".join(resultado["ausentes"]) or tickers))
+
+    if modo == "movel":
+        resultado["pares"] = {par: _matriz_json([serie])[0] for par, serie in resultado["pares"].items()}
+    else:
+        resultado["correlacao"] = _matriz_json(resultado["correlacao"])
+        resultado["covariancia"] = _matriz_json(resultado["covariancia"])
+    return {"janela": janela, "modo": modo, **resultado}
+
+# Estatísticas do cache de histórico
+
+@router.get("/cache", summary="Estatísticas do Cache de Ativos", tags=["Infra"])
+def estatisticas_cache():
+    return {**ticker_cache.stats(), "snapshot": market_snapshot.stats(), "graficos": chart_cache.stats(),
+            "renderizacao": chart_renderer.stats(), "pool_conexoes": async_db_manager.pool_status()}
+
+# Prontidão: 503 até o aquecimento (universo de ativos, histórico dos mais líquidos e gráficos) terminar
+
+@router.get("/pronto", summary="Prontidão da API", tags=["Infra"])
+def prontidao():
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["pronto"] else 503)
+
+# Métricas no formato texto do Prometheus (contadores dos caches lidos na coleta)
+
+registry.gauge("b3_ticker_cache_hits_total", "Acertos do cache de histórico", lambda: ticker_cache.hits, "counter")
+registry.gauge("b3_ticker_cache_misses_total", "Faltas do cache de histórico", lambda: ticker_cache.misses, "counter")
+registry.gauge("b3_chart_cache_hits_total", "Gráficos servidos da memória", lambda: chart_cache.hits, "counter")
+registry.gauge("b3_chart_cache_disk_hits_total", "Gráficos servidos do disco", lambda: chart_cache.disk_hits, "counter")
+registry.gauge("b3_chart_cache_misses_total", "Gráficos renderizados sob demanda", lambda: chart_cache.misses, "counter")
+registry.gauge("b3_chart_render_rejected_total", "Renderizações recusadas (503)", lambda: chart_renderer.rejected, "counter")
+
+@router.get("/metrics", summary="Métricas (Prometheus)", tags=["Infra"])
+def metricas():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Perfis por amostragem capturados com o cabeçalho X-Profile
+
+@router.get("/perfis", summary="Perfis Capturados", tags=["Infra"])
+def listar_perfis():
+    return {"habilitado": config.PROFILING_ENABLED, "perfis": profile_store.list()}
+
+@router.get("/perfis/{perfil_id}", summary="Perfil (pilhas no formato folded)", tags=["Infra"])
+def obter_perfil(perfil_id: int):
+    perfil = profile_store.get(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail=ErrorMessages.PROFILE_NOT_FOUND)
+    # Uma linha por pilha ("thread;quadro;...;folha amostras"): flamegraph.pl, speedscope, inferno
+    return Response(perfil["folded"], media_type="text/plain; charset=utf-8")
 
 @router.get('/favicon.ico', include_in_schema=False)
 async def favicon():
@@ -97,7 +365,18 @@ async def favicon():
 # --- INICIALIZAÇÃO DA APP ---
 #-----------------------------
 
-app = FastAPI(title="B3 API Otimizada")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    # Aquecimento em segundo plano: a API já responde e /pronto informa quando ele terminar
+    aquecimento = asyncio.create_task(warmup.run())
+    yield
+    aquecimento.cancel()
+    # Encerra os processos de renderização de gráficos e fecha os pools de conexão assíncronos
+    chart_renderer.shutdown()
+    await async_db_manager.dispose()
+
+app = FastAPI(title="B3 API Otimizada", lifespan=lifespan)
 
 # Adicione o CORS caso vá usar com o index.html
 app.add_middleware(
@@ -107,6 +386,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latência por rota (/metrics) e profiler sob demanda; adicionado por último, envolve os demais middlewares
+app.add_middleware(InstrumentationMiddleware)
+
 app.include_router(router)
 
 if __name__ == "__main__":
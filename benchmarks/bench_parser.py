@@ -0,0 +1,75 @@
+# benchmarks/bench_parser.py
+"""
+Compara o parser NumPy (CotahistParser) com o caminho antigo via pd.read_fwf.
+Uso: python -m benchmarks.bench_parser [ARQUIVO] [--tickers N] [--sessoes M]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+root_path = str(Path(__file__).resolve().parent.parent)
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from core.constants import B3Layout
+from services.cotahist_parser import CotahistParser
+from benchmarks.cotahist_sintetico import write_cotahist
+
+def legacy_read_fwf(file_path):
+    """Caminho original do B3ETLProcessor: read_fwf + to_datetime + divisões por coluna."""
+    df = pd.read_fwf(
+        file_path,
+        colspecs=B3Layout.LAYOUT["colspecs"],
+        names=B3Layout.LAYOUT["names"],
+        skiprows=1, skipfooter=1
+    )
+    df['data_pregao'] = pd.to_datetime(df['data_pregao'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+    for col in ['abertura', 'maximo', 'minimo', 'fechamento']:
+        df[col] = df[col] / 100.0
+    return df
+
+def numpy_parser(file_path):
+    parser = CotahistParser()
+    return parser.to_dataframe(parser.parse_file(file_path))
+
+def numpy_parser_raw(file_path):
+    return CotahistParser().parse_file(file_path)
+
+def bench(fn, file_path, repeat: int):
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        fn(file_path)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("arquivo", nargs="?", help="COTAHIST real; se omitido, gera um sintético")
+    ap.add_argument("--tickers", type=int, default=400)
+    ap.add_argument("--sessoes", type=int, default=250)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = args.arquivo or write_cotahist(
+            os.path.join(tmp, "COTAHIST_SINTETICO.TXT"), args.tickers, args.sessoes
+        )
+        tamanho_mb = os.path.getsize(file_path) / 1e6
+        print(f"Arquivo: {file_path} ({tamanho_mb:.1f} MB)")
+
+        for nome, fn in [
+            ("pd.read_fwf (atual)", legacy_read_fwf),
+            ("CotahistParser -> DataFrame", numpy_parser),
+            ("CotahistParser (arrays)", numpy_parser_raw),
+        ]:
+            segundos = bench(fn, file_path, args.repeat)
+            print(f"{nome:<30} {segundos:8.3f} s  {tamanho_mb / segundos:9.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
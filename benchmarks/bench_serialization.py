@@ -0,0 +1,83 @@
+# benchmarks/bench_serialization.py
+"""
+Latência e bytes trafegados de /ativos/{ativo} por formato (registros, colunas, arrow) e compressão.
+A linha "registros (FastAPI)" reproduz a serialização anterior (jsonable_encoder + JSONResponse).
+Uso: python -m benchmarks.bench_serialization [--sessoes N] [--repeticoes N]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+os.environ.setdefault("B3_FILE_PATH", "")
+
+root_path = str(Path(__file__).resolve().parent.parent)
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from api.router import app
+from services.market_service import MarketService
+
+ENCODINGS = ["identity", "gzip", "br"]
+
+def sample_history(sessoes: int) -> pd.DataFrame:
+    """Histórico de um ativo no formato devolvido pelo MarketService (datas ISO, preços em reais)."""
+    rng = np.random.default_rng(42)
+    fechamento = np.round(30 + np.cumsum(rng.normal(0, 0.4, sessoes)).clip(-25, None), 2)
+    return pd.DataFrame({
+        "tipo_registro": 1,
+        "data_pregao": pd.bdate_range("2000-01-03", periods=sessoes).strftime("%Y-%m-%d"),
+        "cod_bdi": "02",
+        "ticker": "PETR4",
+        "nome_empresa": "PETROBRAS",
+        "abertura": fechamento - 0.1, "maximo": fechamento + 0.5, "minimo": fechamento - 0.5,
+        "medio": fechamento, "fechamento": fechamento,
+        "qtd_titulos": rng.integers(1e5, 1e7, sessoes), "volume": rng.integers(1e8, 1e10, sessoes),
+    })
+
+def medir(func, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000, resultado
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--sessoes", type=int, default=6_000, help="Pregões no histórico (~24 anos)")
+    ap.add_argument("--repeticoes", type=int, default=20)
+    args = ap.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    df = sample_history(args.sessoes)
+    client = TestClient(app)
+    print(f"{len(df)} pregões, {len(df.columns)} colunas\n")
+    print(f"{'formato':<22} {'encoding':<9} {'ms (mediana)':>13} {'bytes':>12}")
+
+    ms, resposta = medir(lambda: JSONResponse(jsonable_encoder(df.to_dict(orient="records"))), args.repeticoes)
+    print(f"{'registros (FastAPI)':<22} {'identity':<9} {ms:13.2f} {len(resposta.body):12,}")
+
+    with patch.object(MarketService, "get_history", return_value=df):
+        for formato in ["registros", "colunas", "arrow"]:
+            for encoding in ENCODINGS:
+                headers = {"Accept-Encoding": encoding}
+                ms, resposta = medir(
+                    lambda: client.get(f"/ativos/PETR4?formato={formato}", headers=headers), args.repeticoes
+                )
+                bytes_rede = int(resposta.headers["content-length"])
+                usado = resposta.headers.get("content-encoding", "identity")
+                print(f"{formato:<22} {usado:<9} {ms:13.2f} {bytes_rede:12,}")
+
+if __name__ == "__main__":
+    main()
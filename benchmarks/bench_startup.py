@@ -0,0 +1,128 @@
+# benchmarks/bench_startup.py
+"""
+Tempo de import de api.router (processo novo a cada medida) e tempo até a primeira resposta de um uvicorn:
+até responder em "/", até /pronto (aquecimento concluído) e latência da primeira consulta de histórico e do
+primeiro gráfico de um ativo líquido, com e sem aquecimento (PREWARM_ENABLED).
+Uso: python -m benchmarks.bench_startup [--repeticoes N] [--tickers N] [--sessoes N] [--modulos N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+root_path = str(Path(__file__).resolve().parent.parent)
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+from benchmarks.load_test import popular_banco, porta_livre
+
+IMPORT_SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+import api.router
+print(json.dumps({"segundos": time.perf_counter() - inicio,
+                  "pesados": sorted(m for m in ("matplotlib", "pyarrow", "duckdb") if m in sys.modules)}))
+"""
+
+def medir_import(env: dict, repeticoes: int) -> dict:
+    tempos, pesados = [], []
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=root_path, env=env,
+                               capture_output=True, text=True, check=True).stdout
+        resultado = json.loads(saida.strip().splitlines()[-1])
+        tempos.append(resultado["segundos"])
+        pesados = resultado["pesados"]
+    return {"mediana": statistics.median(tempos), "minimo": min(tempos), "pesados": pesados}
+
+def modulos_mais_lentos(env: dict, quantidade: int) -> list:
+    """Módulos de primeiro nível com maior tempo acumulado de import (python -X importtime)."""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api.router"], cwd=root_path,
+                           env=env, capture_output=True, text=True, check=True).stderr
+    modulos = []
+    for linha in saida.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, acumulado, nome = linha.split("|")
+        if len(nome) - len(nome.lstrip()) <= 3:  # só os importados diretamente por api.router
+            modulos.append((int(acumulado) / 1e6, nome.strip()))
+    return sorted(modulos, reverse=True)[:quantidade]
+
+def aguardar(url: str, processo, status: int = 200, limite: float = 120) -> float:
+    """Instante (perf_counter) em que `url` respondeu com `status`."""
+    import httpx
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("uvicorn encerrou antes de responder")
+        try:
+            if httpx.get(url, timeout=5).status_code == status:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} não respondeu a tempo")
+
+def medir_inicializacao(env: dict, ticker: str) -> dict:
+    import httpx
+    porta = porta_livre()
+    base = f"http://127.0.0.1:{porta}"
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.router:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--log-level", "warning"], cwd=root_path, env=env,
+    )
+    try:
+        vivo = aguardar(f"{base}/", processo) - inicio
+        pronto = aguardar(f"{base}/pronto", processo) - inicio
+        etapas = httpx.get(f"{base}/pronto").json()["etapas"]
+        t = time.perf_counter()
+        httpx.get(f"{base}/ativos/{ticker}", timeout=60).raise_for_status()
+        historico = time.perf_counter() - t
+        t = time.perf_counter()
+        httpx.get(f"{base}/ativos/{ticker}/graficos?largura=640", timeout=60).raise_for_status()
+        grafico = time.perf_counter() - t
+    finally:
+        processo.terminate()
+        processo.wait()
+    return {"vivo": vivo, "pronto": pronto, "historico": historico, "grafico": grafico, "etapas": etapas}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeticoes", type=int, default=5, help="Processos medidos no tempo de import")
+    ap.add_argument("--tickers", type=int, default=100)
+    ap.add_argument("--sessoes", type=int, default=500)
+    ap.add_argument("--modulos", type=int, default=8, help="Módulos mais lentos listados")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, B3_FILE_PATH=os.environ.get("B3_FILE_PATH", ""), PYTHONPATH=root_path,
+                   DB_CONNECTION_STRING=f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+                   MATRIX_PATH=os.path.join(tmp, "matrizes"), STATIC_PATH=os.path.join(tmp, "graficos"),
+                   CHART_PRERENDER_TOP="0", ALLOWED_BDI_CODES="02", MIN_VOLUME_FILTER="0")
+        os.environ.update(env)
+        popular_banco(args.tickers, args.sessoes, tmp)
+
+        from services.market_service import MarketService
+        ticker = MarketService().list_available_tickers(content_limit=1)[0]
+
+        imp = medir_import(env, args.repeticoes)
+        print(f"\nimport api.router: {imp['mediana'] * 1000:.0f} ms (mediana de {args.repeticoes}, "
+              f"mínimo {imp['minimo'] * 1000:.0f} ms); módulos pesados carregados: {imp['pesados'] or 'nenhum'}")
+        for segundos, nome in modulos_mais_lentos(env, args.modulos):
+            print(f"  {segundos * 1000:8.0f} ms  {nome}")
+
+        print(f"\n{'aquecimento':<12} {'vivo ms':>9} {'pronto ms':>10} {'1º histórico ms':>16} {'1º gráfico ms':>14}")
+        for nome, valor in [("desligado", "False"), ("ligado", "True")]:
+            r = medir_inicializacao(dict(env, PREWARM_ENABLED=valor), ticker)
+            print(f"{nome:<12} {r['vivo'] * 1000:9.0f} {r['pronto'] * 1000:10.0f} "
+                  f"{r['historico'] * 1000:16.1f} {r['grafico'] * 1000:14.1f}")
+            if r["etapas"]:
+                print("             " + ", ".join(f"{k} {v['ms']:.0f} ms" for k, v in r["etapas"].items()))
+
+if __name__ == "__main__":
+    main()
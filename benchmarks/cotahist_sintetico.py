@@ -0,0 +1,101 @@
+# benchmarks/cotahist_sintetico.py
+"""Gerador determinístico de arquivos COTAHIST sintéticos (header, cotações e trailer)."""
+import random
+from datetime import date, timedelta
+
+def _num(value: int, width: int) -> str:
+    return str(int(value)).zfill(width)[-width:]
+
+def build_header(ano: int, data_geracao: str) -> str:
+    return f"00COTAHIST.{ano}BOVESPA {data_geracao}".ljust(245)
+
+def build_trailer(ano: int, data_geracao: str, total_registros: int) -> str:
+    return f"99COTAHIST.{ano}BOVESPA {data_geracao}{_num(total_registros, 11)}".ljust(245)
+
+def build_record(data_pregao: str, ticker: str, nome: str, abertura: int, maximo: int,
+                 minimo: int, fechamento: int, qtd: int, volume: int, cod_bdi: str = "02") -> str:
+    """Monta um registro tipo 01. Preços e volume em centavos."""
+    medio = (maximo + minimo) // 2
+    registro = (
+        "01"
+        + data_pregao
+        + cod_bdi
+        + ticker.ljust(12)
+        + "010"
+        + nome.ljust(12)[:12]
+        + "ON".ljust(10)
+        + "   "
+        + "R$  "
+        + _num(abertura, 13) + _num(maximo, 13) + _num(minimo, 13)
+        + _num(medio, 13) + _num(fechamento, 13)
+        + _num(fechamento, 13) + _num(fechamento, 13)
+        + _num(1000, 5)
+        + _num(qtd, 18)
+        + _num(volume, 18)
+        + _num(0, 13)
+        + "0"
+        + "99991231"
+        + "0000001"
+        + _num(0, 13)
+        + f"BR{ticker[:4]}ACNOR0".ljust(12)[:12]
+        + "100"
+    )
+    assert len(registro) == 245
+    return registro
+
+def trading_days(inicio: date, n_sessoes: int) -> list:
+    """Dias úteis (seg-sex) a partir de `inicio`, no formato AAAAMMDD."""
+    dias, atual = [], inicio
+    while len(dias) < n_sessoes:
+        if atual.weekday() < 5:
+            dias.append(atual.strftime("%Y%m%d"))
+        atual += timedelta(days=1)
+    return dias
+
+def generate_lines(n_tickers: int, n_sessoes: int, seed: int = 42, inicio: date = date(2024, 1, 2),
+                   bdi_codes=("02",)) -> list:
+    """Gera as linhas de um COTAHIST com `n_tickers` x `n_sessoes` cotações."""
+    rng = random.Random(seed)
+    dias = trading_days(inicio, n_sessoes)
+    tickers = [f"{chr(65 + i // 676 % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}X{3 + i % 9}" for i in range(n_tickers)]
+    precos = {t: rng.randint(500, 20000) for t in tickers}
+
+    linhas = [build_header(inicio.year, dias[0])]
+    for dia in dias:
+        for i, ticker in enumerate(tickers):
+            anterior = precos[ticker]
+            fechamento = max(1, int(anterior * (1 + rng.gauss(0, 0.02))))
+            abertura = anterior
+            maximo = max(abertura, fechamento) + rng.randint(0, 50)
+            minimo = max(1, min(abertura, fechamento) - rng.randint(0, 50))
+            qtd = rng.randint(1_000, 5_000_000)
+            precos[ticker] = fechamento
+            linhas.append(build_record(
+                dia, ticker, f"EMPRESA {i}", abertura, maximo, minimo, fechamento,
+                qtd, qtd * fechamento, cod_bdi=bdi_codes[i % len(bdi_codes)]
+            ))
+    linhas.append(build_trailer(inicio.year, dias[-1], len(linhas) + 1))
+    return linhas
+
+def write_cotahist(path, n_tickers: int = 50, n_sessoes: int = 250, seed: int = 42, newline: str = "\r\n", **kwargs):
+    """Escreve um COTAHIST sintético em `path` e devolve o caminho."""
+    linhas = generate_lines(n_tickers, n_sessoes, seed=seed, **kwargs)
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        f.write(newline.join(linhas) + newline)
+    return path
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Gera um COTAHIST sintético (N ativos x M pregões).")
+    ap.add_argument("arquivo", help="Caminho do TXT a gerar")
+    ap.add_argument("--tickers", type=int, default=50)
+    ap.add_argument("--sessoes", type=int, default=250)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--bdi", default="02", help="Códigos BDI alternados entre os ativos (ex.: 02,96)")
+    args = ap.parse_args()
+    path = write_cotahist(args.arquivo, args.tickers, args.sessoes, seed=args.seed,
+                          bdi_codes=tuple(args.bdi.split(",")))
+    print(f"{args.tickers * args.sessoes} cotações gravadas em {path}")
+
+if __name__ == "__main__":
+    main()
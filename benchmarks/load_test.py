@@ -0,0 +1,149 @@
+# benchmarks/load_test.py
+"""
+Teste de carga de /ativos/{ativo}: requisições/s e latência com 50 a 500 clientes simultâneos,
+comparando o caminho síncrono anterior (def + pd.read_sql no threadpool) com o assíncrono (aiosqlite/asyncpg).
+Sobe um uvicorn local sobre um banco SQLite sintético (ou usa DB_CONNECTION_STRING com --banco-atual).
+Uso: python -m benchmarks.load_test [--clientes 50,100,250,500] [--requisicoes N] [--tickers N] [--com-cache]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+root_path = str(Path(__file__).resolve().parent.parent)
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+SYNC_PATH = "/_sync/ativos/{ticker}"
+ASYNC_PATH = "/ativos/{ticker}"
+
+def build_app():
+    """App da API com uma rota extra que reproduz o endpoint síncrono anterior (para o "antes")."""
+    from fastapi import Request, HTTPException
+    from api.router import app
+    from api.responses import dataframe_response
+    from services.market_service import MarketService
+
+    def historico_sincrono(ativo: str, request: Request):
+        df = MarketService().get_history(ativo.upper())
+        if df.empty:
+            raise HTTPException(status_code=404)
+        return dataframe_response(df, "registros", request)
+
+    app.add_api_route(SYNC_PATH.replace("{ticker}", "{ativo}"), historico_sincrono, methods=["GET"])
+    return app
+
+def popular_banco(tickers: int, sessoes: int, tmp: str):
+    """Carrega um COTAHIST sintético no banco configurado (importa o projeto só depois do ambiente pronto)."""
+    from benchmarks.cotahist_sintetico import write_cotahist
+    from main import B3ETLProcessor
+    path = write_cotahist(os.path.join(tmp, "COTAHIST_A2024.TXT"), tickers, sessoes)
+    B3ETLProcessor().import_raw_file(path)
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def rodada(base: str, caminho: str, tickers: list, clientes: int, requisicoes: int) -> dict:
+    import httpx
+    latencias, erros = [], 0
+    fila = asyncio.Queue()
+    for i in range(requisicoes):
+        fila.put_nowait(caminho.format(ticker=tickers[i % len(tickers)]))
+
+    async def cliente(http):
+        nonlocal erros
+        while not fila.empty():
+            url = fila.get_nowait()
+            inicio = time.perf_counter()
+            try:
+                resposta = await http.get(url)
+                erros += resposta.status_code != 200
+            except httpx.HTTPError:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(base_url=base, limits=limites, timeout=120) as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(http) for _ in range(clientes)))
+        total = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "rps": requisicoes / total,
+        "p50": statistics.median(latencias) * 1000,
+        "p99": latencias[int(0.99 * (len(latencias) - 1))] * 1000,
+        "erros": erros,
+    }
+
+def aguardar_servidor(base: str, processo, limite: float = 60):
+    import httpx
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("uvicorn encerrou antes de responder")
+        try:
+            if httpx.get(f"{base}/").status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError("uvicorn não respondeu a tempo")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--clientes", default="50,100,250,500", help="Níveis de concorrência")
+    ap.add_argument("--requisicoes", type=int, default=2_000, help="Requisições por rodada")
+    ap.add_argument("--tickers", type=int, default=100)
+    ap.add_argument("--sessoes", type=int, default=500)
+    ap.add_argument("--com-cache", action="store_true", help="Mantém o cache de histórico ligado (padrão: desligado)")
+    ap.add_argument("--banco-atual", action="store_true", help="Usa o DB_CONNECTION_STRING atual em vez do sintético")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, B3_FILE_PATH=os.environ.get("B3_FILE_PATH", ""), PYTHONPATH=root_path)
+        if not args.com_cache:
+            env["TICKER_CACHE_MB"] = "0"
+        if not args.banco_atual:
+            env["DB_CONNECTION_STRING"] = f"sqlite:///{os.path.join(tmp, 'carga.db')}"
+            env["MATRIX_PATH"] = os.path.join(tmp, "matrizes")
+            env["CHART_PRERENDER_TOP"] = "0"
+            env["ALLOWED_BDI_CODES"] = "02"
+            env["MIN_VOLUME_FILTER"] = "0"
+            os.environ.update(env)
+            popular_banco(args.tickers, args.sessoes, tmp)
+
+        from services.market_service import MarketService
+        tickers = MarketService().list_available_tickers()
+        if not tickers:
+            raise SystemExit("Nenhum ativo no banco para o teste de carga.")
+
+        porta = porta_livre()
+        base = f"http://127.0.0.1:{porta}"
+        processo = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "--factory", "benchmarks.load_test:build_app",
+             "--host", "127.0.0.1", "--port", str(porta), "--log-level", "warning"],
+            cwd=root_path, env=env,
+        )
+        try:
+            aguardar_servidor(base, processo)
+            print(f"{len(tickers)} ativos, {args.requisicoes} requisições por rodada, "
+                  f"cache {'ligado' if args.com_cache else 'desligado'}\n")
+            print(f"{'clientes':>8} {'caminho':<22} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'erros':>6}")
+            for clientes in [int(c) for c in args.clientes.split(",")]:
+                for nome, caminho in [("síncrono (anterior)", SYNC_PATH), ("assíncrono", ASYNC_PATH)]:
+                    r = asyncio.run(rodada(base, caminho, tickers, clientes, args.requisicoes))
+                    print(f"{clientes:>8} {nome:<22} {r['rps']:9.1f} {r['p50']:9.1f} {r['p99']:9.1f} {r['erros']:6}")
+        finally:
+            processo.terminate()
+            processo.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# benchmarks/suite.py
+"""
+Suíte de benchmarks ponta a ponta sobre um COTAHIST sintético (N ativos x M pregões): vazão do ETL,
+carga via save_to_cache, latência (p50/p95/p99) de get_ticker_data e get_metrics e dos endpoints de
+histórico e gráficos pela aplicação ASGI. O resultado sai em JSON e pode ser comparado com uma linha de base.
+Uso: python -m benchmarks.suite [--tickers N] [--sessoes M] [--repeticoes N] [--saida resultado.json]
+                                [--baseline base.json [--gravar-baseline]] [--tolerancia 0.2]
+Sai com código 1 se alguma medida piorar além da tolerância em relação à linha de base.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+root_path = str(Path(__file__).resolve().parent.parent)
+if root_path not in sys.path:
+    sys.path.append(root_path)
+
+# Métricas comparadas com a linha de base: -1 = menor é melhor, +1 = maior é melhor
+METRICAS = {"p50_ms": -1, "p95_ms": -1, "p99_ms": -1, "linhas_s": 1}
+
+def percentis(tempos: list) -> dict:
+    import numpy as np
+    ms = np.asarray(tempos) * 1000
+    return {
+        "n": len(ms),
+        "media_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+def latencia(func, argumentos: list, repeticoes: int) -> dict:
+    """Chama `func` `repeticoes` vezes, alternando os argumentos (antes, uma chamada de aquecimento por argumento)."""
+    for argumento in argumentos:
+        func(argumento)
+    tempos = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        func(argumentos[i % len(argumentos)])
+        tempos.append(time.perf_counter() - inicio)
+    return percentis(tempos)
+
+def vazao(segundos: float, linhas: int) -> dict:
+    return {"segundos": round(segundos, 4), "linhas": linhas, "linhas_s": round(linhas / segundos, 1)}
+
+def bench_etl(path) -> dict:
+    """ETL completo (parser, gravação, índices e etapas pós-carga), em registros gravados por segundo."""
+    from main import B3ETLProcessor
+    inicio = time.perf_counter()
+    gravados = B3ETLProcessor().import_raw_file(path)
+    return vazao(time.perf_counter() - inicio, gravados)
+
+def bench_save_to_cache(path, tabela: str = "bench_cotacoes") -> dict:
+    """Só a carga no banco: o arquivo já convertido em DataFrame, gravado por db_manager.save_to_cache."""
+    from core.database import db_manager
+    from services.cotahist_parser import CotahistParser
+    parser = CotahistParser()
+    df = parser.to_dataframe(parser.parse_file(path))
+    inicio = time.perf_counter()
+    db_manager.save_to_cache(df, tabela, if_exists='replace')
+    resultado = vazao(time.perf_counter() - inicio, len(df))
+    db_manager.execute_raw(f"DROP TABLE IF EXISTS {tabela}")
+    return resultado
+
+def bench_servicos(tickers: list, repeticoes: int) -> dict:
+    from unittest.mock import patch
+    from services.market_service import MarketService
+    from services.analysis_service import AnalysisService
+    from services.ticker_cache import ticker_cache
+    from core.config import settings
+    service = MarketService()
+    resultados = {}
+    with patch.object(settings, "SNAPSHOT_ENABLED", False):
+        with patch.object(ticker_cache, "max_bytes", 0):
+            resultados["get_ticker_data_banco"] = latencia(service.get_ticker_data, tickers, repeticoes)
+        resultados["get_ticker_data_cache"] = latencia(service.get_ticker_data, tickers, repeticoes)
+    resultados["get_ticker_data_snapshot"] = latencia(service.get_ticker_data, tickers, repeticoes)
+    resultados["get_metrics"] = latencia(AnalysisService().get_metrics, tickers, repeticoes)
+    return resultados
+
+def bench_api(tickers: list, repeticoes: int) -> dict:
+    """Endpoints pela aplicação ASGI (TestClient): sem rede, mas com roteamento, validação e serialização."""
+    from fastapi.testclient import TestClient
+    from api.router import app
+    client = TestClient(app)
+
+    def get(url):
+        resposta = client.get(url)
+        if resposta.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {resposta.status_code}")
+
+    larguras = iter(range(400, 400 + 10 * repeticoes))
+    lote = ",".join(tickers)
+    return {
+        "api_historico": latencia(lambda t: get(f"/ativos/{t}"), tickers, repeticoes),
+        # Todos os ativos da amostra: uma requisição em lote contra uma requisição por ativo
+        "api_lote": latencia(lambda t: get(f"/ativos/lote?tickers={t}&campos=fechamento,volume"), [lote],
+                             max(5, repeticoes // 4)),
+        "api_historico_por_ativo": latencia(
+            lambda t: [get(f"/ativos/{a}?campos=fechamento,volume") for a in t.split(",")], [lote],
+            max(5, repeticoes // 4),
+        ),
+        "api_historico_colunas": latencia(lambda t: get(f"/ativos/{t}?formato=colunas"), tickers, repeticoes),
+        "api_grafico_cache": latencia(lambda t: get(f"/ativos/{t}/graficos"), tickers, repeticoes),
+        # Largura diferente a cada chamada: sempre fora do cache, mede a renderização
+        "api_grafico_render": latencia(
+            lambda t: get(f"/ativos/{t}/graficos?largura={next(larguras)}"), tickers, max(5, repeticoes // 4)
+        ),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root_path,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_suite(tickers: int, sessoes: int, tmp: str, repeticoes: int = 50) -> dict:
+    """Gera o COTAHIST, carrega no banco configurado (db_manager) e mede todas as etapas."""
+    from benchmarks.cotahist_sintetico import write_cotahist
+    from services.market_service import MarketService
+    path = write_cotahist(os.path.join(tmp, "COTAHIST_A2024.TXT"), tickers, sessoes)
+
+    resultados = {"etl": bench_etl(path), "save_to_cache": bench_save_to_cache(path)}
+    amostra = MarketService().list_available_tickers(content_limit=20)
+    if not amostra:
+        raise RuntimeError("Nenhum ativo carregado: confira ALLOWED_BDI_CODES e MIN_VOLUME_FILTER.")
+    resultados.update(bench_servicos(amostra, repeticoes))
+    resultados.update(bench_api(amostra, repeticoes))
+
+    return {
+        "meta": {
+            "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "tickers": tickers,
+            "sessoes": sessoes,
+            "repeticoes": repeticoes,
+        },
+        "resultados": resultados,
+    }
+
+def comparar(atual: dict, base: dict, tolerancia: float = 0.2) -> list:
+    """
+    Variação de cada métrica comparável (latências e linhas/s) em relação à linha de base.
+    `regressao` indica piora acima da tolerância (0.2 = 20%), já considerando o sentido da métrica.
+    """
+    linhas = []
+    for medida, valores in atual["resultados"].items():
+        anterior = base.get("resultados", {}).get(medida, {})
+        for metrica, sentido in METRICAS.items():
+            if metrica not in valores or not anterior.get(metrica):
+                continue
+            variacao = valores[metrica] / anterior[metrica] - 1
+            linhas.append({
+                "medida": medida, "metrica": metrica, "atual": valores[metrica], "base": anterior[metrica],
+                "variacao": round(variacao, 4), "regressao": -sentido * variacao > tolerancia,
+            })
+    return linhas
+
+def imprimir(resultado: dict, comparacao: list = None):
+    meta = resultado["meta"]
+    print(f"\n{meta['tickers']} ativos x {meta['sessoes']} pregões, commit {meta['commit']}, {meta['cpus']} CPUs\n")
+    print(f"{'medida':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'linhas/s':>12}")
+    for medida, v in resultado["resultados"].items():
+        colunas = [f"{v[m]:9.2f}" if m in v else f"{'-':>9}" for m in ["p50_ms", "p95_ms", "p99_ms"]]
+        linhas_s = f"{v['linhas_s']:12,.0f}" if "linhas_s" in v else f"{'-':>12}"
+        print(f"{medida:<24} {' '.join(colunas)} {linhas_s}")
+    if comparacao:
+        print(f"\n{'medida':<24} {'métrica':<9} {'base':>12} {'atual':>12} {'variação':>9}")
+        for c in comparacao:
+            alerta = "  << regressão" if c["regressao"] else ""
+            print(f"{c['medida']:<24} {c['metrica']:<9} {c['base']:12,.2f} {c['atual']:12,.2f} "
+                  f"{c['variacao']:+9.1%}{alerta}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tickers", type=int, default=200)
+    ap.add_argument("--sessoes", type=int, default=500)
+    ap.add_argument("--repeticoes", type=int, default=50, help="Chamadas por medida de latência")
+    ap.add_argument("--saida", default="bench_resultado.json", help="JSON com o resultado desta execução")
+    ap.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    ap.add_argument("--gravar-baseline", action="store_true", help="Grava esta execução como a linha de base")
+    ap.add_argument("--tolerancia", type=float, default=0.2, help="Piora aceita antes de acusar regressão")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Banco, matriz e gráficos isolados; o projeto só é importado depois do ambiente pronto
+        os.environ.update({
+            "B3_FILE_PATH": os.environ.get("B3_FILE_PATH", ""),
+            "DB_CONNECTION_STRING": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            "MATRIX_PATH": os.path.join(tmp, "matrizes"),
+            "STATIC_PATH": os.path.join(tmp, "graficos"),
+            "CHART_PRERENDER_TOP": "0",
+            "ALLOWED_BDI_CODES": "02",
+            "MIN_VOLUME_FILTER": "0",
+        })
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        resultado = run_suite(args.tickers, args.sessoes, tmp, args.repeticoes)
+
+        from services.chart_renderer import chart_renderer
+        chart_renderer.shutdown()
+
+    comparacao = None
+    if args.baseline and os.path.exists(args.baseline) and not args.gravar_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            comparacao = comparar(resultado, json.load(f), args.tolerancia)
+        resultado["comparacao"] = {"baseline": args.baseline, "tolerancia": args.tolerancia, "metricas": comparacao}
+
+    for destino in [args.saida] + ([args.baseline] if args.baseline and args.gravar_baseline else []):
+        with open(destino, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    imprimir(resultado, comparacao)
+    print(f"\nResultado gravado em {args.saida}")
+
+    if comparacao and any(c["regressao"] for c in comparacao):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
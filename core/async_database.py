@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from .config import settings
+from .database import db_manager, pool_options
+from .instrumentation import observe_query
+
+logger = logging.getLogger(__name__)
+
+# Drivers assíncronos equivalentes aos síncronos da DB_CONNECTION_STRING
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+@lru_cache(maxsize=512)
+def _statement(query: str):
+    """text() reaproveitado por consulta: a forma compilada fica no cache de compilação do SQLAlchemy."""
+    return text(query)
+
+def async_url(url):
+    """URL síncrona (sqlite://, postgresql[+psycopg2]://) convertida para o driver assíncrono."""
+    url = make_url(str(url)) if not hasattr(url, "drivername") else url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Sem driver assíncrono para o banco '{backend}'.")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+class AsyncDatabaseManager:
+    """
+    Caminho de leitura assíncrono da API (SQLAlchemy async com aiosqlite/asyncpg).
+    Espelha a URL do engine síncrono do db_manager: um engine assíncrono por URL, criado na primeira
+    consulta, com pool configurável e cache de prepared statements do driver.
+    No backend Parquet (sem engine SQLAlchemy) ou sem o driver assíncrono instalado,
+    a consulta síncrona roda numa thread.
+    """
+
+    def __init__(self, sync_manager=None):
+        self._sync = sync_manager
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sync_manager(self):
+        # Resolvido a cada uso: testes e scripts podem trocar o engine do db_manager
+        return self._sync or db_manager
+
+    def _engine(self):
+        sync_engine = getattr(self.sync_manager, "engine", None)
+        if sync_engine is None:
+            return None
+        chave = sync_engine.url.render_as_string(hide_password=True)
+        with self._lock:
+            if chave not in self._engines:
+                try:
+                    self._engines[chave] = self._create_engine(sync_engine.url)
+                except (ImportError, ValueError) as e:
+                    # Driver assíncrono ausente (aiosqlite/asyncpg/greenlet) ou banco sem driver: usa o síncrono
+                    logger.warning(f"Leitura assíncrona indisponível ({e}); usando o engine síncrono numa thread")
+                    self._engines[chave] = None
+            return self._engines[chave]
+
+    @staticmethod
+    def _create_engine(url):
+        from sqlalchemy.ext.asyncio import create_async_engine
+        url = async_url(url)
+        if url.get_backend_name() == "sqlite":
+            # Cache de statements preparados do sqlite3 (por conexão)
+            connect_args = {"check_same_thread": False, "cached_statements": settings.DB_STATEMENT_CACHE}
+        else:
+            connect_args = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE}
+        return create_async_engine(url, connect_args=connect_args, **pool_options(url))
+
+    async def get_from_cache(self, query: str, params: dict = None) -> pd.DataFrame:
+        """Versão assíncrona de db_manager.get_from_cache (mesmo contrato: DataFrame vazio em caso de erro)."""
+        engine = self._engine()
+        if engine is None:
+            return await asyncio.to_thread(self.sync_manager.get_from_cache, query, params)
+        inicio = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                result = await conn.execute(_statement(query), params or {})
+                colunas = list(result.keys())
+                linhas = result.fetchall()
+        except Exception as e:
+            logger.error(f"Erro ao ler cache (async): {e}")
+            return pd.DataFrame()
+        observe_query(query, time.perf_counter() - inicio, len(linhas))
+        return pd.DataFrame.from_records(linhas, columns=colunas)
+
+    def pool_status(self) -> dict:
+        """Situação de cada pool (conexões em uso, livres e em overflow)."""
+        with self._lock:
+            return {url: engine.pool.status() for url, engine in self._engines.items() if engine is not None}
+
+    async def dispose(self):
+        with self._lock:
+            engines, self._engines = list(self._engines.values()), {}
+        for engine in engines:
+            if engine is not None:
+                await engine.dispose()
+
+# Instância única (os engines são criados sob demanda)
+async_db_manager = AsyncDatabaseManager()
@@ -1,3 +1,4 @@
+import logging
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,17 +14,76 @@ class Config:
     
     # --- BANCO DE DADOS ---
     DB_URL = os.getenv("DB_CONNECTION_STRING", "sqlite:///database/b3_cotacoes.db")
+    # Pool de conexões (engine síncrono do ETL e engine assíncrono da API)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # Statements preparados mantidos por conexão (sqlite3 / asyncpg)
+    DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))
     
     # --- ARQUIVOS E PASTAS ---
-    # Define onde os gráficos serão salvos fisicamente (caso use Matplotlib no servidor)
+    # Cache em disco dos gráficos renderizados pelo Matplotlib (uma pasta por versão dos dados)
     STATIC_DIR = BASE_DIR / os.getenv("STATIC_PATH", "static/charts")
+    # Matrizes densas geradas pelo ETL (retornos diários, lidas via memory-map)
+    MATRIX_DIR = BASE_DIR / os.getenv("MATRIX_PATH", "database/matrizes")
+    # Snapshot binário do histórico (memory-map compartilhado entre os workers da API)
+    SNAPSHOT_DIR = BASE_DIR / os.getenv("SNAPSHOT_PATH", "database/snapshot")
+    SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "True").lower() == "true"
     B3_DATA_FILE = os.getenv("B3_FILE_PATH")
+    # CSV local de eventos corporativos usado no ajuste de preços
+    CORPORATE_ACTIONS_FILE = BASE_DIR / os.getenv("CORPORATE_ACTIONS_PATH", "dados/eventos_corporativos.csv")
+
+    # --- ETL ---
+    # Teto de memória do ETL em streaming; o tamanho do bloco é derivado dele
+    ETL_MEMORY_LIMIT_MB = int(os.getenv("ETL_MEMORY_LIMIT_MB", 256))
+    # Força um tamanho de bloco (em registros); 0 = calcula pelo teto de memória
+    ETL_CHUNK_RECORDS = int(os.getenv("ETL_CHUNK_RECORDS", 0))
+    # Processos usados no backfill (0 = todos os núcleos)
+    ETL_WORKERS = int(os.getenv("ETL_WORKERS", 0))
     
+    # --- CACHE EM MEMÓRIA ---
+    # Orçamento do cache de histórico por ticker (MB); 0 desliga o cache
+    TICKER_CACHE_MB = int(os.getenv("TICKER_CACHE_MB", 64))
+    # Intervalo mínimo entre consultas à versão dos dados publicada pelo ETL (segundos)
+    DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", 1.0))
+    # Resultados de indicadores guardados (por ticker, indicador, parâmetros e versão)
+    INDICATOR_CACHE_ITEMS = int(os.getenv("INDICATOR_CACHE_ITEMS", 2048))
+    # Gráficos renderizados mantidos em memória (MB); o nível em disco fica em STATIC_DIR
+    CHART_CACHE_MB = int(os.getenv("CHART_CACHE_MB", 32))
+    # Ativos mais líquidos cujos gráficos o ETL renderiza antecipadamente (0 desliga)
+    CHART_PRERENDER_TOP = int(os.getenv("CHART_PRERENDER_TOP", 20))
+
+    # --- RENDERIZAÇÃO DE GRÁFICOS ---
+    # Processos dedicados ao Matplotlib (0 = renderiza na thread da requisição)
+    CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", 2))
+    # Renderizações aceitas ao mesmo tempo (em execução + na fila); acima disso a API responde 503
+    CHART_RENDER_QUEUE = int(os.getenv("CHART_RENDER_QUEUE", 8))
+    # Tempo máximo de espera por uma renderização (segundos)
+    CHART_RENDER_TIMEOUT = float(os.getenv("CHART_RENDER_TIMEOUT", 30))
+
     # --- API ---
     HOST = os.getenv("API_HOST", "0.0.0.0")
     PORT = int(os.getenv("API_PORT", 8000))
     DEBUG = os.getenv("DEBUG_MODE", "False").lower() == "true"
 
+    # Nível de log das aplicações (ETL e API), configurado na inicialização e não no import
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+    # --- AQUECIMENTO DA API ---
+    # Carrega o universo de ativos, o histórico dos mais líquidos e a renderização antes de declarar prontidão
+    PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "True").lower() == "true"
+    # Ativos mais líquidos com histórico carregado no cache de memória durante o aquecimento
+    PREWARM_TICKERS = int(os.getenv("PREWARM_TICKERS", 20))
+
+    # --- INSTRUMENTAÇÃO ---
+    # Profiler por amostragem disparado pelo cabeçalho X-Profile (desligado por padrão)
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+    # Só guarda o perfil de requisições que levarem ao menos isso (ms)
+    PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 200))
+    # Intervalo entre amostras das pilhas (ms)
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
     @classmethod
     def setup_directories(cls):
         """Cria as pastas necessárias ao iniciar o app."""
@@ -32,6 +92,13 @@ class Config:
         if "sqlite" in cls.DB_URL:
             db_path = Path(cls.DB_URL.replace("sqlite:///", "")).parent
             db_path.mkdir(parents=True, exist_ok=True)
+        # Backend Parquet: a URL aponta para o diretório raiz do dataset
+        elif cls.DB_URL.startswith("parquet://"):
+            Path(cls.DB_URL.replace("parquet:///", "")).mkdir(parents=True, exist_ok=True)
 
 # Instância global
-settings = Config()
\ No newline at end of file
+settings = Config()
+
+def setup_logging(level: str = None):
+    """Configura o logging raiz (chamado pelos pontos de entrada, nunca no import de um módulo)."""
+    logging.basicConfig(level=level or settings.LOG_LEVEL)
\ No newline at end of file
@@ -33,10 +33,56 @@ class B3Layout:
         ]
     }
 
+    # Cada registro tem 245 posições, seguido de quebra de linha (LF ou CRLF)
+    RECORD_LENGTH = 245
+
+    # Tipos de registro: 00 (header), 01 (cotação) e 99 (trailer)
+    TIPO_HEADER = "00"
+    TIPO_COTACAO = "01"
+    TIPO_TRAILER = "99"
+
+    # Campos de preço chegam com 2 casas decimais implícitas (centavos)
+    PRICE_COLUMNS = ["abertura", "maximo", "minimo", "medio", "fechamento"]
+
+    # Campos alfanuméricos; os demais são numéricos sem sinal
+    TEXT_COLUMNS = ["cod_bdi", "ticker", "nome_empresa"]
+
+    # Codificação dos arquivos distribuídos pela B3
+    ENCODING = "latin-1"
+
 class CacheConstants:
     """Nomes de tabelas para persistência no banco."""
     TABLE_HISTORICO = "cotacoes_historicas"
     TABLE_METRICS = "metricas_ativos"
+    TABLE_MANIFEST = "etl_manifest"
+    TABLE_SCHEMA_VERSION = "schema_versao"
+    TABLE_DATA_VERSION = "versao_dados"
+    TABLE_ADJUSTMENTS = "ajustes_aplicados"
+    TABLE_TICKERS = "dim_ativos"
+
+    # Chave natural de uma cotação: um pregão por ticker e código BDI
+    HISTORICO_KEY = ["data_pregao", "ticker", "cod_bdi"]
+    # Métricas pré-calculadas: uma linha por ticker e versão dos dados
+    METRICS_KEY = ["ticker", "versao"]
+    # Dimensão de ativos: uma linha por ticker (a versão só serve para descartar os que saíram)
+    TICKERS_KEY = ["ticker"]
+
+class AdjustmentConfig:
+    """Ajuste de preços por eventos corporativos (proventos, desdobramentos e grupamentos)."""
+    # Preço bruto -> coluna ajustada gravada ao lado (float, em centavos como o bruto)
+    ADJUSTED_COLUMNS = {
+        "abertura": "abertura_aj",
+        "maximo": "maximo_aj",
+        "minimo": "minimo_aj",
+        "medio": "medio_aj",
+        "fechamento": "fechamento_aj",
+    }
+    FACTOR_COLUMN = "fator_ajuste"
+    # Colunas do CSV: ticker, data_ex (AAAA-MM-DD), tipo, valor
+    # desdobramento/grupamento: proporção (2 = 1 vira 2 / 2 viram 1); bonificacao: fração (0.1 = 10%);
+    # dividendo/jcp: valor em reais por ação
+    EVENT_TYPES = ("dividendo", "jcp", "desdobramento", "grupamento", "bonificacao")
+    CSV_COLUMNS = ["ticker", "data_ex", "tipo", "valor"]
 
 class ChartConfig:
     """Identidade visual dos gráficos (Matplotlib e Front-end)."""
@@ -52,8 +98,107 @@ class ChartConfig:
         "volume": "Volume de Negociação"
     }
 
+    # Formatos de imagem servidos (e guardados no cache de gráficos renderizados)
+    FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+    DPI = 100
+    DEFAULT_WIDTH = 1000   # px (10 x 5 polegadas a 100 dpi)
+    DEFAULT_HEIGHT = 500
+    # Pregões recentes usados para escolher os ativos mais líquidos na pré-renderização
+    PRERENDER_SESSIONS = 21
+    # Sugestão de espera (segundos) enviada no Retry-After quando a fila de renderização está cheia
+    RETRY_AFTER = 2
+
+class SamplingConfig:
+    """Redução de pontos das séries históricas (API e gráficos)."""
+    MODES = ("lttb", "ohlc")
+    SERIES = ("abertura", "maximo", "minimo", "medio", "fechamento", "volume")
+    # Largura útil do gráfico renderizado no servidor (10 polegadas a 100 dpi)
+    CHART_MAX_POINTS = 1000
+
+class ResponseConfig:
+    """Formatos de resposta do histórico e compressão negociada."""
+    FORMATS = ("registros", "colunas", "arrow")
+    # Campos do histórico que podem ser pedidos em `campos` (a data sempre vem)
+    FIELDS = ("ticker", "cod_bdi", "tipo_registro", "nome_empresa", "abertura", "maximo", "minimo", "medio",
+              "fechamento", "qtd_titulos", "volume")
+    # Teto de `ultimos` (pregões mais recentes)
+    MAX_LAST_SESSIONS = 100_000
+    # Abaixo disso a compressão custa mais do que economiza
+    MIN_COMPRESS_BYTES = 1024
+    GZIP_LEVEL = 5
+    BROTLI_QUALITY = 4
+
+class BatchConfig:
+    """Histórico de vários ativos numa requisição (/ativos/lote), alinhado por data."""
+    MAX_TICKERS = 50
+    # Só campos numéricos: cada campo vira uma matriz data x ativo (NaN/null onde o ativo não negociou)
+    FIELDS = ("abertura", "maximo", "minimo", "medio", "fechamento", "qtd_titulos", "volume")
+    DEFAULT_FIELDS = ("fechamento",)
+    # colunas: uma série por ativo e campo; matriz: por campo, uma linha por data e uma coluna por ativo
+    LAYOUTS = ("colunas", "matriz")
+
+class IndicatorConfig:
+    """Indicadores técnicos disponíveis e janela padrão (em pregões)."""
+    ALLOWED_TYPES = {
+        "sma": "Média Móvel Simples",
+        "ema": "Média Móvel Exponencial",
+        "rsi": "Índice de Força Relativa (Wilder)",
+        "bollinger": "Bandas de Bollinger",
+        "atr": "Average True Range (Wilder)",
+        "volatilidade": "Volatilidade Móvel Anualizada",
+        "drawdown": "Drawdown a partir da Máxima",
+    }
+    DEFAULT_WINDOW = 20
+    BOLLINGER_STD = 2.0
+    TRADING_DAYS = 252
+
+class TickerIndexConfig:
+    """Universo de ativos (dim_ativos) e busca por prefixo."""
+    # Pregões recentes usados no volume médio diário (ranking de liquidez)
+    LIQUIDITY_SESSIONS = 63
+    SEARCH_LIMIT = 10
+    MAX_SEARCH_LIMIT = 100
+    # Abaixo disto a busca também aceita erros de digitação (difflib)
+    FUZZY_CUTOFF = 0.75
+
+class SnapshotConfig:
+    """Snapshot binário (memory-map) do histórico, publicado pelo ETL e lido por todos os workers da API."""
+    # Cabeçalho: assinatura + tamanho do JSON de layout (uint64, little-endian)
+    MAGIC = b"B3SNAP01"
+    # Início de cada array alinhado (leitura vetorizada sem desalinhamento)
+    ALIGNMENT = 64
+    # Tickers lidos do banco por consulta ao montar o arquivo (memória limitada ao lote)
+    BATCH_TICKERS = 200
+    POINTER = "snapshot.json"
+
+class ScreenerConfig:
+    """Métricas transversais do screener e parâmetros padrão."""
+    SORT_FIELDS = [
+        "retorno", "volume_medio", "volatilidade", "ultimo_fechamento",
+        "distancia_maxima", "distancia_minima", "sessoes",
+    ]
+    DEFAULT_WINDOW = 30
+    DEFAULT_LIMIT = 20
+    # Período carregado na matriz data x ticker (datas AAAAMMDD: 10000 = um ano)
+    LOOKBACK = 10000
+
+class CorrelationConfig:
+    """Parâmetros da correlação entre ativos (janelas em pregões)."""
+    DEFAULT_WINDOW = 60
+    DEFAULT_POINTS = 252
+    # O modo móvel devolve uma série por par: limita o número de ativos
+    MAX_ROLLING_TICKERS = 10
+    MIN_OBSERVATIONS = 3
+    MODES = ("matriz", "movel")
+
 class ErrorMessages:
     INTERNAL_ERROR = "Erro interno no servidor de dados."
+    ROLLING_TICKERS = f"O modo móvel exige entre 2 e {CorrelationConfig.MAX_ROLLING_TICKERS} ativos."
+    MATRIX_UNAVAILABLE = "Matriz de retornos ainda não gerada. Execute o ETL."
+    RENDERER_BUSY = "Muitos gráficos sendo gerados no momento. Tente novamente em instantes."
+    ARROW_UNAVAILABLE = "Formato arrow indisponível neste servidor (pyarrow não instalado)."
+    BATCH_SIZE = f"Informe entre 1 e {BatchConfig.MAX_TICKERS} ativos em `tickers`."
+    PROFILE_NOT_FOUND = "Perfil não encontrado (requisição abaixo do limite ou já descartado)."
     
     @staticmethod
     def NOT_FOUND(ticker: str) -> str:
@@ -61,4 +206,44 @@ class ErrorMessages:
 
     @staticmethod
     def INVALID_TYPE(received: str) -> str:
-        return f"Tipo de gráfico '{received}' é inválido. Use: fechamento, abertura ou volume."
\ No newline at end of file
+        return f"Tipo de gráfico '{received}' é inválido. Use: fechamento, abertura ou volume."
+
+    @staticmethod
+    def INVALID_CHART_FORMAT(received: str) -> str:
+        return f"Formato de imagem '{received}' é inválido. Use: {', '.join(ChartConfig.FORMATS)}."
+
+    @staticmethod
+    def INVALID_INDICATOR(received: str) -> str:
+        return f"Indicador '{received}' é inválido. Use: {', '.join(IndicatorConfig.ALLOWED_TYPES)}."
+
+    @staticmethod
+    def INVALID_FORMAT(received: str) -> str:
+        return f"Formato '{received}' é inválido. Use: {', '.join(ResponseConfig.FORMATS)}."
+
+    @staticmethod
+    def INVALID_FIELDS(received) -> str:
+        return f"Campos inválidos: {', '.join(received)}. Use: {', '.join(ResponseConfig.FIELDS)}."
+
+    @staticmethod
+    def INVALID_BATCH_FIELDS(received) -> str:
+        return f"Campos inválidos: {', '.join(received)}. Use: {', '.join(BatchConfig.FIELDS)}."
+
+    @staticmethod
+    def INVALID_LAYOUT(received: str) -> str:
+        return f"Layout '{received}' é inválido. Use: {', '.join(BatchConfig.LAYOUTS)}."
+
+    @staticmethod
+    def INVALID_SAMPLING(received: str) -> str:
+        return f"Amostragem '{received}' é inválida. Use: {', '.join(SamplingConfig.MODES)}."
+
+    @staticmethod
+    def INVALID_SERIES(received: str) -> str:
+        return f"Série '{received}' é inválida. Use: {', '.join(SamplingConfig.SERIES)}."
+
+    @staticmethod
+    def INVALID_MODE(received: str) -> str:
+        return f"Modo '{received}' é inválido. Use: {', '.join(CorrelationConfig.MODES)}."
+
+    @staticmethod
+    def INVALID_SORT(received: str) -> str:
+        return f"Campo de ordenação '{received}' é inválido. Use: {', '.join(ScreenerConfig.SORT_FIELDS)}."
\ No newline at end of file
@@ -1,64 +1,246 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
 import pandas as pd
+import io
 import logging
+import time
 from .config import settings
 from .constants import CacheConstants
+from .schema import SchemaManager, metadata
+from .instrumentation import observe_query
 
-# Configuração de Logging para monitorar operações de banco
-logging.basicConfig(level=logging.INFO)
+# O nível e o formato são definidos pelos pontos de entrada (setup_logging), não no import
 logger = logging.getLogger(__name__)
 
+def pool_options(url) -> dict:
+    """Tamanho do pool, overflow e reciclagem de conexões (SQLite em memória usa conexão única)."""
+    url = make_url(str(url))
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
 class DatabaseManager:
     """
     Gerencia a conexão com o banco de dados e operações de persistência (Cache).
     """
-    def __init__(self):
+    # Pragmas do SQLite relaxados apenas durante a carga em massa
+    SQLITE_BULK_PRAGMAS = {"synchronous": "OFF", "journal_mode": "MEMORY", "temp_store": "MEMORY"}
+
+    def __init__(self, url: str = None):
+        url = url or settings.DB_URL
         self.engine = create_engine(
-            settings.DB_URL, 
-            connect_args={"check_same_thread": False} if "sqlite" in settings.DB_URL else {}
+            url, 
+            connect_args={"check_same_thread": False} if "sqlite" in url else {},
+            **pool_options(url)
         )
         self.session_factory = sessionmaker(bind=self.engine)
-        self.Session = scoped_session(self.session_factory)
+
+    @property
+    def schema(self) -> SchemaManager:
+        """Schema versionado (migrações e índices) sobre o engine atual."""
+        return SchemaManager(self.engine)
 
     def get_session(self):
         """Retorna uma nova sessão de banco de dados."""
-        return self.Session()
+        return self.session_factory()
 
-    def save_to_cache(self, df: pd.DataFrame, table_name: str, if_exists: str = 'replace'):
+    def save_to_cache(self, df: pd.DataFrame, table_name: str, if_exists: str = 'append'):
         """
-        Salva um DataFrame no banco de dados como cache.
+        Salva um DataFrame no banco de dados como cache (via carga em massa).
+        Por padrão acrescenta linhas; 'replace' numa tabela do schema só a esvazia (tipos e índices ficam).
         """
         try:
             if df is None or df.empty:
                 return False
-            
-            df.to_sql(
-                name=table_name, 
-                con=self.engine, 
-                if_exists=if_exists, 
-                index=True
-            )
+
+            self.bulk_save(df, table_name, if_exists=if_exists)
             logger.info(f"Cache atualizado na tabela: {table_name}")
             return True
         except Exception as e:
             logger.error(f"Erro ao salvar cache em {table_name}: {e}")
             return False
 
+    def bulk_save(self, df: pd.DataFrame, table_name: str, if_exists: str = 'append'):
+        """
+        Carga em massa com caminho rápido por backend:
+        PostgreSQL usa COPY FROM STDIN e SQLite usa executemany numa única transação com pragmas relaxados.
+        Em qualquer falha do caminho rápido, cai para o df.to_sql padrão.
+        """
+        gerenciada = table_name in metadata.tables and if_exists in ("append", "replace")
+        if gerenciada:
+            # Tabela do schema versionado: o pandas nunca a cria nem recria (perderia tipos e índices)
+            metadata.create_all(self.engine, tables=[metadata.tables[table_name]])
+            if if_exists == "replace":
+                self.schema.reset_table(table_name)
+        else:
+            # Cria (ou recria) a tabela sem linhas; se ela já existe e o modo é append, não faz nada
+            df.head(0).to_sql(name=table_name, con=self.engine, if_exists=if_exists, index=False)
+
+        gravados = self._bulk_load(df, table_name)
+        if gerenciada and if_exists == "replace":
+            self.schema.create_indexes(table_name)
+        return gravados
+
+    def _bulk_load(self, df: pd.DataFrame, table_name: str) -> int:
+        """Insere as linhas numa tabela existente pelo caminho rápido do backend, com to_sql de reserva."""
+        dialect = self.engine.dialect.name
+        try:
+            if dialect == "postgresql":
+                return self._bulk_postgres(df, table_name)
+            if dialect == "sqlite":
+                return self._bulk_sqlite(df, table_name)
+        except Exception as e:
+            logger.warning(f"Carga rápida indisponível em {table_name} ({e}); usando to_sql")
+
+        df.to_sql(name=table_name, con=self.engine, if_exists='append', index=False,
+                  chunksize=50_000, method='multi' if dialect == "postgresql" else None)
+        return len(df)
+
+    def _bulk_postgres(self, df: pd.DataFrame, table_name: str) -> int:
+        """COPY FROM STDIN a partir de um buffer CSV em memória."""
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+
+        cols = ", ".join(f'"{c}"' for c in df.columns)
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.copy_expert(f'COPY "{table_name}" ({cols}) FROM STDIN WITH (FORMAT csv)', buf)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        return len(df)
+
+    def _bulk_sqlite(self, df: pd.DataFrame, table_name: str) -> int:
+        """executemany numa única transação, com synchronous/journal relaxados durante a carga."""
+        cols = ", ".join(f'"{c}"' for c in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        rows = zip(*(self._native_column(df[c]) for c in df.columns))
+
+        raw = self.engine.raw_connection()
+        cur = raw.cursor()
+        anteriores = {p: cur.execute(f"PRAGMA {p}").fetchone()[0] for p in self.SQLITE_BULK_PRAGMAS}
+        # Em WAL o journal já é eficiente e trocar de modo exigiria acesso exclusivo ao arquivo
+        pragmas = {p: v for p, v in self.SQLITE_BULK_PRAGMAS.items()
+                   if not (p == "journal_mode" and str(anteriores[p]).lower() == "wal")}
+        try:
+            for pragma, valor in pragmas.items():
+                cur.execute(f"PRAGMA {pragma} = {valor}")
+            cur.executemany(f'INSERT INTO "{table_name}" ({cols}) VALUES ({placeholders})', rows)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            for pragma in pragmas:
+                cur.execute(f"PRAGMA {pragma} = {anteriores[pragma]}")
+            cur.close()
+            raw.close()
+        return len(df)
+
+    @staticmethod
+    def _native_column(col: pd.Series) -> list:
+        """Valores em tipos nativos do Python (NaN vira None), que o driver aceita sem adaptação."""
+        if col.hasnans:
+            return col.astype(object).where(col.notna(), None).tolist()
+        return col.tolist()
+
+    def upsert_to_cache(self, df: pd.DataFrame, table_name: str, key_columns: list):
+        """
+        Insere ou atualiza linhas pela chave `key_columns` (idempotente).
+        Grava o DataFrame numa tabela de staging e faz INSERT ... ON CONFLICT DO UPDATE na tabela final.
+        """
+        try:
+            if df is None or df.empty:
+                return False
+
+            if table_name in metadata.tables:
+                # Tabela do schema versionado: criada com os tipos declarados, nunca pelo pandas
+                metadata.create_all(self.engine, tables=[metadata.tables[table_name]])
+            if not inspect(self.engine).has_table(table_name):
+                df.to_sql(name=table_name, con=self.engine, if_exists='fail', index=False)
+                self.ensure_unique_index(table_name, key_columns)
+                logger.info(f"Cache criado na tabela: {table_name}")
+                return True
+
+            self.ensure_unique_index(table_name, key_columns)
+            staging = f"_staging_{table_name}"
+            cols = ", ".join(df.columns)
+            keys = ", ".join(key_columns)
+            updates = ", ".join(f"{c} = excluded.{c}" for c in df.columns if c not in key_columns)
+            conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+            with self.engine.begin() as conn:
+                df.to_sql(name=staging, con=conn, if_exists='replace', index=False)
+                # "WHERE true" evita a ambiguidade do parser do SQLite entre SELECT e ON CONFLICT
+                conn.execute(text(
+                    f"INSERT INTO {table_name} ({cols}) SELECT {cols} FROM {staging} WHERE true "
+                    f"ON CONFLICT ({keys}) {conflict}"
+                ))
+                conn.execute(text(f"DROP TABLE {staging}"))
+            logger.info(f"Upsert de {len(df)} linhas na tabela: {table_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro no upsert em {table_name}: {e}")
+            return False
+
+    def ensure_unique_index(self, table_name: str, key_columns: list):
+        """Cria (se não existir) o índice único usado como alvo do ON CONFLICT."""
+        self.execute_raw(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table_name}_chave ON {table_name} ({', '.join(key_columns)})"
+        )
+
     def get_from_cache(self, query: str, params: dict = None) -> pd.DataFrame:
         """
         Executa uma consulta e retorna um DataFrame.
         """
+        inicio = time.perf_counter()
         try:
-            return pd.read_sql(text(query), self.engine, params=params)
+            df = pd.read_sql(text(query), self.engine, params=params)
         except Exception as e:
             logger.error(f"Erro ao ler cache: {e}")
             return pd.DataFrame()
+        observe_query(query, time.perf_counter() - inicio, len(df))
+        return df
 
     def execute_raw(self, sql: str, params: dict = None):
         """Executa um comando SQL puro (INSERT/UPDATE/DELETE)."""
         with self.engine.begin() as conn:
             conn.execute(text(sql), params or {})
 
+# Interface comum aos backends: é tudo o que os serviços usam do db_manager
+BACKEND_OPERATIONS = ("get_from_cache", "save_to_cache", "bulk_save", "upsert_to_cache", "execute_raw")
+
+def create_db_manager(url: str = None):
+    """
+    Escolhe o backend pela DB_CONNECTION_STRING:
+    'parquet:///caminho' usa o armazenamento colunar; qualquer outra URL usa SQLAlchemy.
+    O backend precisa ter toda a BACKEND_OPERATIONS; o que ele não suporta (UNSUPPORTED) é anunciado aqui,
+    na escolha, e não descoberto no meio de uma carga.
+    """
+    url = url or settings.DB_URL
+    if not url.startswith("parquet://"):
+        return DatabaseManager(url)
+
+    from .parquet_store import ParquetDatabaseManager
+    manager = ParquetDatabaseManager(url.replace("parquet:///", "", 1))
+    ausentes = [op for op in BACKEND_OPERATIONS if not callable(getattr(manager, op, None))]
+    if ausentes:
+        raise TypeError(f"Backend {type(manager).__name__} sem as operações: {', '.join(ausentes)}")
+    for op, motivo in manager.UNSUPPORTED.items():
+        logger.info(f"Backend Parquet: {op} não suporta {motivo}")
+    return manager
+
 # Instância única para o projeto todo
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = create_db_manager()
\ No newline at end of file
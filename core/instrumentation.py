@@ -0,0 +1,284 @@
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as Contagem, deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Limites (em segundos) dos histogramas de latência: de 1 ms a 30 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def collect(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.header() + [f"{self.name}{_labels(self.labels, k)} {v}" for k, v in series]
+
+class Histogram(_Metric):
+    """Histograma cumulativo no formato do Prometheus (buckets, _sum e _count por combinação de labels)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            serie = self._series.get(key)
+            if serie is None:
+                serie = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += value
+            serie[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def total(self, **labels) -> float:
+        """Soma dos valores observados (ex.: segundos acumulados de uma etapa)."""
+        with self._lock:
+            serie = self._series.get(self._key(labels))
+            return serie[1] if serie else 0.0
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            serie = self._series.get(self._key(labels))
+            return serie[2] if serie else 0
+
+    def collect(self) -> list:
+        with self._lock:
+            series = sorted((k, (list(b), s, c)) for k, (b, s, c) in self._series.items())
+        linhas = self.header()
+        for key, (buckets, soma, total) in series:
+            acumulado = 0
+            for limite, n in zip(self.buckets, buckets):
+                acumulado += n
+                le = _labels(self.labels, key, 'le="%s"' % limite)
+                linhas.append(f"{self.name}_bucket{le} {acumulado}")
+            le = _labels(self.labels, key, 'le="+Inf"')
+            linhas.append(f"{self.name}_bucket{le} {total}")
+            linhas.append(f"{self.name}_sum{_labels(self.labels, key)} {soma}")
+            linhas.append(f"{self.name}_count{_labels(self.labels, key)} {total}")
+        return linhas
+
+class Gauge(_Metric):
+    """Valor lido no momento da coleta (ex.: contadores já mantidos pelos caches)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func, kind: str = "gauge"):
+        super().__init__(name, help)
+        self.func = func
+        self.kind = kind
+
+    def collect(self) -> list:
+        try:
+            valor = self.func()
+        except Exception:
+            return []
+        return self.header() + [f"{self.name} {valor}"]
+
+class Registry:
+    """Métricas do processo, expostas em /metrics no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, func, kind: str = "gauge") -> Gauge:
+        """Métrica calculada na coleta; `kind="counter"` para totais que só crescem."""
+        with self._lock:
+            self._metrics[name] = Gauge(name, help, func, kind)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(linha for m in metrics for linha in m.collect()) + "\n"
+
+@lru_cache(maxsize=1024)
+def sql_shape(query: str, limite: int = 160) -> str:
+    """
+    Forma da consulta para o label das métricas: literais trocados por '?', listas IN colapsadas
+    e espaços normalizados (consultas iguais com valores diferentes caem na mesma série).
+    """
+    forma = re.sub(r"'(?:[^']|'')*'", "?", query)
+    forma = re.sub(r"\b\d+(?:\.\d+)?\b", "?", forma)
+    forma = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", forma)
+    forma = re.sub(r"\s+", " ", forma).strip()
+    return forma[:limite]
+
+registry = Registry()
+
+# Etapas do ETL, na ordem em que acontecem (read/parse/filter/convert/write por bloco; as demais por carga)
+ETL_STAGES = ("read", "parse", "filter", "convert", "write", "index", "adjust", "publish")
+
+ETL_STAGE_SECONDS = registry.histogram(
+    "b3_etl_stage_seconds", "Tempo de cada etapa do ETL", ["stage"],
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "b3_db_query_seconds", "Latência das leituras do banco (get_from_cache) por forma da consulta", ["query"],
+)
+DB_QUERY_ROWS = registry.counter(
+    "b3_db_query_rows_total", "Linhas devolvidas pelas leituras do banco por forma da consulta", ["query"],
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "b3_http_request_duration_seconds", "Latência das requisições da API por rota", ["method", "route", "status"],
+)
+CHART_RENDER_SECONDS = registry.histogram(
+    "b3_chart_render_seconds", "Tempo de renderização dos gráficos (pool de processos ou inline)", ["format", "mode"],
+)
+
+def observe_query(query: str, segundos: float, linhas: int):
+    """Registra uma leitura do banco (latência e linhas) na série da forma da consulta."""
+    forma = sql_shape(query)
+    DB_QUERY_SECONDS.observe(segundos, query=forma)
+    DB_QUERY_ROWS.inc(linhas, query=forma)
+
+#---------------------------------
+# --- PROFILER POR AMOSTRAGEM  ---
+#---------------------------------
+
+# Folhas de threads ociosas (esperando trabalho, lock ou I/O): não entram no perfil
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("thread.py", "_worker"), ("queue.py", "get")}
+
+class SamplingProfiler:
+    """
+    Amostra as pilhas de todas as threads do processo a cada `interval` segundos (sys._current_frames)
+    e acumula no formato "folded" (thread;quadro;...;folha contagem), lido por flamegraph.pl e speedscope.
+    Um só perfil por vez: as pilhas são do processo inteiro.
+    """
+
+    _active = threading.Lock()
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Contagem()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        """Inicia a amostragem; False se outro perfil já estiver em andamento."""
+        if not self._active.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._active.release()
+        return self.folded()
+
+    def _run(self):
+        proprio = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                pilha = self._stack(frame)
+                if pilha:
+                    self.stacks[";".join([nomes.get(ident, str(ident)), *pilha])] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _stack(frame) -> list:
+        folha = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+        if folha in IDLE_FRAMES:
+            return []
+        pilha = []
+        while frame is not None:
+            codigo = frame.f_code
+            pilha.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+            frame = frame.f_back
+        return pilha[::-1]
+
+    def folded(self) -> str:
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.stacks.most_common())
+
+class ProfileStore:
+    """Últimos perfis capturados (em memória), consultados por id."""
+
+    def __init__(self, max_items: int = 20):
+        self._items = deque(maxlen=max_items)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, rota: str, segundos: float, amostras: int, folded: str) -> int:
+        with self._lock:
+            perfil_id = next(self._ids)
+            self._items.append({"id": perfil_id, "rota": rota, "ms": round(segundos * 1000, 1),
+                                "amostras": amostras, "folded": folded})
+            return perfil_id
+
+    def get(self, perfil_id: int):
+        with self._lock:
+            return next((p for p in self._items if p["id"] == perfil_id), None)
+
+    def list(self) -> list:
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != "folded"} for p in reversed(self._items)]
+
+profile_store = ProfileStore()
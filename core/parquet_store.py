@@ -0,0 +1,312 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import BigInteger, Float, Integer, SmallInteger
+from .constants import CacheConstants
+from .schema import MIGRATIONS, metadata
+from .instrumentation import observe_query
+
+logger = logging.getLogger(__name__)
+
+class ParquetSchema:
+    """
+    Equivalente do SchemaManager para o backend Parquet.
+    Não há índices: o layout particionado (ano/ticker) e as estatísticas dos row groups fazem esse papel.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def current_version(self) -> int:
+        return MIGRATIONS[-1][0]
+
+    def migrate(self) -> int:
+        return self.current_version()
+
+    def drop_indexes(self, table_name: str):
+        pass
+
+    def create_indexes(self, table_name: str):
+        pass
+
+    def reset_table(self, table_name: str):
+        self.store.drop_table(table_name)
+
+class ParquetDatabaseManager:
+    """
+    Backend colunar: cada tabela é um diretório de Parquet comprimido (zstd).
+    cotacoes_historicas é particionada por ano e ticker (layout hive).
+    As consultas SQL dos serviços rodam no DuckDB sobre datasets do pyarrow com memory-map,
+    com pushdown de colunas e predicados (inclusive poda de partições por ticker).
+    Mesma interface pública do DatabaseManager.
+    """
+
+    # Tabelas particionadas: colunas de partição (a primeira pode ser derivada)
+    PARTITIONS = {
+        CacheConstants.TABLE_HISTORICO: ["ano", "ticker"],
+    }
+    # Colunas de partição derivadas que não existem no dado original
+    DERIVED = {"ano": lambda df: (df["data_pregao"] // 10000).astype("int16")}
+    VERSION_FILE = "_versao"
+    # O que só o backend SQL oferece; create_db_manager anuncia a lista ao escolher este backend
+    UNSUPPORTED = {
+        "get_session": "sessões SQLAlchemy (não há engine; use get_from_cache/read_table)",
+        "execute_raw": f"DDL/DML pontual nas tabelas particionadas ({', '.join(PARTITIONS)}); "
+                       f"use save_to_cache/upsert_to_cache",
+    }
+
+    def __init__(self, root):
+        try:
+            import pyarrow  # noqa: F401
+            import duckdb  # noqa: F401
+        except ImportError as e:
+            raise ImportError("O backend Parquet requer os pacotes 'pyarrow' e 'duckdb'.") from e
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.engine = None
+        self._datasets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def schema(self) -> ParquetSchema:
+        return ParquetSchema(self)
+
+    # --- ESCRITA ---
+
+    def save_to_cache(self, df: pd.DataFrame, table_name: str, if_exists: str = 'append'):
+        """Salva um DataFrame como Parquet (replace recria o diretório, append adiciona arquivos)."""
+        try:
+            if df is None or df.empty:
+                return False
+            self.bulk_save(df, table_name, if_exists=if_exists)
+            logger.info(f"Cache atualizado na tabela: {table_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao salvar cache em {table_name}: {e}")
+            return False
+
+    def bulk_save(self, df: pd.DataFrame, table_name: str, if_exists: str = 'append'):
+        if if_exists == 'replace':
+            self.drop_table(table_name)
+        elif if_exists == 'fail' and self._table_dir(table_name).exists():
+            raise ValueError(f"Tabela '{table_name}' já existe.")
+        self._write(df, table_name)
+        return len(df)
+
+    def upsert_to_cache(self, df: pd.DataFrame, table_name: str, key_columns: list):
+        """Reescreve apenas as partições afetadas, mantendo a última versão de cada chave."""
+        try:
+            if df is None or df.empty:
+                return False
+
+            partitions = self.PARTITIONS.get(table_name, [])
+            df = self._with_partitions(df, table_name)
+            grupos = df.groupby(partitions, sort=False) if partitions else [((), df)]
+            for valores, novos in grupos:
+                valores = valores if isinstance(valores, tuple) else (valores,)
+                pasta = self._table_dir(table_name).joinpath(*(f"{c}={v}" for c, v in zip(partitions, valores)))
+                atuais = self._read_dir(pasta, partitions, valores) if pasta.exists() else None
+                merged = novos if atuais is None else pd.concat([atuais, novos], ignore_index=True)
+                merged = merged.drop_duplicates(subset=key_columns, keep="last")
+                merged, arrow_schema = self._conform(merged.drop(columns=partitions), table_name, exclude=partitions)
+                self._replace_dir(pasta, merged, arrow_schema=arrow_schema)
+            self._bump(table_name)
+            logger.info(f"Upsert de {len(df)} linhas na tabela: {table_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro no upsert em {table_name}: {e}")
+            return False
+
+    def ensure_unique_index(self, table_name: str, key_columns: list):
+        pass
+
+    def drop_table(self, table_name: str):
+        shutil.rmtree(self._table_dir(table_name), ignore_errors=True)
+        self._bump(table_name)
+
+    # --- LEITURA ---
+
+    def get_from_cache(self, query: str, params: dict = None) -> pd.DataFrame:
+        """Executa a consulta no DuckDB sobre os datasets Parquet e retorna um DataFrame."""
+        inicio = time.perf_counter()
+        try:
+            con = self._connect()
+            try:
+                df = con.execute(self._duckdb_sql(query), params or {}).df()
+            finally:
+                con.close()
+        except Exception as e:
+            logger.error(f"Erro ao ler cache: {e}")
+            return pd.DataFrame()
+        observe_query(query, time.perf_counter() - inicio, len(df))
+        return df
+
+    def read_table(self, table_name: str, columns: list = None, filters=None) -> pd.DataFrame:
+        """Leitura direta via pyarrow (memory-map), com projeção de colunas e filtros no formato DNF."""
+        import pyarrow.parquet as pq
+        from pyarrow import fs
+        pasta = self._table_dir(table_name)
+        if not pasta.exists():
+            return pd.DataFrame()
+        table = pq.read_table(
+            str(pasta), columns=columns, filters=filters, memory_map=True,
+            partitioning=self._partitioning(table_name), filesystem=fs.LocalFileSystem(use_mmap=True),
+        )
+        return table.to_pandas().drop(columns=["ano"], errors="ignore")
+
+    def execute_raw(self, sql: str, params: dict = None):
+        """
+        Executa DDL/DML em tabelas pequenas (manifesto, metadados): a tabela é carregada no DuckDB,
+        alterada e regravada. Tabelas particionadas são recusadas (ver UNSUPPORTED): regravá-las assim
+        perderia o particionamento.
+        """
+        import duckdb
+        nomes = set(re.findall(r"(?:TABLE|FROM|INTO|UPDATE)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", sql, re.IGNORECASE))
+        if nomes & set(self.PARTITIONS):
+            raise ValueError(f"Backend Parquet não suporta {self.UNSUPPORTED['execute_raw']}.")
+
+        with self._lock:
+            con = duckdb.connect()
+            try:
+                for nome in nomes:
+                    pasta = self._table_dir(nome)
+                    if pasta.exists():
+                        con.execute(f"CREATE TABLE {nome} AS SELECT * FROM read_parquet('{pasta}/*.parquet')")
+                con.execute(self._duckdb_sql(sql), params or {})
+                existentes = {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+                for nome in nomes & existentes:
+                    self._replace_dir(self._table_dir(nome), con.execute(f"SELECT * FROM {nome}").df(),
+                                      arrow_schema=con.execute(f"SELECT * FROM {nome} LIMIT 0").arrow().schema)
+                    self._bump(nome)
+            finally:
+                con.close()
+
+    # --- INTERNOS ---
+
+    def _table_dir(self, table_name: str) -> Path:
+        return self.root / table_name
+
+    def _partitioning(self, table_name: str):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        partitions = self.PARTITIONS.get(table_name)
+        if not partitions:
+            return None
+        tipos = {"ano": pa.int16(), "ticker": pa.string()}
+        return ds.partitioning(pa.schema([(c, tipos.get(c, pa.string())) for c in partitions]), flavor="hive")
+
+    def _with_partitions(self, df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+        derivadas = [c for c in self.PARTITIONS.get(table_name, []) if c in self.DERIVED and c not in df.columns]
+        if derivadas:
+            df = df.assign(**{c: self.DERIVED[c](df) for c in derivadas})
+        return df
+
+    def _conform(self, df: pd.DataFrame, table_name: str, exclude: list = ()):
+        """
+        Completa o DataFrame com as colunas declaradas em core.schema que faltam (nulas, com o tipo declarado).
+        Todo arquivo sai com o schema completo, já que o dataset infere as colunas a partir de um arquivo só.
+        Devolve (df, schema arrow ou None).
+        """
+        import pyarrow as pa
+        tabela = metadata.tables.get(table_name)
+        faltantes = [c for c in tabela.columns if c.name not in df.columns and c.name not in exclude] if tabela is not None else []
+        if not faltantes:
+            return df, None
+        df = df.assign(**{c.name: pd.Series([None] * len(df), index=df.index, dtype=object) for c in faltantes})
+        schema = pa.Schema.from_pandas(df.drop(columns=[c.name for c in faltantes]), preserve_index=False)
+        for c in faltantes:
+            schema = schema.append(pa.field(c.name, self._arrow_type(c.type)))
+        return df[schema.names], schema
+
+    @staticmethod
+    def _arrow_type(tipo):
+        import pyarrow as pa
+        if isinstance(tipo, Float):
+            return pa.float64()
+        if isinstance(tipo, BigInteger):
+            return pa.int64()
+        if isinstance(tipo, SmallInteger):
+            return pa.int16()
+        if isinstance(tipo, Integer):
+            return pa.int32()
+        return pa.string()
+
+    def _write(self, df: pd.DataFrame, table_name: str):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        df, schema = self._conform(self._with_partitions(df, table_name), table_name)
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False, schema=schema),
+            str(self._table_dir(table_name)),
+            format="parquet",
+            partitioning=self._partitioning(table_name),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        )
+        self._bump(table_name)
+
+    def _read_dir(self, pasta: Path, partitions: list, valores: tuple) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+        df = pq.read_table(str(pasta), memory_map=True).to_pandas()
+        return df.assign(**dict(zip(partitions, valores)))
+
+    def _replace_dir(self, pasta: Path, df: pd.DataFrame, arrow_schema=None):
+        """Troca o conteúdo de uma partição por um único arquivo (escreve antes de apagar os antigos)."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pasta.mkdir(parents=True, exist_ok=True)
+        antigos = list(pasta.glob("*.parquet"))
+        tmp = pasta / f".tmp-{uuid.uuid4().hex}.parquet"
+        table = pa.Table.from_pandas(df, preserve_index=False, schema=arrow_schema)
+        pq.write_table(table, str(tmp), compression="zstd")
+        os.replace(tmp, pasta / f"part-{uuid.uuid4().hex}-0.parquet")
+        for antigo in antigos:
+            antigo.unlink(missing_ok=True)
+
+    def _bump(self, table_name: str):
+        """Marca a tabela como alterada, para que os datasets em cache sejam redescobertos."""
+        marcador = self.root / f"{self.VERSION_FILE}_{table_name}"
+        marcador.write_text(str(time.time_ns()))
+
+    def _dataset(self, table_name: str):
+        """Dataset pyarrow (memory-map) da tabela, em cache até a próxima escrita."""
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+        marcador = self.root / f"{self.VERSION_FILE}_{table_name}"
+        versao = marcador.read_text() if marcador.exists() else ""
+        with self._lock:
+            cached = self._datasets.get(table_name)
+            if cached and cached[0] == versao:
+                return cached[1]
+            dataset = ds.dataset(
+                str(self._table_dir(table_name)), format="parquet",
+                partitioning=self._partitioning(table_name),
+                filesystem=fs.LocalFileSystem(use_mmap=True),
+            )
+            self._datasets[table_name] = (versao, dataset)
+            return dataset
+
+    def _connect(self):
+        """Conexão DuckDB em memória com uma view por tabela existente."""
+        import duckdb
+        con = duckdb.connect()
+        for pasta in self.root.iterdir():
+            if not pasta.is_dir() or not any(pasta.iterdir()):
+                continue
+            nome = pasta.name
+            con.register(f"_ds_{nome}", self._dataset(nome))
+            excluir = " EXCLUDE (ano)" if "ano" in self.PARTITIONS.get(nome, []) else ""
+            con.execute(f"CREATE VIEW {nome} AS SELECT *{excluir} FROM _ds_{nome}")
+        return con
+
+    @staticmethod
+    def _duckdb_sql(sql: str) -> str:
+        """Converte parâmetros no estilo SQLAlchemy (:nome) para o estilo DuckDB ($nome)."""
+        return re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
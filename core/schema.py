@@ -0,0 +1,248 @@
+from datetime import datetime
+import logging
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, SmallInteger, BigInteger, Float, String, Text, inspect, text
+)
+from .constants import CacheConstants, B3Layout, AdjustmentConfig
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+# Datas como inteiro AAAAMMDD e preços como inteiro em centavos (exatamente como vêm da B3)
+cotacoes_historicas = Table(
+    CacheConstants.TABLE_HISTORICO, metadata,
+    Column("data_pregao", Integer, nullable=False),
+    Column("ticker", String(12), nullable=False),
+    Column("cod_bdi", String(2), nullable=False),
+    Column("tipo_registro", SmallInteger),
+    Column("nome_empresa", String(12)),
+    Column("abertura", BigInteger),
+    Column("maximo", BigInteger),
+    Column("minimo", BigInteger),
+    Column("medio", BigInteger),
+    Column("fechamento", BigInteger),
+    Column("qtd_titulos", BigInteger),
+    Column("volume", BigInteger),
+    # Ajuste por eventos corporativos (NULL = sem ajuste pendente, vale o preço bruto)
+    Column(AdjustmentConfig.FACTOR_COLUMN, Float),
+    *[Column(c, Float) for c in AdjustmentConfig.ADJUSTED_COLUMNS.values()],
+)
+
+# Métricas pré-calculadas pelo ETL, uma linha por (ticker, versão dos dados)
+metricas_ativos = Table(
+    CacheConstants.TABLE_METRICS, metadata,
+    Column("ticker", String(12), nullable=False),
+    Column("versao", BigInteger, nullable=False),
+    Column("media_fechamento", Float),
+    Column("maxima_periodo", Float),
+    Column("minima_periodo", Float),
+    Column("ultimo_fechamento", Float),
+    Column("volatilidade", Float),
+    Column("volume_medio", Float),
+    Column("sessoes", Integer),
+)
+
+# Assinatura dos eventos já aplicados por ticker: só quem mudou é reajustado
+ajustes_aplicados = Table(
+    CacheConstants.TABLE_ADJUSTMENTS, metadata,
+    Column("ticker", String(12), primary_key=True),
+    Column("assinatura", String(64), nullable=False),
+    Column("eventos", Integer),
+    Column("aplicado_em", Text),
+)
+
+# Dimensão de ativos montada pelo ETL: nome, BDI, período negociado e liquidez (ranking 1 = mais líquido)
+dim_ativos = Table(
+    CacheConstants.TABLE_TICKERS, metadata,
+    Column("ticker", String(12), primary_key=True),
+    Column("nome_empresa", String(12)),
+    Column("cod_bdi", String(2)),
+    Column("primeiro_pregao", Integer),
+    Column("ultimo_pregao", Integer),
+    Column("sessoes", Integer),
+    Column("volume_medio", Float),
+    Column("volume_maximo", BigInteger),
+    Column("ranking", Integer),
+    Column("versao", BigInteger, nullable=False),
+)
+
+schema_versao = Table(
+    CacheConstants.TABLE_SCHEMA_VERSION, metadata,
+    Column("versao", Integer, primary_key=True),
+    Column("descricao", Text),
+    Column("aplicado_em", Text),
+)
+
+# Índices criados à parte (e não no CREATE TABLE) para serem construídos depois da carga em massa
+INDEXES = {
+    CacheConstants.TABLE_HISTORICO: [
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{CacheConstants.TABLE_HISTORICO}_chave "
+        f"ON {CacheConstants.TABLE_HISTORICO} (data_pregao, ticker, cod_bdi)",
+        f"CREATE INDEX IF NOT EXISTS ix_{CacheConstants.TABLE_HISTORICO}_ticker_data "
+        f"ON {CacheConstants.TABLE_HISTORICO} (ticker, data_pregao)",
+        f"CREATE INDEX IF NOT EXISTS ix_{CacheConstants.TABLE_HISTORICO}_bdi_volume "
+        f"ON {CacheConstants.TABLE_HISTORICO} (cod_bdi, volume)",
+    ],
+    CacheConstants.TABLE_METRICS: [
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{CacheConstants.TABLE_METRICS}_chave "
+        f"ON {CacheConstants.TABLE_METRICS} (ticker, versao)",
+    ],
+    CacheConstants.TABLE_TICKERS: [
+        f"CREATE INDEX IF NOT EXISTS ix_{CacheConstants.TABLE_TICKERS}_ranking "
+        f"ON {CacheConstants.TABLE_TICKERS} (ranking)",
+    ],
+}
+
+def format_dates(values: np.ndarray) -> np.ndarray:
+    """Converte datas AAAAMMDD (int) em strings 'AAAA-MM-DD', formatando cada data distinta uma única vez."""
+    uniq, inverse = np.unique(np.asarray(values), return_inverse=True)
+    labels = np.array([f"{d // 10000:04d}-{d // 100 % 100:02d}-{d % 100:02d}" for d in uniq.tolist()], dtype=object)
+    return labels[inverse]
+
+def to_storage_date(valor) -> int:
+    """Data 'AAAA-MM-DD' (ou date) no inteiro AAAAMMDD do armazenamento."""
+    return int(str(valor)[:10].replace("-", ""))
+
+def date_slice(datas: np.ndarray, inicio: int = None, fim: int = None, ultimos: int = None) -> slice:
+    """
+    Faixa de linhas de um histórico ordenado por data (AAAAMMDD) entre `inicio` e `fim` (inclusivos),
+    limitada aos `ultimos` pregões. Busca binária: custo O(log n), sem varrer nem copiar os arrays.
+    """
+    a = int(np.searchsorted(datas, inicio, "left")) if inicio is not None else 0
+    b = int(np.searchsorted(datas, fim, "right")) if fim is not None else len(datas)
+    if ultimos is not None:
+        a = max(a, b - ultimos)
+    return slice(a, max(a, b))
+
+def from_storage(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte colunas no formato de armazenamento (int AAAAMMDD, centavos) para datas ISO e reais."""
+    if "data_pregao" in df.columns and is_integer_dtype(df["data_pregao"]):
+        df["data_pregao"] = format_dates(df["data_pregao"].to_numpy())
+    for col in B3Layout.PRICE_COLUMNS:
+        if col in df.columns and is_integer_dtype(df[col]):
+            df[col] = df[col] / 100.0
+    # Preços ajustados são float, mas também estão em centavos
+    for col in AdjustmentConfig.ADJUSTED_COLUMNS.values():
+        if col in df.columns:
+            df[col] = df[col].astype(float) / 100.0
+    return df
+
+def _migrate_v1(conn):
+    """Tabelas tipadas; converte a tabela legada criada pelo to_sql (datas TEXT, preços float, coluna index)."""
+    insp = inspect(conn)
+    legacy = None
+    if insp.has_table(CacheConstants.TABLE_HISTORICO):
+        tipos = {c["name"]: str(c["type"]).upper() for c in insp.get_columns(CacheConstants.TABLE_HISTORICO)}
+        if "INT" not in tipos.get("data_pregao", ""):
+            legacy = f"_legado_{CacheConstants.TABLE_HISTORICO}"
+            conn.execute(text(f"ALTER TABLE {CacheConstants.TABLE_HISTORICO} RENAME TO {legacy}"))
+
+    # Métricas são cache: a tabela antiga é simplesmente descartada
+    if insp.has_table(CacheConstants.TABLE_METRICS):
+        conn.execute(text(f"DROP TABLE {CacheConstants.TABLE_METRICS}"))
+
+    metadata.create_all(conn, tables=[cotacoes_historicas, metricas_ativos])
+
+    if legacy:
+        bdi = "CAST(cod_bdi AS TEXT)"
+        # O ETL antigo só dividia abertura/máxima/mínima/fechamento por 100: o médio já está em centavos
+        centavos = lambda c: f"CAST(ROUND({c} * 100) AS BIGINT)"
+        conn.execute(text(f"""
+            INSERT INTO {CacheConstants.TABLE_HISTORICO}
+                (data_pregao, ticker, cod_bdi, tipo_registro, nome_empresa,
+                 abertura, maximo, minimo, medio, fechamento, qtd_titulos, volume)
+            SELECT CAST(REPLACE(CAST(data_pregao AS TEXT), '-', '') AS INTEGER), ticker,
+                   CASE WHEN LENGTH({bdi}) = 1 THEN '0' || {bdi} ELSE {bdi} END,
+                   tipo_registro, nome_empresa,
+                   {centavos('abertura')}, {centavos('maximo')}, {centavos('minimo')},
+                   CAST(medio AS BIGINT), {centavos('fechamento')},
+                   CAST(qtd_titulos AS BIGINT), CAST(volume AS BIGINT)
+            FROM {legacy}
+        """))
+        conn.execute(text(f"DROP TABLE {legacy}"))
+
+    for table in [CacheConstants.TABLE_HISTORICO, CacheConstants.TABLE_METRICS]:
+        for ddl in INDEXES[table]:
+            conn.execute(text(ddl))
+
+def _migrate_v2(conn):
+    """metricas_ativos passa a ser chaveada por (ticker, versao) e ganha novas estatísticas."""
+    conn.execute(text(f"DROP INDEX IF EXISTS ix_{CacheConstants.TABLE_METRICS}_ticker"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {CacheConstants.TABLE_METRICS}"))
+    metadata.create_all(conn, tables=[metricas_ativos])
+    for ddl in INDEXES[CacheConstants.TABLE_METRICS]:
+        conn.execute(text(ddl))
+
+def _migrate_v3(conn):
+    """Colunas de preço ajustado em cotacoes_historicas e a tabela de ajustes aplicados."""
+    existentes = {c["name"] for c in inspect(conn).get_columns(CacheConstants.TABLE_HISTORICO)}
+    for col in [AdjustmentConfig.FACTOR_COLUMN, *AdjustmentConfig.ADJUSTED_COLUMNS.values()]:
+        # Bancos criados já nesta versão do código recebem as colunas no CREATE TABLE da v1
+        if col not in existentes:
+            conn.execute(text(f"ALTER TABLE {CacheConstants.TABLE_HISTORICO} ADD COLUMN {col} FLOAT"))
+    metadata.create_all(conn, tables=[ajustes_aplicados])
+
+def _migrate_v4(conn):
+    """Dimensão de ativos (universo, busca e ranking de liquidez)."""
+    metadata.create_all(conn, tables=[dim_ativos])
+    for ddl in INDEXES[CacheConstants.TABLE_TICKERS]:
+        conn.execute(text(ddl))
+
+# Migrações em ordem; cada uma roda uma única vez e fica registrada em schema_versao
+MIGRATIONS = [
+    (1, "Tabelas tipadas e índices de cotacoes_historicas/metricas_ativos", _migrate_v1),
+    (2, "metricas_ativos chaveada por (ticker, versao)", _migrate_v2),
+    (3, "Preços ajustados por eventos corporativos", _migrate_v3),
+    (4, "Dimensão de ativos com ranking de liquidez", _migrate_v4),
+]
+
+class SchemaManager:
+    """Schema explícito e versionado do banco, com migrações e controle dos índices."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def current_version(self) -> int:
+        with self.engine.connect() as conn:
+            if not inspect(conn).has_table(CacheConstants.TABLE_SCHEMA_VERSION):
+                return 0
+            return conn.execute(text(f"SELECT COALESCE(MAX(versao), 0) FROM {CacheConstants.TABLE_SCHEMA_VERSION}")).scalar()
+
+    def migrate(self) -> int:
+        """Aplica as migrações pendentes, cada uma na sua transação. Devolve a versão final."""
+        versao = self.current_version()
+        for numero, descricao, migration in MIGRATIONS:
+            if numero <= versao:
+                continue
+            with self.engine.begin() as conn:
+                metadata.create_all(conn, tables=[schema_versao])
+                migration(conn)
+                conn.execute(schema_versao.insert().values(
+                    versao=numero, descricao=descricao, aplicado_em=datetime.now().isoformat(timespec="seconds")
+                ))
+            logger.info(f"Schema migrado para a versão {numero}: {descricao}")
+            versao = numero
+        return versao
+
+    def drop_indexes(self, table_name: str):
+        """Remove os índices da tabela antes de uma carga em massa."""
+        with self.engine.begin() as conn:
+            for ddl in INDEXES.get(table_name, []):
+                nome = ddl.split(" IF NOT EXISTS ")[1].split()[0]
+                conn.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+
+    def create_indexes(self, table_name: str):
+        """Constrói os índices da tabela (idempotente); chamado depois da carga em massa."""
+        with self.engine.begin() as conn:
+            for ddl in INDEXES.get(table_name, []):
+                conn.execute(text(ddl))
+
+    def reset_table(self, table_name: str):
+        """Esvazia a tabela e remove os índices, preparando uma recarga completa."""
+        self.drop_indexes(table_name)
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {table_name}"))
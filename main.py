@@ -1,33 +1,329 @@
+import argparse
+import glob
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import numpy as np
 from core.database import db_manager
-from core.config import settings
-import pandas as pd
-from core.constants import B3Layout 
+from core.config import settings, setup_logging
+from core.constants import CacheConstants, MarketConstants
+from services.cotahist_parser import CotahistParser, extract_task, parse_task
+from core.schema import format_dates
+from core.instrumentation import ETL_STAGES, ETL_STAGE_SECONDS
+from services.ingest_manifest import IngestManifest
+from services.data_version import data_version
+from services.ticker_cache import ticker_cache
+from services.analysis_service import AnalysisService
+from services.correlation_service import returns_matrix
+from services.adjustment_service import AdjustmentService
+from services.chart_service import ChartService
+from services.chart_cache import chart_cache
+from services.ticker_index import ticker_index
+from services.market_snapshot import market_snapshot
 
 class B3ETLProcessor:
-    def import_raw_file(self, file_path):
-        print(f"Lendo arquivo: {file_path}")
-        # Usa o B3_LAYOUT para processar o TXT
-        B3_LAYOUT = B3Layout.LAYOUT
-        df = pd.read_fwf(
-            file_path, 
-            colspecs=B3_LAYOUT["colspecs"], 
-            names=B3_LAYOUT["names"],
-            skiprows=1, skipfooter=1
-        )
-
-        # Converte o formato 20250102 (string/int) para data real
-        df['data_pregao'] = pd.to_datetime(df['data_pregao'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
-
-        # Converter colunas numéricas (abertura, fechamento) que vêm com vírgula implícita
-        # A B3 envia 0000000001050 para significar 10.50
-        cols_precos = ['abertura', 'maximo', 'minimo', 'fechamento']
-        for col in cols_precos:
-            df[col] = df[col] / 100.0
-
-        # Lógica de limpeza...
-        db_manager.save_to_cache(df, "cotacoes_historicas")
+    # Estimativa de memória por registro em trânsito (bytes brutos + colunas + DataFrame + to_sql)
+    BYTES_PER_RECORD = 1024
+
+    def __init__(self):
+        self.parser = CotahistParser()
+        db_manager.schema.migrate()
+        self.manifest = IngestManifest()
+
+    def chunk_records(self) -> int:
+        """Tamanho do bloco em registros, respeitando o teto de memória configurado."""
+        if settings.ETL_CHUNK_RECORDS > 0:
+            return settings.ETL_CHUNK_RECORDS
+        return max(1_000, settings.ETL_MEMORY_LIMIT_MB * 1024 * 1024 // self.BYTES_PER_RECORD)
+
+    def _begin(self, incremental: bool):
+        if incremental:
+            # O upsert depende do índice único da chave
+            db_manager.schema.create_indexes(CacheConstants.TABLE_HISTORICO)
+        else:
+            # Recarga completa: esvazia a tabela e tira os índices para a carga em massa.
+            # O manifesto anterior não vale mais.
+            db_manager.schema.reset_table(CacheConstants.TABLE_HISTORICO)
+            self.manifest.clear()
+
+    def _write(self, colunas: dict, incremental: bool) -> int:
+        """Converte e grava um bloco já filtrado. Devolve a quantidade de linhas gravadas."""
+        if len(colunas["ticker"]) == 0:
+            return 0
+
+        # Gravado como vem da B3: data int AAAAMMDD e preços int em centavos
+        # (0000000001050 = R$ 10,50; a conversão para reais acontece na leitura)
+        with ETL_STAGE_SECONDS.time(stage="convert"):
+            df = self.parser.to_storage_frame(colunas)
+
+        with ETL_STAGE_SECONDS.time(stage="write"):
+            if incremental:
+                ok = db_manager.upsert_to_cache(df, CacheConstants.TABLE_HISTORICO, CacheConstants.HISTORICO_KEY)
+            else:
+                ok = db_manager.save_to_cache(df, CacheConstants.TABLE_HISTORICO, if_exists='append')
+        if not ok:
+            raise RuntimeError("Falha ao gravar bloco no banco de dados")
+        return len(df)
+
+    def _finish(self, incremental: bool, gravados: int):
+        if not incremental:
+            # Índices construídos só depois da carga em massa
+            with ETL_STAGE_SECONDS.time(stage="index"):
+                db_manager.schema.create_indexes(CacheConstants.TABLE_HISTORICO)
+        # Preços ajustados: só tickers com eventos alterados ou cotações novas anteriores ao último evento
+        with ETL_STAGE_SECONDS.time(stage="adjust"):
+            ajustados = self._adjust()
+        if gravados or ajustados or not incremental:
+            with ETL_STAGE_SECONDS.time(stage="publish"):
+                self._publish()
+
+    @staticmethod
+    def stage_totals() -> dict:
+        """Segundos acumulados por etapa do ETL no processo (as métricas de /metrics)."""
+        return {etapa: ETL_STAGE_SECONDS.total(stage=etapa) for etapa in ETL_STAGES}
+
+    def stage_summary(self, antes: dict) -> str:
+        """Tempo de cada etapa desde `antes` (uma foto de stage_totals)."""
+        depois = self.stage_totals()
+        return "Etapas: " + ", ".join(f"{e} {depois[e] - antes[e]:.2f}s" for e in ETL_STAGES)
+
+    def _adjust(self) -> int:
+        ajustados = AdjustmentService().run()
+        if ajustados:
+            print(f"Preços ajustados recalculados para {ajustados} ativos")
+        return ajustados
+
+    def apply_adjustments(self) -> int:
+        """Roda só a etapa de ajuste (por exemplo, depois de editar o CSV de eventos)."""
+        ajustados = self._adjust()
+        if ajustados:
+            self._publish()
+        return ajustados
+
+    def _publish(self):
+        # Nova geração: caches da API descartam o que leram antes da recarga
+        versao = data_version.bump()
+        ticker_cache.invalidate()
+        # Dimensão de ativos (universo, nomes e ranking de liquidez) usada pela busca e por /ativos
+        ativos = ticker_index.publish(versao)
+        print(f"Dimensão de ativos publicada com {ativos} ativos")
+        # Snapshot binário (memory-map) de onde os workers da API leem o histórico de cada ativo
+        linhas = market_snapshot.publish(versao)
+        print(f"Snapshot do mercado publicado com {linhas} linhas")
+        # Métricas de todos os tickers líquidos, numa passada, para a nova versão
+        tickers = AnalysisService().precompute_metrics(versao)
+        print(f"Métricas pré-calculadas para {tickers} ativos (versão {versao})")
+        # Matriz data x ticker de retornos para a correlação entre ativos
+        tickers = returns_matrix.build(versao)
+        print(f"Matriz de retornos publicada com {tickers} ativos")
+        # Gráficos padrão dos ativos mais líquidos já ficam no cache da nova versão
+        graficos = ChartService().prerender()
+        chart_cache.prune(versao - 1)
+        print(f"{graficos} gráficos pré-renderizados")
+
+    def _record(self, fingerprint: dict, data_min, data_max, gravados: int):
+        periodo = format_dates(np.array([data_min, data_max])) if gravados else [None, None]
+        self.manifest.record(fingerprint, periodo[0], periodo[1], gravados)
+
+    def import_raw_file(self, file_path, chunk_records: int = None, incremental: bool = False):
+        """
+        ETL em streaming: lê (TXT ou .ZIP), filtra e grava o arquivo em blocos de tamanho fixo.
+        A memória de pico é limitada pelo tamanho do bloco, não pelo tamanho do arquivo.
+
+        No modo incremental, cada bloco é gravado via upsert pela chave (data_pregao, ticker, cod_bdi)
+        e arquivos já registrados no manifesto (mesmo hash) são ignorados.
+        """
+        chunk_records = chunk_records or self.chunk_records()
+        fingerprint = self.manifest.fingerprint(file_path)
+        if incremental and self.manifest.is_ingested(fingerprint):
+            print(f"Arquivo já ingerido (sha256 {fingerprint['sha256'][:12]}), nada a fazer: {file_path}")
+            return 0
+
+        print(f"Lendo arquivo: {file_path} (blocos de {chunk_records} registros)")
+        inicio = time.perf_counter()
+        etapas = self.stage_totals()
+        self._begin(incremental)
+
+        lidos, gravados = 0, 0
+        data_min, data_max = None, None
+        for colunas in self.parser.iter_chunks(file_path, chunk_records):
+            lidos += len(colunas["ticker"])
+
+            # Filtros de mercado: códigos BDI permitidos e volume mínimo
+            with ETL_STAGE_SECONDS.time(stage="filter"):
+                colunas = self.parser.filter_columns(
+                    colunas, MarketConstants.ALLOWED_BDI_CODES, MarketConstants.DEFAULT_MIN_VOLUME
+                )
+            if len(colunas["ticker"]):
+                data_min = min(int(colunas["data_pregao"].min()), data_min or np.iinfo(np.int32).max)
+                data_max = max(int(colunas["data_pregao"].max()), data_max or 0)
+            gravados += self._write(colunas, incremental)
+
+        self._finish(incremental, gravados)
+        self._record(fingerprint, data_min, data_max, gravados)
+
+        segundos = time.perf_counter() - inicio
+        print(f"{lidos} registros lidos, {gravados} gravados em {segundos:.1f}s")
+        print(self.stage_summary(etapas))
         print("Banco de dados atualizado com sucesso!")
+        return gravados
+
+    @staticmethod
+    def resolve_files(source) -> list:
+        """Aceita um diretório (todos os COTAHIST_* .TXT/.ZIP) ou um padrão glob."""
+        if os.path.isdir(source):
+            files = [p for p in Path(source).iterdir()
+                     if p.name.upper().startswith("COTAHIST") and p.suffix.upper() in (".TXT", ".ZIP")]
+        else:
+            files = [Path(p) for p in glob.glob(str(source))]
+        return sorted(str(p) for p in files if p.is_file())
+
+    @staticmethod
+    def file_period(path) -> tuple:
+        """
+        (início, fim) em AAAAMMDD coberto pelo arquivo, pelo nome do COTAHIST: anual (COTAHIST_A2023),
+        mensal (COTAHIST_M012023) ou diário (COTAHIST_D17102026). None se o nome não seguir o padrão.
+        """
+        m = re.fullmatch(r"COTAHIST[_.]?([ADM])(\d+)", Path(path).stem.upper())
+        if m is None:
+            return None
+        tipo, numero = m.groups()
+        if tipo == "A" and len(numero) == 4:
+            return int(numero) * 10_000 + 101, int(numero) * 10_000 + 1231
+        if tipo == "M" and len(numero) == 6:
+            inicio = int(numero[2:]) * 10_000 + int(numero[:2]) * 100
+            return inicio + 1, inicio + 31
+        if tipo == "D" and len(numero) == 8:
+            data = int(numero[4:]) * 10_000 + int(numero[2:4]) * 100 + int(numero[:2])
+            return data, data
+        return None
+
+    @classmethod
+    def check_overlaps(cls, files: list):
+        """
+        Recarga completa: arquivos com períodos sobrepostos (ex.: COTAHIST_A2023 e COTAHIST_M012023) trariam
+        os mesmos pregões duas vezes e a carga só falharia no índice único, com a tabela já esvaziada.
+        """
+        periodos = sorted((p, f) for f in files if (p := cls.file_period(f)) is not None)
+        fim, ultimo = 0, None
+        for (inicio, termino), f in periodos:
+            if inicio <= fim:
+                raise ValueError(f"Arquivos com períodos sobrepostos: {Path(ultimo).name} e {Path(f).name}. "
+                                 f"Remova um deles ou use --incremental (upsert pela chave da cotação).")
+            if termino > fim:
+                fim, ultimo = termino, f
+
+    def backfill(self, source, workers: int = None, incremental: bool = False, chunk_records: int = None):
+        """
+        Ingestão de vários arquivos em paralelo: o parse roda num pool de processos (faixas de bytes
+        alinhadas aos registros, inclusive dentro de um mesmo arquivo) e um único escritor grava no banco.
+        Os .ZIP são antes descompactados em streaming para TXTs temporários, divididos da mesma forma.
+        Devolve as estatísticas por arquivo (tempo e registros/s).
+        """
+        workers = workers or settings.ETL_WORKERS or os.cpu_count() or 1
+        # O teto de memória é dividido entre os processos em voo
+        chunk_records = chunk_records or max(1_000, self.chunk_records() // workers)
+
+        files = self.resolve_files(source)
+        fingerprints = {f: self.manifest.fingerprint(f) for f in files}
+        if incremental:
+            files = [f for f in files if not self.manifest.is_ingested(fingerprints[f])]
+        if not files:
+            print(f"Nenhum arquivo novo para processar em: {source}")
+            return []
+        if not incremental:
+            # Antes de esvaziar a tabela e o manifesto: nada é apagado se a carga não puder terminar
+            self.check_overlaps(files)
+
+        filtros = (list(MarketConstants.ALLOWED_BDI_CODES), MarketConstants.DEFAULT_MIN_VOLUME)
+        em_voo = {}
+        gravados_total = 0
+
+        with tempfile.TemporaryDirectory(prefix="cotahist_") as temporario, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            # .ZIP não tem acesso aleatório: cada um é descompactado em streaming para um TXT temporário
+            # (em paralelo, memória constante) e dividido em faixas como os demais
+            zips = [f for f in files if zipfile.is_zipfile(f)]
+            destinos = [str(Path(temporario) / f"{i}_{Path(f).stem}.TXT") for i, f in enumerate(zips)]
+            origens = {f: f for f in files}
+            origens.update(zip(zips, pool.map(extract_task, zips, destinos)))
+
+            tasks = [(f, start, end) for f in files for start, end in self.parser.split_ranges(origens[f], chunk_records)]
+            stats = {f: {"arquivo": f, "tarefas": 0, "lidos": 0, "gravados": 0, "inicio": None,
+                         "data_min": None, "data_max": None} for f in files}
+            for f, _, _ in tasks:
+                stats[f]["tarefas"] += 1
+
+            print(f"Backfill: {len(files)} arquivos ({len(zips)} descompactados), {len(tasks)} faixas, "
+                  f"{workers} processos")
+            etapas = self.stage_totals()
+            self._begin(incremental)
+            inicio_total = time.perf_counter()
+            pendentes = iter(tasks)
+
+            def submit_next():
+                task = next(pendentes, None)
+                if task is None:
+                    return
+                f, start, end = task
+                if stats[f]["inicio"] is None:
+                    stats[f]["inicio"] = time.perf_counter()
+                em_voo[pool.submit(parse_task, origens[f], start, end, *filtros)] = f
+
+            # Janela limitada de tarefas em voo: a memória não cresce com o número de arquivos
+            for _ in range(workers * 2):
+                submit_next()
+
+            while em_voo:
+                done, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+                for future in done:
+                    f = em_voo.pop(future)
+                    lidos, colunas = future.result()
+                    st = stats[f]
+                    st["lidos"] += lidos
+                    if len(colunas["ticker"]):
+                        st["data_min"] = min(int(colunas["data_pregao"].min()), st["data_min"] or np.iinfo(np.int32).max)
+                        st["data_max"] = max(int(colunas["data_pregao"].max()), st["data_max"] or 0)
+                    st["gravados"] += self._write(colunas, incremental)
+                    st["tarefas"] -= 1
+
+                    if st["tarefas"] == 0:
+                        st["segundos"] = time.perf_counter() - st.pop("inicio")
+                        st["registros_por_segundo"] = st["lidos"] / st["segundos"] if st["segundos"] else 0.0
+                        self._record(fingerprints[f], st.pop("data_min"), st.pop("data_max"), st["gravados"])
+                        gravados_total += st["gravados"]
+                        print(f"{Path(f).name}: {st['lidos']} lidos, {st['gravados']} gravados em "
+                              f"{st['segundos']:.1f}s ({st['registros_por_segundo']:,.0f} registros/s)")
+                    submit_next()
+
+        self._finish(incremental, gravados_total)
+        segundos = time.perf_counter() - inicio_total
+        print(f"Backfill concluído: {gravados_total} registros gravados em {segundos:.1f}s")
+        # Leitura e parse acontecem nos processos do pool: aqui só as etapas do processo escritor
+        print(self.stage_summary(etapas))
+        return [{k: v for k, v in st.items() if k != "tarefas"} for st in stats.values()]
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="ETL do COTAHIST da B3.")
+    ap.add_argument("arquivo", nargs="?", default=settings.B3_DATA_FILE, help="TXT ou ZIP (padrão: B3_FILE_PATH)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Upsert por (data_pregao, ticker, cod_bdi) em vez de recriar a tabela")
+    ap.add_argument("--backfill", metavar="ORIGEM",
+                    help="Diretório ou padrão glob de arquivos COTAHIST, processados em paralelo")
+    ap.add_argument("--workers", type=int, default=None, help="Processos do backfill (padrão: ETL_WORKERS)")
+    ap.add_argument("--ajustes", action="store_true",
+                    help="Apenas reaplica o CSV de eventos corporativos (CORPORATE_ACTIONS_PATH)")
+    args = ap.parse_args()
+
+    setup_logging()
     processor = B3ETLProcessor()
-    processor.import_raw_file(settings.B3_DATA_FILE)
\ No newline at end of file
+    if args.ajustes:
+        processor.apply_adjustments()
+    elif args.backfill:
+        processor.backfill(args.backfill, workers=args.workers, incremental=args.incremental)
+    else:
+        processor.import_raw_file(args.arquivo, incremental=args.incremental)
\ No newline at end of file
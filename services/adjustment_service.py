@@ -0,0 +1,165 @@
+# services/adjustment_service.py
+import hashlib
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from core.database import db_manager
+from core.constants import CacheConstants, AdjustmentConfig
+from core.config import settings
+
+class AdjustmentService:
+    """
+    Ajuste de preços por eventos corporativos lidos de um CSV local.
+    Os fatores saem de um produto acumulado de trás para frente, vetorizado para todos os tickers,
+    e só são recalculados para tickers cujos eventos mudaram ou que têm cotações ainda sem ajuste.
+    """
+
+    TABLE = CacheConstants.TABLE_ADJUSTMENTS
+    # Posições de data no código combinado ticker/data (datas AAAAMMDD têm 8 dígitos)
+    KEY_SHIFT = 10 ** 8
+
+    def __init__(self, events_file=None):
+        self.events_file = Path(events_file or settings.CORPORATE_ACTIONS_FILE)
+        # Nos bancos SQL a migração já cria a tabela; aqui cobre o backend Parquet
+        db_manager.execute_raw(f"""
+            CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                ticker VARCHAR(12) PRIMARY KEY,
+                assinatura VARCHAR(64) NOT NULL,
+                eventos INTEGER,
+                aplicado_em TEXT
+            )
+        """)
+
+    def load_events(self) -> pd.DataFrame:
+        """Eventos do CSV normalizados (ticker maiúsculo, data_ex int AAAAMMDD), ordenados por ticker e data."""
+        if not self.events_file.exists():
+            return pd.DataFrame({c: pd.Series(dtype=t) for c, t in
+                                 zip(AdjustmentConfig.CSV_COLUMNS, ["object", "int64", "object", "float64"])})
+
+        df = pd.read_csv(self.events_file, dtype={"ticker": str, "tipo": str})
+        faltantes = set(AdjustmentConfig.CSV_COLUMNS) - set(df.columns)
+        if faltantes:
+            raise ValueError(f"CSV de eventos sem as colunas: {', '.join(sorted(faltantes))}")
+
+        df = df[AdjustmentConfig.CSV_COLUMNS].copy()
+        df["ticker"] = df["ticker"].str.strip().str.upper()
+        df["tipo"] = df["tipo"].str.strip().str.lower()
+        invalidos = set(df["tipo"]) - set(AdjustmentConfig.EVENT_TYPES)
+        if invalidos:
+            raise ValueError(f"Tipos de evento inválidos: {', '.join(sorted(invalidos))}")
+        df["data_ex"] = pd.to_datetime(df["data_ex"]).dt.strftime("%Y%m%d").astype(np.int64)
+        df["valor"] = df["valor"].astype(float)
+        return df.sort_values(["ticker", "data_ex", "tipo"]).reset_index(drop=True)
+
+    @staticmethod
+    def signatures(events: pd.DataFrame) -> dict:
+        """Hash dos eventos de cada ticker: muda quando qualquer evento do ticker é incluído, removido ou alterado."""
+        return {
+            ticker: hashlib.sha256(grupo.to_csv(index=False).encode()).hexdigest()
+            for ticker, grupo in events.groupby("ticker", sort=False)
+        }
+
+    def _applied(self) -> dict:
+        df = db_manager.get_from_cache(f"SELECT ticker, assinatura FROM {self.TABLE}")
+        return dict(zip(df["ticker"], df["assinatura"])) if not df.empty else {}
+
+    @staticmethod
+    def _in_clause(tickers: list):
+        """Lista de parâmetros nomeados para um IN (...) (os tickers vêm de um arquivo externo)."""
+        params = {f"t{i}": t for i, t in enumerate(tickers)}
+        return ", ".join(f":{p}" for p in params), params
+
+    def pending_tickers(self, events: pd.DataFrame, assinaturas: dict, aplicadas: dict) -> list:
+        """Tickers a reajustar: eventos alterados ou cotações sem fator anteriores ao último evento."""
+        alterados = {t for t in assinaturas.keys() | aplicadas.keys() if assinaturas.get(t) != aplicadas.get(t)}
+
+        pendentes = set()
+        if not events.empty:
+            ultimo = events.groupby("ticker")["data_ex"].max()
+            clausula, params = self._in_clause(ultimo.index.tolist())
+            df = db_manager.get_from_cache(f"""
+                SELECT ticker, MIN(data_pregao) AS primeira FROM {CacheConstants.TABLE_HISTORICO}
+                WHERE {AdjustmentConfig.FACTOR_COLUMN} IS NULL AND ticker IN ({clausula})
+                GROUP BY ticker
+            """, params)
+            if not df.empty:
+                pendentes = set(df.loc[df["primeira"].to_numpy() < ultimo.reindex(df["ticker"]).to_numpy(), "ticker"])
+        return sorted(alterados | pendentes)
+
+    @classmethod
+    def compute_factors(cls, prices: pd.DataFrame, events: pd.DataFrame) -> np.ndarray:
+        """
+        Fator acumulado de cada linha (ticker, data_pregao, fechamento em centavos): produto dos fatores
+        de todos os eventos com data ex posterior ao pregão. Sem laço por ticker ou por evento.
+        """
+        universo, codigo = np.unique(prices["ticker"].to_numpy().astype(str), return_inverse=True)
+        datas = prices["data_pregao"].to_numpy().astype(np.int64)
+        ordem = np.lexsort((datas, codigo))
+        codigo_ord = codigo[ordem]
+        chave = codigo_ord * cls.KEY_SHIFT + datas[ordem]
+        fechamento = prices["fechamento"].to_numpy(dtype=float)[ordem]
+
+        ev = events[events["ticker"].isin(universo)]
+        ev_codigo = np.searchsorted(universo, ev["ticker"].to_numpy().astype(str))
+        # Último pregão antes da data ex: é nele (e em tudo antes) que o fator passa a valer
+        pos = np.searchsorted(chave, ev_codigo * cls.KEY_SHIFT + ev["data_ex"].to_numpy(), side="left") - 1
+        valido = (pos >= 0) & (codigo_ord[np.clip(pos, 0, None)] == ev_codigo)
+
+        tipo, valor = ev["tipo"].to_numpy(), ev["valor"].to_numpy(dtype=float)
+        anterior = fechamento[np.clip(pos, 0, None)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fator = np.select(
+                [np.isin(tipo, ["dividendo", "jcp"]), tipo == "desdobramento", tipo == "grupamento"],
+                [1.0 - valor * 100.0 / anterior, 1.0 / valor, valor],
+                default=1.0 / (1.0 + valor),  # bonificacao
+            )
+        # Provento maior que o preço (ou proporção inválida) não gera ajuste
+        valido &= np.isfinite(fator) & (fator > 0)
+
+        log_fator = np.zeros(len(chave))
+        np.add.at(log_fator, pos[valido], np.log(fator[valido]))
+
+        # Produto acumulado de trás para frente por ticker, como diferença de somas de logs sufixas
+        sufixo = np.append(np.cumsum(log_fator[::-1])[::-1], 0.0)
+        fim = np.searchsorted(codigo_ord, codigo_ord, side="right")
+        resultado = np.empty(len(chave))
+        resultado[ordem] = np.exp(sufixo[:-1] - sufixo[fim])
+        return resultado
+
+    def run(self) -> int:
+        """Etapa pós-ETL: aplica os eventos aos tickers pendentes. Devolve quantos tickers foram reajustados."""
+        events = self.load_events()
+        assinaturas = self.signatures(events)
+        aplicadas = self._applied()
+        tickers = self.pending_tickers(events, assinaturas, aplicadas)
+        if not tickers:
+            return 0
+
+        clausula, params = self._in_clause(tickers)
+        df = db_manager.get_from_cache(
+            f"SELECT * FROM {CacheConstants.TABLE_HISTORICO} WHERE ticker IN ({clausula}) ORDER BY ticker, data_pregao",
+            params,
+        )
+        if not df.empty:
+            fator = self.compute_factors(df, events)
+            df[AdjustmentConfig.FACTOR_COLUMN] = fator
+            for bruto, ajustado in AdjustmentConfig.ADJUSTED_COLUMNS.items():
+                df[ajustado] = df[bruto] * fator
+            # Linhas completas: no backend Parquet o upsert substitui a linha inteira
+            if not db_manager.upsert_to_cache(df, CacheConstants.TABLE_HISTORICO, CacheConstants.HISTORICO_KEY):
+                raise RuntimeError("Falha ao gravar preços ajustados")
+
+        registros = pd.DataFrame({
+            "ticker": [t for t in tickers if t in assinaturas],
+            "assinatura": [assinaturas[t] for t in tickers if t in assinaturas],
+        })
+        if not registros.empty:
+            registros["eventos"] = events.groupby("ticker").size().reindex(registros["ticker"]).to_numpy()
+            registros["aplicado_em"] = datetime.now().isoformat(timespec="seconds")
+            db_manager.upsert_to_cache(registros, self.TABLE, ["ticker"])
+        removidos = [t for t in tickers if t not in assinaturas and t in aplicadas]
+        if removidos:
+            clausula, params = self._in_clause(removidos)
+            db_manager.execute_raw(f"DELETE FROM {self.TABLE} WHERE ticker IN ({clausula})", params)
+        return len(tickers)
@@ -1,34 +1,69 @@
 # services/analysis_service.py
 import pandas as pd
 from core.database import db_manager
-from core.constants import CacheConstants
+from core.constants import CacheConstants, MarketConstants
 from core.config import settings
+from services.data_version import data_version
 
 class AnalysisService:
     def get_metrics(self, ticker: str):
-        """Retorna métricas calculadas, buscando no cache ou calculando na hora."""
+        """
+        Retorna as métricas pré-calculadas pelo ETL (consulta indexada por ticker e versão).
+        Usa a versão mais recente que não seja posterior à geração atual dos dados.
+        """
         ticker = ticker.upper()
-        # 1. Tenta buscar no cache
-        query_cache = f"SELECT * FROM {CacheConstants.TABLE_METRICS} WHERE ticker = :t"
-        cache = db_manager.get_from_cache(query_cache, {"t": ticker})
-        
-        if not cache.empty:
-            return cache.to_dict(orient="records")[0]
+        query = f"""
+            SELECT * FROM {CacheConstants.TABLE_METRICS}
+            WHERE ticker = :t AND versao <= :v
+            ORDER BY versao DESC LIMIT 1
+        """
+        cache = db_manager.get_from_cache(query, {"t": ticker, "v": data_version.current()})
+        if cache.empty:
+            return None
+        return cache.to_dict(orient="records")[0]
 
-        # 2. Se não houver cache, calcula (Exemplo simplificado)
-        from services.market_service import MarketService
-        df = MarketService().get_ticker_data(ticker)
-        
-        if df.empty: return None
+    def compute_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Estatísticas de todos os tickers numa única passada vetorizada (groupby).
+        Espera preços em centavos e as linhas ordenadas por ticker e data.
+        """
+        g = df.groupby("ticker", sort=False)
+        metrics = pd.DataFrame({
+            "media_fechamento": g["fechamento"].mean() / 100.0,
+            "maxima_periodo": g["maximo"].max() / 100.0,
+            "minima_periodo": g["minimo"].min() / 100.0,
+            "ultimo_fechamento": g["fechamento"].last() / 100.0,
+            # Volatilidade sobre o preço ajustado, sem os saltos de desdobramentos e proventos
+            "volatilidade": g["fechamento_ajustado" if "fechamento_ajustado" in df.columns else "fechamento"].std() / 100.0,
+            "volume_medio": g["volume"].mean().astype(float),
+            "sessoes": g.size(),
+        })
+        return metrics.reset_index()
 
-        metrics = {
-            "ticker": ticker,
-            "media_fechamento": float(df['fechamento'].mean()),
-            "maxima_periodo": float(df['maximo'].max()),
-            "volatilidade": float(df['fechamento'].std())
-        }
-        
-        # 3. Salva o novo cálculo no cache
-        db_manager.save_to_cache(pd.DataFrame([metrics]), CacheConstants.TABLE_METRICS, if_exists='append')
-        
-        return metrics
\ No newline at end of file
+    def precompute_metrics(self, versao: int = None) -> int:
+        """
+        Etapa em lote pós-ETL: calcula as métricas de todos os tickers líquidos e grava via upsert
+        por (ticker, versao). Versões anteriores são removidas no final. Devolve o número de tickers.
+        """
+        versao = data_version.current() if versao is None else versao
+        bdi_string = ", ".join([f"'{b}'" for b in MarketConstants.ALLOWED_BDI_CODES])
+        query = f"""
+            SELECT ticker, maximo, minimo, fechamento, volume,
+                   COALESCE(fechamento_aj, fechamento) AS fechamento_ajustado
+            FROM {CacheConstants.TABLE_HISTORICO}
+            WHERE ticker IN (
+                SELECT DISTINCT ticker FROM {CacheConstants.TABLE_HISTORICO}
+                WHERE volume >= :min_vol AND cod_bdi IN ({bdi_string})
+            )
+            ORDER BY ticker, data_pregao
+        """
+        df = db_manager.get_from_cache(query, {"min_vol": MarketConstants.DEFAULT_MIN_VOLUME})
+        if df.empty:
+            return 0
+
+        metrics = self.compute_metrics(df)
+        metrics.insert(1, "versao", versao)
+        if not db_manager.upsert_to_cache(metrics, CacheConstants.TABLE_METRICS, CacheConstants.METRICS_KEY):
+            raise RuntimeError("Falha ao gravar métricas pré-calculadas")
+        db_manager.execute_raw(f"DELETE FROM {CacheConstants.TABLE_METRICS} WHERE versao < :v", {"v": versao})
+        return len(metrics)
\ No newline at end of file
@@ -0,0 +1,117 @@
+# services/chart_cache.py
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from core.config import settings
+from services.data_version import data_version
+
+class ChartCache:
+    """
+    Cache em dois níveis (memória LRU e disco) dos gráficos já renderizados, endereçado por um hash
+    dos parâmetros do gráfico e da versão dos dados. Como um mesmo endereço sempre produz os mesmos
+    bytes, o hash também serve de ETag forte: a API responde 304 sem renderizar nem ler o disco.
+    O disco guarda uma pasta por versão (v{n}), compartilhada entre o ETL (pré-renderização) e a API.
+    """
+
+    def __init__(self, directory=None, max_bytes: int = None, version=None):
+        self.directory = Path(directory or settings.STATIC_DIR)
+        self.max_bytes = settings.CHART_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.version = version or data_version
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(versao: int, **params) -> str:
+        """Endereço do gráfico: hash estável dos parâmetros (em ordem de nome) e da versão."""
+        texto = "|".join(f"{k}={params[k]}" for k in sorted(params))
+        return hashlib.sha256(f"v{versao}|{texto}".encode()).hexdigest()[:32]
+
+    def path(self, versao: int, key: str, formato: str) -> Path:
+        return self.directory / f"v{versao}" / f"{key}.{formato}"
+
+    def _check_generation(self, versao: int):
+        if versao != self._generation:
+            self._items.clear()
+            self.bytes = 0
+            self._generation = versao
+
+    def get(self, versao: int, key: str, formato: str):
+        """(bytes, instante de gravação) do gráfico, da memória ou do disco; None se não existir."""
+        with self._lock:
+            self._check_generation(versao)
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item
+
+        arquivo = self.path(versao, key, formato)
+        try:
+            item = (arquivo.read_bytes(), arquivo.stat().st_mtime)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(versao, key, item)
+        return item
+
+    def put(self, versao: int, key: str, formato: str, conteudo: bytes):
+        """Grava no disco (troca atômica, leitores nunca veem arquivo pela metade) e na memória."""
+        arquivo = self.path(versao, key, formato)
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        temporario = arquivo.with_name(f"{arquivo.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporario.write_bytes(conteudo)
+        os.replace(temporario, arquivo)
+        item = (conteudo, time.time())
+        self._remember(versao, key, item)
+        return item
+
+    def _remember(self, versao: int, key: str, item: tuple):
+        size = len(item[0])
+        if self.max_bytes <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(versao)
+            anterior = self._items.pop(key, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[0])
+            self._items[key] = item
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, descartado = self._items.popitem(last=False)
+                self.bytes -= len(descartado[0])
+
+    def prune(self, manter: int):
+        """Remove do disco as pastas de versões anteriores a `manter` (a API pode ainda estar na anterior)."""
+        if not self.directory.exists():
+            return
+        for pasta in self.directory.glob("v*"):
+            numero = pasta.name[1:]
+            if pasta.is_dir() and numero.isdigit() and int(numero) < manter:
+                shutil.rmtree(pasta, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "itens": len(self._items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "geracao": self._generation,
+            }
+
+# Instância compartilhada pelo processo
+chart_cache = ChartCache()
@@ -0,0 +1,186 @@
+# services/chart_renderer.py
+import asyncio
+import io
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from core.constants import ChartConfig
+from core.config import settings
+from core.instrumentation import CHART_RENDER_SECONDS
+
+# rcParams são globais ao processo: só o salt do SVG é alterado, e sempre sob este lock
+_RC_LOCK = threading.Lock()
+
+class RendererBusy(Exception):
+    """Fila de renderização cheia (ou renderização acima do tempo limite): o cliente deve tentar depois."""
+
+def draw(spec: dict, x: np.ndarray, y: np.ndarray):
+    """
+    Monta a figura com a API orientada a objetos (Figure/Axes), sem o estado global do pyplot.
+    `x` são datas (datetime64[D]) e `y` os valores; `spec` traz ticker, tipo, rótulo e tamanho em pixels.
+    As cores do tema escuro são aplicadas explicitamente, em vez de plt.style.use.
+    O Matplotlib só é importado aqui: a API sobe sem ele e, com o pool, nem o carrega no processo principal.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    fig = Figure(figsize=(spec["largura"] / ChartConfig.DPI, spec["altura"] / ChartConfig.DPI),
+                 dpi=ChartConfig.DPI, facecolor=ChartConfig.FACE_COLOR)
+    ax = fig.subplots()
+
+    if spec["tipo"] == "volume":
+        # Barras ocupam 80% do intervalo típico entre pontos (que cresce quando a série é reduzida)
+        passo = np.median(np.diff(x).astype(float)) if len(x) > 1 else 1.0
+        ax.bar(x, y, width=0.8 * passo, color=ChartConfig.VOLUME_COLOR, alpha=0.7)
+    else:
+        ax.plot(x, y, color=ChartConfig.LINE_COLOR, linewidth=1.5)
+
+    locator = AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    ax.set_title(f"{spec['ticker']} - {spec['rotulo']}", color="white", fontsize=14, pad=20)
+    ax.set_facecolor(ChartConfig.FACE_COLOR)
+    ax.tick_params(colors="white")
+    for spine in ax.spines.values():
+        spine.set_color("white")
+    ax.grid(True, color=ChartConfig.GRID_COLOR, linestyle='--', alpha=0.3)
+    return fig
+
+def render_bytes(spec: dict, x: np.ndarray, y: np.ndarray) -> bytes:
+    """Desenha e serializa. Sem data nos metadados e com ids fixos no SVG: mesmos dados, mesmos bytes."""
+    import matplotlib
+    fig = draw(spec, x, y)
+    buf = io.BytesIO()
+    with _RC_LOCK, matplotlib.rc_context({"svg.hashsalt": "b3-insight"}):
+        fig.savefig(buf, format=spec["formato"], facecolor=fig.get_facecolor(),
+                    metadata={"Date": None} if spec["formato"] == "svg" else None)
+    return buf.getvalue()
+
+def _warm_up():
+    """Inicializador dos processos: carrega o Agg e as fontes antes da primeira requisição."""
+    render_bytes({"ticker": "", "rotulo": "", "tipo": "fechamento", "largura": 200, "altura": 100, "formato": "png"},
+                 np.array(["2024-01-01", "2024-01-02"], dtype="datetime64[D]"), np.zeros(2))
+
+def _pid() -> int:
+    return os.getpid()
+
+class ChartRenderer:
+    """
+    Pool dedicado de processos para o Matplotlib: a renderização não disputa o GIL nem as threads da API.
+    Recebe só arrays NumPy compactos (datas e valores). O número de renderizações aceitas ao mesmo tempo
+    (em execução + na fila) é limitado; acima disso RendererBusy, que a API devolve como 503 + Retry-After.
+    Com workers=0 renderiza na própria thread (mesmo limite), útil em testes e scripts.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None, timeout: float = None):
+        self.workers = settings.CHART_RENDER_WORKERS if workers is None else workers
+        self.max_pending = settings.CHART_RENDER_QUEUE if max_pending is None else max_pending
+        self.timeout = settings.CHART_RENDER_TIMEOUT if timeout is None else timeout
+        self._slots = threading.BoundedSemaphore(max(self.max_pending, 1))
+        self._lock = threading.Lock()
+        self._executor = None
+        self.rendered = 0
+        self.rejected = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: o processo da API tem threads, e fork com threads vivas não é seguro
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm_up,
+                )
+            return self._executor
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise RendererBusy()
+
+    def _submit(self, spec: dict, x: np.ndarray, y: np.ndarray):
+        try:
+            future = self._pool().submit(render_bytes, spec, x, y)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.shutdown()
+            raise
+        # A vaga só é devolvida quando o processo termina, mesmo se quem pediu desistir antes
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def render(self, spec: dict, x: np.ndarray, y: np.ndarray) -> bytes:
+        self._acquire()
+        inicio = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return self._done(render_bytes(spec, x, y), spec, "inline", inicio)
+            finally:
+                self._slots.release()
+
+        future = self._submit(spec, x, y)
+        try:
+            return self._done(future.result(timeout=self.timeout), spec, "pool", inicio)
+        except FutureTimeout:
+            future.cancel()
+            raise RendererBusy()
+        except BrokenProcessPool:
+            # Um processo morreu (ex.: falta de memória): o próximo pedido cria um pool novo
+            self.shutdown()
+            raise
+
+    async def render_async(self, spec: dict, x: np.ndarray, y: np.ndarray) -> bytes:
+        """Versão assíncrona de render: a rota aguarda o processo no event loop, sem ocupar uma thread."""
+        self._acquire()
+        inicio = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                return self._done(await asyncio.to_thread(render_bytes, spec, x, y), spec, "inline", inicio)
+            finally:
+                self._slots.release()
+
+        future = self._submit(spec, x, y)
+        try:
+            conteudo = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise RendererBusy()
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+        return self._done(conteudo, spec, "pool", inicio)
+
+    def warm_up(self) -> int:
+        """
+        Deixa a renderização pronta antes da primeira requisição: sobe os processos do pool (o inicializador
+        de cada um carrega o Matplotlib e as fontes) ou, sem pool, aquece na própria thread.
+        Devolve quantos processos responderam.
+        """
+        if self.workers <= 0:
+            _warm_up()
+            return 0
+        pool = self._pool()
+        futures = [pool.submit(_pid) for _ in range(self.workers)]
+        return len({f.result(timeout=self.timeout) for f in futures})
+
+    def _done(self, conteudo: bytes, spec: dict, modo: str, inicio: float) -> bytes:
+        CHART_RENDER_SECONDS.observe(time.perf_counter() - inicio, format=spec.get("formato", ""), mode=modo)
+        with self._lock:
+            self.rendered += 1
+        return conteudo
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending,
+                    "rendered": self.rendered, "rejected": self.rejected}
+
+# Instância compartilhada (o pool é criado na primeira renderização)
+chart_renderer = ChartRenderer()
@@ -1,49 +1,126 @@
-import matplotlib
-matplotlib.use('Agg')  
-import matplotlib.pyplot as plt
-import io
-from fastapi.responses import StreamingResponse
-from core.constants import ChartConfig
+import asyncio
+from core.constants import ChartConfig, SamplingConfig, CacheConstants, MarketConstants, ResponseConfig
+from core.database import db_manager
 from services.market_service import MarketService
+from services.chart_cache import ChartCache, chart_cache
+from services.chart_renderer import ChartRenderer, chart_renderer, draw
 from core.config import settings
 
 class ChartService:
-    def __init__(self):
+    def __init__(self, cache: ChartCache = None, renderer: ChartRenderer = None):
         self.market_service = MarketService()
+        self.cache = cache or chart_cache
+        self.renderer = renderer or chart_renderer
 
-    def generate_styled_chart(self, ticker: str, chart_type: str = "fechamento"):
-        df = self.market_service.get_ticker_data(ticker)
+    def chart_data(self, ticker: str, chart_type: str = "fechamento", ajustado: bool = False,
+                   inicio: str = None, fim: str = None, max_pontos: int = SamplingConfig.CHART_MAX_POINTS):
+        """(datas, valores) como arrays NumPy compactos, prontos para o processo de renderização; None se vazio."""
+        # Volume em barras agrega por faixa; linhas de preço usam LTTB
+        df = self.market_service.get_history(
+            ticker, inicio=inicio, fim=fim, max_pontos=max_pontos,
+            amostragem="ohlc" if chart_type == "volume" else "lttb", serie=chart_type, ajustado=ajustado,
+            campos=[chart_type] if chart_type in ResponseConfig.FIELDS else None,
+        )
         if df.empty or chart_type not in df.columns: return None
+        return df["data_pregao"].to_numpy(dtype="datetime64[D]"), df[chart_type].to_numpy(dtype=float)
 
-        plt.style.use(ChartConfig.STYLE)
-        fig, ax = plt.subplots(figsize=(10, 5), facecolor=ChartConfig.FACE_COLOR)
-        
+    @staticmethod
+    def chart_spec(ticker: str, chart_type: str = "fechamento", ajustado: bool = False, formato: str = "png",
+                   largura: int = ChartConfig.DEFAULT_WIDTH, altura: int = ChartConfig.DEFAULT_HEIGHT) -> dict:
         label = ChartConfig.ALLOWED_TYPES.get(chart_type, "Preço")
-        
-        if chart_type == "volume":
-            # Gráfico de barras para volume
-            ax.bar(df['data_pregao'], df[chart_type], color='#3b82f6', alpha=0.7)
-        else:
-            # Gráfico de linha para preços (fechamento/abertura)
-            ax.plot(df['data_pregao'], df[chart_type], color=ChartConfig.LINE_COLOR, linewidth=1.5)
-
-        ax.set_title(f"{ticker} - {label}", color="white", fontsize=14, pad=20)
-        
-        ax.set_facecolor(ChartConfig.FACE_COLOR)
-        ax.grid(True, color=ChartConfig.GRID_COLOR, linestyle='--', alpha=0.3)
-        
-        return fig
-
-    def create_streaming_response(self, fig, download=False, ticker="", chart_type=""):
-        """Transforma a figura em um fluxo de dados para o FastAPI."""
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', facecolor=fig.get_facecolor())
-        buf.seek(0)
-        plt.close(fig) # Importante: Libera memória
-
-        headers = {}
-        if download:
-            filename = f"chart_{ticker}_{chart_type}.png"
-            headers["Content-Disposition"] = f"attachment; filename={filename}"
-
-        return StreamingResponse(buf, media_type="image/png", headers=headers)
\ No newline at end of file
+        if ajustado and chart_type != "volume":
+            label = f"{label} (ajustado)"
+        return {"ticker": ticker, "tipo": chart_type, "rotulo": label,
+                "formato": formato, "largura": largura, "altura": altura}
+
+    def generate_styled_chart(self, ticker: str, chart_type: str = "fechamento", ajustado: bool = False,
+                              inicio: str = None, fim: str = None, max_pontos: int = SamplingConfig.CHART_MAX_POINTS,
+                              largura: int = ChartConfig.DEFAULT_WIDTH, altura: int = ChartConfig.DEFAULT_HEIGHT):
+        """Figura montada na própria thread (API orientada a objetos, sem pyplot)."""
+        dados = self.chart_data(ticker, chart_type, ajustado, inicio, fim, max_pontos)
+        if dados is None:
+            return None
+        return draw(self.chart_spec(ticker, chart_type, ajustado, largura=largura, altura=altura), *dados)
+
+    def chart_key(self, ticker: str, chart_type: str = "fechamento", ajustado: bool = False,
+                  inicio: str = None, fim: str = None, max_pontos: int = SamplingConfig.CHART_MAX_POINTS,
+                  formato: str = "png", largura: int = ChartConfig.DEFAULT_WIDTH,
+                  altura: int = ChartConfig.DEFAULT_HEIGHT):
+        """(versão dos dados, endereço no cache) do gráfico; o endereço é também o ETag da resposta."""
+        versao = self.cache.version.current()
+        chave = ChartCache.key(versao, ticker=ticker, tipo=chart_type, ajustado=ajustado, inicio=inicio, fim=fim,
+                               max_pontos=max_pontos, formato=formato, largura=largura, altura=altura)
+        return versao, chave
+
+    def get_chart(self, ticker: str, chart_type: str = "fechamento", ajustado: bool = False,
+                  inicio: str = None, fim: str = None, max_pontos: int = SamplingConfig.CHART_MAX_POINTS,
+                  formato: str = "png", largura: int = ChartConfig.DEFAULT_WIDTH,
+                  altura: int = ChartConfig.DEFAULT_HEIGHT, versao: int = None, chave: str = None):
+        """
+        (bytes, instante de gravação) do gráfico, renderizando só quando não está no cache.
+        Devolve None se o ativo não tiver dados.
+        """
+        if chave is None:
+            versao, chave = self.chart_key(ticker, chart_type, ajustado, inicio, fim, max_pontos,
+                                           formato, largura, altura)
+        item = self.cache.get(versao, chave, formato)
+        if item is not None:
+            return item
+
+        dados = self.chart_data(ticker, chart_type, ajustado, inicio, fim, max_pontos)
+        if dados is None:
+            return None
+        # Renderiza fora do processo da API; RendererBusy sobe até a rota (503)
+        spec = self.chart_spec(ticker, chart_type, ajustado, formato, largura, altura)
+        return self.cache.put(versao, chave, formato, self.renderer.render(spec, *dados))
+
+    async def get_chart_async(self, ticker: str, chart_type: str = "fechamento", ajustado: bool = False,
+                              inicio: str = None, fim: str = None, max_pontos: int = SamplingConfig.CHART_MAX_POINTS,
+                              formato: str = "png", largura: int = ChartConfig.DEFAULT_WIDTH,
+                              altura: int = ChartConfig.DEFAULT_HEIGHT, versao: int = None, chave: str = None):
+        """
+        Versão assíncrona de get_chart: cache e leitura dos dados rodam numa thread e a renderização
+        no pool é aguardada no event loop, sem prender uma thread do servidor.
+        """
+        if chave is None:
+            versao, chave = self.chart_key(ticker, chart_type, ajustado, inicio, fim, max_pontos,
+                                           formato, largura, altura)
+        item = await asyncio.to_thread(self.cache.get, versao, chave, formato)
+        if item is not None:
+            return item
+
+        dados = await asyncio.to_thread(self.chart_data, ticker, chart_type, ajustado, inicio, fim, max_pontos)
+        if dados is None:
+            return None
+        spec = self.chart_spec(ticker, chart_type, ajustado, formato, largura, altura)
+        conteudo = await self.renderer.render_async(spec, *dados)
+        return await asyncio.to_thread(self.cache.put, versao, chave, formato, conteudo)
+
+    @staticmethod
+    def top_liquid(top: int, sessoes: int = ChartConfig.PRERENDER_SESSIONS) -> list:
+        """Ativos de maior volume somado nos últimos `sessoes` pregões."""
+        bdi_string = ", ".join([f"'{b}'" for b in MarketConstants.ALLOWED_BDI_CODES])
+        tabela = CacheConstants.TABLE_HISTORICO
+        df = db_manager.get_from_cache(f"""
+            SELECT ticker, SUM(volume) AS volume_total FROM {tabela}
+            WHERE cod_bdi IN ({bdi_string})
+            AND data_pregao >= (
+                SELECT MIN(data_pregao) FROM (
+                    SELECT DISTINCT data_pregao FROM {tabela} ORDER BY data_pregao DESC LIMIT :sessoes
+                ) AS recentes
+            )
+            GROUP BY ticker ORDER BY volume_total DESC LIMIT :top
+        """, {"sessoes": sessoes, "top": top})
+        return df["ticker"].tolist() if not df.empty else []
+
+    def prerender(self, top: int = None) -> int:
+        """Etapa pós-ETL: renderiza os gráficos padrão (todos os tipos) dos ativos mais líquidos."""
+        top = settings.CHART_PRERENDER_TOP if top is None else top
+        if top <= 0:
+            return 0
+        renderizados = 0
+        for ticker in self.top_liquid(top):
+            for chart_type in ChartConfig.ALLOWED_TYPES:
+                if self.get_chart(ticker, chart_type) is not None:
+                    renderizados += 1
+        return renderizados
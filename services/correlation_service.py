@@ -0,0 +1,228 @@
+# services/correlation_service.py
+import json
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from core.database import db_manager
+from core.constants import CacheConstants, MarketConstants, CorrelationConfig
+from core.config import settings
+from core.schema import format_dates
+from services.data_version import data_version
+from services.screener_service import MarketMatrix
+
+class ReturnsMatrix:
+    """
+    Matriz densa (data x ticker) de log-retornos diários em float32, gerada pelo ETL e lida via memory-map.
+    Cada versão dos dados grava os próprios arquivos; um ponteiro JSON trocado atomicamente indica a vigente.
+    """
+
+    POINTER = "retornos.json"
+
+    def __init__(self, directory=None, version=None):
+        self.directory = Path(directory or settings.MATRIX_DIR)
+        self.version = version or data_version
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._loaded_version = None
+
+    def build(self, versao: int) -> int:
+        """Lê os fechamentos dos tickers líquidos numa consulta e publica a matriz. Devolve o nº de tickers."""
+        bdi_string = ", ".join([f"'{b}'" for b in MarketConstants.ALLOWED_BDI_CODES])
+        query = f"""
+            SELECT data_pregao, ticker, COALESCE(fechamento_aj, fechamento) AS fechamento
+            FROM {CacheConstants.TABLE_HISTORICO}
+            WHERE cod_bdi IN ({bdi_string})
+            AND ticker IN (
+                SELECT DISTINCT ticker FROM {CacheConstants.TABLE_HISTORICO}
+                WHERE volume >= :min_vol AND cod_bdi IN ({bdi_string})
+            )
+        """
+        df = db_manager.get_from_cache(query, {"min_vol": MarketConstants.DEFAULT_MIN_VOLUME})
+        if df.empty:
+            return 0
+
+        datas, i = np.unique(df["data_pregao"].to_numpy(), return_inverse=True)
+        tickers, j = np.unique(df["ticker"].to_numpy().astype(str), return_inverse=True)
+        fechamento = np.full((len(datas), len(tickers)), np.nan)
+        fechamento[i, j] = df["fechamento"].to_numpy(dtype=float)
+
+        # Retorno desde o último pregão negociado; dias sem negócio ficam NaN
+        with np.errstate(divide="ignore", invalid="ignore"):
+            retornos = np.diff(np.log(MarketMatrix.ffill(fechamento)), axis=0)
+        retornos[np.isnan(fechamento[1:])] = np.nan
+
+        self.publish(versao, datas[1:], tickers, retornos)
+        return len(tickers)
+
+    def publish(self, versao: int, datas: np.ndarray, tickers: np.ndarray, retornos: np.ndarray):
+        """Grava matriz e índice com nomes próprios da versão e só então troca o ponteiro (os.replace)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        nome = f"retornos_v{versao}"
+
+        tmp = self.directory / f".{nome}.npy.tmp"
+        matriz = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=retornos.shape)
+        matriz[:] = retornos
+        matriz.flush()
+        del matriz
+        os.replace(tmp, self.directory / f"{nome}.npy")
+
+        tmp = self.directory / f".{nome}.npz.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, datas=datas, tickers=tickers)
+        os.replace(tmp, self.directory / f"{nome}.npz")
+
+        tmp = self.directory / f".{self.POINTER}.tmp"
+        tmp.write_text(json.dumps({"versao": int(versao), "nome": nome, "formato": list(retornos.shape)}))
+        os.replace(tmp, self.directory / self.POINTER)
+
+        # Versões antigas podem ser apagadas: leitores com o mmap aberto mantêm o arquivo vivo
+        for antigo in self.directory.glob("retornos_v*.np[yz]"):
+            if antigo.stem != nome:
+                antigo.unlink(missing_ok=True)
+
+    def load(self):
+        """(datas, tickers, matriz memmap, posição por ticker) da versão vigente, ou None se ainda não publicada."""
+        versao = (self.version.current(), self.directory)
+        with self._lock:
+            if self._loaded is not None and self._loaded_version == versao:
+                return self._loaded
+            ponteiro = self.directory / self.POINTER
+            if not ponteiro.exists():
+                return None
+            info = json.loads(ponteiro.read_text())
+            # Entre o incremento da versão e a publicação da nova matriz o ponteiro ainda é o da anterior:
+            # nada é guardado, senão a matriz antiga seria servida como a da nova versão até a próxima carga
+            if info["versao"] != versao[0]:
+                return None
+            nome = info["nome"]
+            matriz = np.load(self.directory / f"{nome}.npy", mmap_mode="r")
+            with np.load(self.directory / f"{nome}.npz") as indice:
+                datas, tickers = indice["datas"], indice["tickers"]
+            posicao = {t: k for k, t in enumerate(tickers.tolist())}
+            self._loaded = (datas, tickers, matriz, posicao)
+            self._loaded_version = versao
+            return self._loaded
+
+class RollingCorrelation:
+    """
+    Correlação móvel incremental: mantém as somas da janela (pares com ambos os valores válidos)
+    e, a cada pregão, soma a linha que entra e subtrai a que sai, em O(k²) por passo.
+    """
+
+    def __init__(self, k: int):
+        self.n = np.zeros((k, k))
+        self.sa = np.zeros((k, k))
+        self.saa = np.zeros((k, k))
+        self.sab = np.zeros((k, k))
+
+    @staticmethod
+    def moments(x: np.ndarray):
+        """Somas por par numa janela inteira (n, Σa, Σa², Σab), via produtos matriciais (BLAS)."""
+        m = (~np.isnan(x)).astype(np.float64)
+        x0 = np.nan_to_num(x.astype(np.float64))
+        return m.T @ m, x0.T @ m, (x0 * x0).T @ m, x0.T @ x0
+
+    def _apply(self, row: np.ndarray, sign: float):
+        m = (~np.isnan(row)).astype(np.float64)
+        x0 = np.nan_to_num(row.astype(np.float64))
+        self.n += sign * np.outer(m, m)
+        self.sa += sign * np.outer(x0, m)
+        self.saa += sign * np.outer(x0 * x0, m)
+        self.sab += sign * np.outer(x0, x0)
+
+    def add(self, row: np.ndarray):
+        self._apply(row, 1.0)
+
+    def remove(self, row: np.ndarray):
+        self._apply(row, -1.0)
+
+    def correlation(self) -> np.ndarray:
+        return CorrelationService.finalize(self.n, self.sa, self.saa, self.sab)[0]
+
+class CorrelationService:
+    """Correlação e covariância entre tickers sobre a matriz de retornos pré-calculada."""
+
+    def __init__(self, matrix: ReturnsMatrix = None):
+        self.matrix = matrix or returns_matrix
+
+    @staticmethod
+    def finalize(n, sa, saa, sab):
+        """Correlação e covariância (amostral) de pares completos a partir das somas da janela."""
+        sb, sbb = sa.T, saa.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = (sab - sa * sb / n) / (n - 1)
+            var_a = saa - sa * sa / n
+            var_b = sbb - sb * sb / n
+            corr = (sab - sa * sb / n) / np.sqrt(var_a * var_b)
+        poucos = n < CorrelationConfig.MIN_OBSERVATIONS
+        cov[poucos] = np.nan
+        corr[poucos] = np.nan
+        return np.clip(corr, -1.0, 1.0), cov
+
+    def _select(self, tickers: list):
+        carregada = self.matrix.load()
+        if carregada is None:
+            return None
+        datas, todos, matriz, posicao = carregada
+        if not tickers:
+            tickers = todos.tolist()
+        encontrados = [t for t in tickers if t in posicao]
+        ausentes = [t for t in tickers if t not in posicao]
+        colunas = np.array([posicao[t] for t in encontrados], dtype=np.int64)
+        return datas, matriz, encontrados, ausentes, colunas
+
+    def correlation(self, tickers: list, janela: int) -> dict:
+        """Matrizes de correlação e covariância dos retornos nas últimas `janela` sessões."""
+        selecao = self._select(tickers)
+        if selecao is None:
+            return None
+        datas, matriz, encontrados, ausentes, colunas = selecao
+        if len(encontrados) < 2:
+            return {"tickers": encontrados, "ausentes": ausentes}
+
+        x = np.asarray(matriz[-janela:][:, colunas])
+        corr, cov = self.finalize(*RollingCorrelation.moments(x))
+        periodo = format_dates(datas[[-len(x), -1]])
+        return {
+            "tickers": encontrados, "ausentes": ausentes,
+            "data_inicio": periodo[0], "data_fim": periodo[1],
+            "correlacao": corr, "covariancia": cov,
+        }
+
+    def rolling(self, tickers: list, janela: int, pontos: int) -> dict:
+        """Série da correlação móvel de cada par nas últimas `pontos` sessões (atualização incremental)."""
+        selecao = self._select(tickers)
+        if selecao is None:
+            return None
+        datas, matriz, encontrados, ausentes, colunas = selecao
+        if len(encontrados) < 2:
+            return {"tickers": encontrados, "ausentes": ausentes}
+
+        total = len(datas)
+        pontos = max(1, min(pontos, total - janela + 1))
+        inicio = total - pontos - janela + 1
+        x = np.asarray(matriz[max(inicio, 0):][:, colunas])
+        deslocamento = max(inicio, 0) - inicio
+
+        estado = RollingCorrelation(len(encontrados))
+        for t in range(janela - deslocamento - 1):
+            estado.add(x[t])
+
+        a, b = np.triu_indices(len(encontrados), k=1)
+        series = np.empty((pontos, len(a)))
+        for p in range(pontos):
+            t = p + janela - deslocamento - 1
+            estado.add(x[t])
+            if t - janela >= 0:
+                estado.remove(x[t - janela])
+            series[p] = estado.correlation()[a, b]
+
+        return {
+            "tickers": encontrados, "ausentes": ausentes,
+            "datas": format_dates(datas[-pontos:]).tolist(),
+            "pares": {f"{encontrados[i]}|{encontrados[j]}": series[:, k] for k, (i, j) in enumerate(zip(a, b))},
+        }
+
+# Instância compartilhada (o memory-map é aberto uma vez por versão dos dados)
+returns_matrix = ReturnsMatrix()
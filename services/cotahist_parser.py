@@ -0,0 +1,243 @@
+# services/cotahist_parser.py
+import mmap
+import shutil
+import zipfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from core.constants import B3Layout
+from core.schema import format_dates
+from core.instrumentation import ETL_STAGE_SECONDS
+
+class CotahistParser:
+    """
+    Parser de largura fixa para o COTAHIST.
+    Lê o arquivo como bytes e fatia as posições do B3Layout direto em arrays NumPy tipados.
+    """
+
+    # Tipos de saída dos campos numéricos
+    DTYPES = {
+        "tipo_registro": np.int8,
+        "data_pregao": np.int32,
+        "abertura": np.int64,
+        "maximo": np.int64,
+        "minimo": np.int64,
+        "medio": np.int64,
+        "fechamento": np.int64,
+        "qtd_titulos": np.int64,
+        "volume": np.int64,
+    }
+
+    def __init__(self):
+        layout = B3Layout.LAYOUT
+        self.fields = list(zip(layout["names"], layout["colspecs"]))
+
+    def detect_stride(self, data) -> int:
+        """Descobre o tamanho do registro incluindo a quebra de linha (LF ou CRLF)."""
+        head = bytes(data[:B3Layout.RECORD_LENGTH + 2])
+        end = head.find(b"\n")
+        if end < 0:
+            raise ValueError("Arquivo COTAHIST inválido: nenhuma quebra de linha encontrada.")
+        if end not in (B3Layout.RECORD_LENGTH, B3Layout.RECORD_LENGTH + 1):
+            raise ValueError(f"Arquivo COTAHIST inválido: registro com {end} posições.")
+        return end + 1
+
+    def parse_bytes(self, data, stride: int = None) -> dict:
+        """
+        Converte o conteúdo bruto em colunas NumPy, mantendo apenas registros de cotação.
+        Datas saem como int32 (AAAAMMDD), preços como int64 em centavos e textos como bytes de largura fixa.
+        """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        if buf.size == 0:
+            return self.empty_columns()
+
+        stride = stride or self.detect_stride(buf)
+        n_records, rest = divmod(buf.size, stride)
+        records = buf[:n_records * stride].reshape(n_records, stride)
+
+        if n_records and not (records[:, stride - 1] == ord("\n")).all():
+            raise ValueError("Arquivo COTAHIST inválido: registros desalinhados.")
+
+        columns = self._extract(records)
+
+        # Último registro sem quebra de linha (o que sobrar abaixo disso é lixo de EOF)
+        if rest >= B3Layout.RECORD_LENGTH:
+            tail = bytes(buf[n_records * stride:n_records * stride + B3Layout.RECORD_LENGTH])
+            tail = tail + b"\n".rjust(stride - B3Layout.RECORD_LENGTH, b"\r")
+            columns = self.concat([columns, self._extract(np.frombuffer(tail, dtype=np.uint8).reshape(1, stride))])
+
+        return columns
+
+    def parse_file(self, file_path) -> dict:
+        """Lê o arquivo via mmap (sem cópia para a memória do processo) e devolve as colunas."""
+        if zipfile.is_zipfile(file_path):
+            partes = list(self.iter_chunks(file_path))
+            return self.concat(partes) if partes else self.empty_columns()
+        with open(file_path, "rb") as f:
+            if f.seek(0, 2) == 0:
+                return self.empty_columns()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return self.parse_bytes(mm)
+
+    @contextmanager
+    def open_source(self, file_path):
+        """Abre o TXT ou o .ZIP distribuído pela B3, descompactando em streaming (sem extrair em disco)."""
+        if not zipfile.is_zipfile(file_path):
+            with open(file_path, "rb") as f:
+                yield f
+            return
+
+        with zipfile.ZipFile(file_path) as zf:
+            membros = [m for m in zf.infolist() if not m.is_dir()]
+            if not membros:
+                raise ValueError(f"Arquivo ZIP sem COTAHIST: {file_path}")
+            # Os pacotes da B3 trazem um único TXT; priorizamos .TXT se houver mais de um membro
+            membro = next((m for m in membros if m.filename.upper().endswith(".TXT")), membros[0])
+            with zf.open(membro) as f:
+                yield f
+
+    def iter_chunks(self, file_path, chunk_records: int = 100_000):
+        """
+        Lê o arquivo em blocos de `chunk_records` registros alinhados ao tamanho do registro.
+        A memória de pico depende do tamanho do bloco, não do tamanho do arquivo.
+        """
+        with self.open_source(file_path) as f:
+            pending = f.read(B3Layout.RECORD_LENGTH + 2)
+            if not pending:
+                return
+            stride = self.detect_stride(pending)
+            chunk_bytes = chunk_records * stride
+
+            while True:
+                with ETL_STAGE_SECONDS.time(stage="read"):
+                    block = f.read(chunk_bytes - len(pending))
+                if not block:
+                    if pending:
+                        with ETL_STAGE_SECONDS.time(stage="parse"):
+                            columns = self.parse_bytes(pending, stride)
+                        yield columns
+                    return
+                data = pending + block
+                usable = len(data) // stride * stride
+                with ETL_STAGE_SECONDS.time(stage="parse"):
+                    columns = self.parse_bytes(data[:usable], stride)
+                yield columns
+                pending = data[usable:]
+
+    def extract_member(self, file_path, destino, block_bytes: int = 1024 * 1024) -> str:
+        """Descompacta o TXT do .ZIP em `destino` em blocos de `block_bytes` (memória constante)."""
+        with self.open_source(file_path) as f, open(destino, "wb") as out:
+            with ETL_STAGE_SECONDS.time(stage="read"):
+                shutil.copyfileobj(f, out, block_bytes)
+        return str(destino)
+
+    def split_ranges(self, file_path, chunk_records: int) -> list:
+        """
+        Divide um TXT em faixas de bytes alinhadas ao início dos registros, para parse em paralelo.
+        Arquivos .ZIP não permitem acesso aleatório: são descompactados antes (extract_member).
+        """
+        if zipfile.is_zipfile(file_path):
+            raise ValueError(f"Faixas exigem o TXT; descompacte antes com extract_member: {file_path}")
+        with open(file_path, "rb") as f:
+            size = f.seek(0, 2)
+            f.seek(0)
+            if size == 0:
+                return []
+            stride = self.detect_stride(f.read(B3Layout.RECORD_LENGTH + 2))
+        step = chunk_records * stride
+        return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+    def parse_range(self, file_path, start=None, end=None) -> dict:
+        """Lê apenas a faixa [start, end) do arquivo (ou o arquivo inteiro se a faixa for None)."""
+        if start is None:
+            return self.parse_file(file_path)
+        with open(file_path, "rb") as f:
+            stride = self.detect_stride(f.read(B3Layout.RECORD_LENGTH + 2))
+            f.seek(start)
+            return self.parse_bytes(f.read(end - start), stride)
+
+    @staticmethod
+    def filter_columns(columns: dict, bdi_codes, min_volume: float) -> dict:
+        """Mantém apenas os registros dos códigos BDI permitidos e com volume mínimo."""
+        codes = [c.strip().encode() for c in bdi_codes]
+        mask = np.isin(columns["cod_bdi"], codes) & (columns["volume"] >= min_volume)
+        return {name: values[mask] for name, values in columns.items()}
+
+    def _extract(self, records: np.ndarray) -> dict:
+        # Descarta header/trailer pelo tipo de registro (em vez de skiprows/skipfooter)
+        tipo = B3Layout.TIPO_COTACAO.encode()
+        idx = np.flatnonzero((records[:, 0] == tipo[0]) & (records[:, 1] == tipo[1]))
+
+        columns = {}
+        for name, (start, end) in self.fields:
+            block = records[idx, start:end]
+            if name in B3Layout.TEXT_COLUMNS:
+                columns[name] = np.ascontiguousarray(block).view(f"S{end - start}").ravel()
+            else:
+                columns[name] = self._digits(block, self.DTYPES[name])
+        return columns
+
+    @staticmethod
+    def _digits(block: np.ndarray, dtype) -> np.ndarray:
+        """Converte um bloco (n x largura) de dígitos ASCII em inteiros, uma passada por posição."""
+        out = np.zeros(block.shape[0], dtype=dtype)
+        for j in range(block.shape[1]):
+            out *= 10
+            out += block[:, j].astype(dtype) - 48
+        return out
+
+    def empty_columns(self) -> dict:
+        columns = {}
+        for name, (start, end) in self.fields:
+            dtype = f"S{end - start}" if name in B3Layout.TEXT_COLUMNS else self.DTYPES[name]
+            columns[name] = np.empty(0, dtype=dtype)
+        return columns
+
+    @staticmethod
+    def concat(parts: list) -> dict:
+        """Concatena vários lotes de colunas em um só."""
+        return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+    @staticmethod
+    def decode_text(values: np.ndarray) -> np.ndarray:
+        """Decodifica bytes de largura fixa para str, decodificando cada valor distinto uma única vez."""
+        uniq, inverse = np.unique(values, return_inverse=True)
+        decoded = np.array([v.decode(B3Layout.ENCODING).strip() for v in uniq], dtype=object)
+        return decoded[inverse]
+
+    def to_storage_frame(self, columns: dict) -> pd.DataFrame:
+        """Monta o DataFrame no formato do schema (datas int AAAAMMDD, preços int em centavos)."""
+        data = {}
+        for name in B3Layout.LAYOUT["names"]:
+            values = columns[name]
+            data[name] = self.decode_text(values) if name in B3Layout.TEXT_COLUMNS else values
+        return pd.DataFrame(data)
+
+    def to_dataframe(self, columns: dict) -> pd.DataFrame:
+        """Monta o DataFrame para exibição (datas ISO e preços em reais)."""
+        data = {}
+        for name in B3Layout.LAYOUT["names"]:
+            values = columns[name]
+            if name in B3Layout.TEXT_COLUMNS:
+                values = self.decode_text(values)
+            elif name == "data_pregao":
+                values = format_dates(values)
+            elif name in B3Layout.PRICE_COLUMNS:
+                values = values / 100.0
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def extract_task(file_path, destino):
+    """Unidade de trabalho do backfill para .ZIP: descompacta o TXT num arquivo temporário e devolve o caminho."""
+    return CotahistParser().extract_member(file_path, destino)
+
+def parse_task(file_path, start, end, bdi_codes, min_volume):
+    """
+    Unidade de trabalho dos processos do backfill: lê uma faixa e já devolve só os registros filtrados,
+    para que o processo escritor receba o mínimo de dados possível.
+    """
+    parser = CotahistParser()
+    colunas = parser.parse_range(file_path, start, end)
+    lidos = len(colunas["ticker"])
+    return lidos, parser.filter_columns(colunas, bdi_codes, min_volume)
@@ -0,0 +1,64 @@
+# services/data_version.py
+import time
+import threading
+from datetime import datetime
+import pandas as pd
+from core.database import db_manager
+from core.constants import CacheConstants
+from core.config import settings
+
+class DataVersion:
+    """
+    Contador de geração dos dados, incrementado pelo ETL a cada gravação em cotacoes_historicas.
+    Caches da API comparam a geração para nunca servir dados de antes de uma recarga.
+    """
+
+    TABLE = CacheConstants.TABLE_DATA_VERSION
+
+    def __init__(self, poll_seconds: float = None):
+        self.poll_seconds = settings.DATA_VERSION_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self._lock = threading.Lock()
+        self._ready = False
+        self._cached = 0
+        self._checked_at = 0.0
+
+    def _ensure_table(self, force: bool = False):
+        if force or not self._ready:
+            db_manager.execute_raw(f"""
+                CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                    versao BIGINT PRIMARY KEY,
+                    atualizado_em TEXT NOT NULL
+                )
+            """)
+            self._ready = True
+
+    def _read(self) -> int:
+        df = db_manager.get_from_cache(f"SELECT MAX(versao) AS versao FROM {self.TABLE}")
+        valor = df["versao"].iloc[0] if "versao" in df.columns and len(df) else None
+        return int(valor) if pd.notna(valor) else 0
+
+    def current(self) -> int:
+        """Geração atual; consulta o banco no máximo uma vez a cada `poll_seconds`."""
+        agora = time.monotonic()
+        with self._lock:
+            if self._checked_at and agora - self._checked_at < self.poll_seconds:
+                return self._cached
+            self._ensure_table()
+            self._cached = self._read()
+            self._checked_at = agora
+            return self._cached
+
+    def bump(self) -> int:
+        """Publica uma nova geração (chamado pelo ETL depois de gravar)."""
+        with self._lock:
+            self._ensure_table(force=True)
+            nova = self._read() + 1
+            db_manager.execute_raw(
+                f"INSERT INTO {self.TABLE} (versao, atualizado_em) VALUES (:v, :t)",
+                {"v": nova, "t": datetime.now().isoformat(timespec="seconds")},
+            )
+            self._cached, self._checked_at = nova, time.monotonic()
+            return nova
+
+# Instância compartilhada pelo processo
+data_version = DataVersion()
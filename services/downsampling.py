@@ -0,0 +1,87 @@
+# services/downsampling.py
+import numpy as np
+import pandas as pd
+
+class Downsampler:
+    """
+    Redução de séries longas para o número de pontos que cabe na tela.
+    Linhas usam Largest-Triangle-Three-Buckets (preserva picos e vales com pontos reais);
+    candles e volume usam agregação OHLC por faixa de pregões.
+    """
+
+    @staticmethod
+    def bucket_edges(n: int, buckets: int) -> np.ndarray:
+        """Limites de `buckets` faixas contíguas e de tamanho quase igual sobre n pontos."""
+        return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+    @classmethod
+    def lttb_indices(cls, y: np.ndarray, max_pontos: int) -> np.ndarray:
+        """
+        Índices escolhidos pelo LTTB (x = posição do pregão). O primeiro e o último ponto são mantidos;
+        em cada faixa intermediária fica o ponto que forma o maior triângulo com o escolhido na faixa
+        anterior e a média da faixa seguinte. As médias e a área de cada faixa são vetorizadas;
+        só a cadeia entre faixas (cada escolha depende da anterior) é sequencial.
+        """
+        y = np.asarray(y, dtype=float)
+        n = len(y)
+        if max_pontos >= n:
+            return np.arange(n)
+        if max_pontos < 3:
+            return np.array([0, n - 1])[:max(max_pontos, 0)]
+
+        # Faixas internas sobre os pontos 1..n-2
+        edges = cls.bucket_edges(n - 2, max_pontos - 2) + 1
+        x = np.arange(n, dtype=float)
+        soma = np.concatenate([[0.0], np.cumsum(y)])
+        tamanhos = np.diff(edges)
+        # Média (x, y) de cada faixa, mais o último ponto como "faixa" seguinte da última
+        media_x = np.append((edges[:-1] + edges[1:] - 1) / 2.0, n - 1)
+        media_y = np.append((soma[edges[1:]] - soma[edges[:-1]]) / tamanhos, y[-1])
+
+        escolhidos = np.empty(max_pontos, dtype=np.int64)
+        escolhidos[0], escolhidos[-1] = 0, n - 1
+        a = 0
+        for i in range(max_pontos - 2):
+            inicio, fim = edges[i], edges[i + 1]
+            cx, cy = media_x[i + 1], media_y[i + 1]
+            area = np.abs((x[a] - cx) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (cy - y[a]))
+            a = inicio + int(np.argmax(area))
+            escolhidos[i + 1] = a
+        return escolhidos
+
+    @classmethod
+    def lttb(cls, df: pd.DataFrame, column: str, max_pontos: int) -> pd.DataFrame:
+        """Linhas (pregões reais, com todas as colunas) escolhidas pelo LTTB sobre `column`."""
+        if not max_pontos or len(df) <= max_pontos:
+            return df
+        return df.iloc[cls.lttb_indices(df[column].to_numpy(), max_pontos)].reset_index(drop=True)
+
+    @classmethod
+    def ohlc(cls, df: pd.DataFrame, max_pontos: int) -> pd.DataFrame:
+        """
+        Agrega faixas de pregões consecutivos num candle: abertura do primeiro, fechamento do último,
+        máxima/mínima da faixa e volumes somados. A data é a do último pregão da faixa.
+        """
+        if not max_pontos or len(df) <= max_pontos:
+            return df
+        edges = cls.bucket_edges(len(df), max_pontos)
+        inicio, fim = edges[:-1], edges[1:] - 1
+
+        # Demais colunas (texto, médio, etc.) seguem o último pregão da faixa
+        out = df.iloc[fim].reset_index(drop=True)
+        regras = {
+            "abertura": lambda v: v[inicio],
+            "maximo": lambda v: np.fmax.reduceat(v, inicio),
+            "minimo": lambda v: np.fmin.reduceat(v, inicio),
+            "volume": lambda v: np.add.reduceat(v, inicio),
+            "qtd_titulos": lambda v: np.add.reduceat(v, inicio),
+        }
+        for col, regra in regras.items():
+            if col in df.columns:
+                out[col] = regra(df[col].to_numpy())
+        if "medio" in df.columns and "qtd_titulos" in df.columns:
+            # Preço médio da faixa ponderado pela quantidade negociada
+            ponderado = np.add.reduceat((df["medio"] * df["qtd_titulos"]).to_numpy(dtype=float), inicio)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                out["medio"] = np.where(out["qtd_titulos"] > 0, ponderado / out["qtd_titulos"], out["medio"])
+        return out
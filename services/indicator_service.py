@@ -0,0 +1,188 @@
+# services/indicator_service.py
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from core.constants import IndicatorConfig
+from core.config import settings
+from services.market_service import MarketService
+from services.data_version import data_version
+
+class IndicatorEngine:
+    """
+    Indicadores técnicos vetorizados sobre um painel (tickers x pregões).
+    Cada linha é um ticker, alinhada à esquerda e completada com NaN; todas as contas
+    rodam sobre a matriz inteira, sem laço por ticker.
+    """
+
+    @staticmethod
+    def build_panel(frames: dict, columns: list):
+        """Empilha os históricos num painel 2D por coluna. Devolve (tickers, tamanhos, colunas)."""
+        tickers = list(frames)
+        lengths = np.array([len(frames[t]) for t in tickers], dtype=np.int64)
+        width = int(lengths.max()) if len(lengths) else 0
+        mask = np.arange(width) < lengths[:, None]
+
+        panel = {}
+        for col in columns:
+            matrix = np.full((len(tickers), width), np.nan)
+            # A ordem linha a linha da máscara coincide com a concatenação dos históricos
+            matrix[mask] = np.concatenate([frames[t][col].to_numpy(dtype=float) for t in tickers]) if tickers else []
+            panel[col] = matrix
+        return tickers, lengths, panel
+
+    @staticmethod
+    def _warmup(out: np.ndarray, n: int) -> np.ndarray:
+        out[:, :max(n, 0)] = np.nan
+        return out
+
+    @staticmethod
+    def rolling_sum(x: np.ndarray, w: int) -> np.ndarray:
+        """Soma móvel por diferença de somas acumuladas (O(n), independente da janela)."""
+        out = np.full_like(x, np.nan)
+        if w > x.shape[1]:
+            return out
+        c = np.concatenate([np.zeros((x.shape[0], 1)), np.cumsum(x, axis=1)], axis=1)
+        out[:, w - 1:] = c[:, w:] - c[:, :-w]
+        return out
+
+    @classmethod
+    def rolling_std(cls, x: np.ndarray, w: int, ddof: int = 0) -> np.ndarray:
+        # Centraliza cada linha no primeiro valor para reduzir o cancelamento numérico
+        base = np.nan_to_num(x[:, :1])
+        xc = x - base
+        s1 = cls.rolling_sum(xc, w)
+        s2 = cls.rolling_sum(xc * xc, w)
+        var = (s2 - s1 * s1 / w) / (w - ddof)
+        return np.sqrt(np.clip(var, 0.0, None))
+
+    @staticmethod
+    def smooth(x: np.ndarray, alpha: float) -> np.ndarray:
+        """Média exponencial recursiva (equivalente ao ewm(adjust=False)), vetorizada entre tickers."""
+        out = np.empty_like(x)
+        if x.shape[1] == 0:
+            return out
+        out[:, 0] = x[:, 0]
+        beta = 1.0 - alpha
+        for t in range(1, x.shape[1]):
+            out[:, t] = alpha * x[:, t] + beta * out[:, t - 1]
+        return out
+
+    @staticmethod
+    def wilder(x: np.ndarray, w: int) -> np.ndarray:
+        """Média de Wilder: semente na média simples das `w` primeiras observações, depois alpha = 1/w."""
+        out = np.full_like(x, np.nan)
+        if w > x.shape[1]:
+            return out
+        out[:, w - 1] = x[:, :w].mean(axis=1)
+        beta = 1.0 - 1.0 / w
+        for t in range(w, x.shape[1]):
+            out[:, t] = x[:, t] / w + beta * out[:, t - 1]
+        return out
+
+    @classmethod
+    def sma(cls, p: dict, w: int) -> dict:
+        return {"sma": cls.rolling_sum(p["fechamento"], w) / w}
+
+    @classmethod
+    def ema(cls, p: dict, w: int) -> dict:
+        return {"ema": cls._warmup(cls.smooth(p["fechamento"], 2.0 / (w + 1)), w - 1)}
+
+    @classmethod
+    def rsi(cls, p: dict, w: int) -> dict:
+        delta = np.diff(p["fechamento"], axis=1)
+        ganho = cls.wilder(np.clip(delta, 0.0, None), w)
+        perda = cls.wilder(np.clip(-delta, 0.0, None), w)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(perda == 0, 100.0, 100.0 - 100.0 / (1.0 + ganho / perda))
+        # Sem média (aquecimento ou além do fim do ativo no painel) não há RSI
+        rsi = np.where(np.isnan(ganho), np.nan, rsi)
+        return {"rsi": np.concatenate([np.full((rsi.shape[0], 1), np.nan), rsi], axis=1)}
+
+    @classmethod
+    def bollinger(cls, p: dict, w: int, k: float = IndicatorConfig.BOLLINGER_STD) -> dict:
+        media = cls.rolling_sum(p["fechamento"], w) / w
+        desvio = cls.rolling_std(p["fechamento"], w)
+        return {"bb_media": media, "bb_superior": media + k * desvio, "bb_inferior": media - k * desvio}
+
+    @classmethod
+    def atr(cls, p: dict, w: int) -> dict:
+        h, l, c = p["maximo"], p["minimo"], p["fechamento"]
+        anterior = np.concatenate([np.full((c.shape[0], 1), np.nan), c[:, :-1]], axis=1)
+        tr = np.fmax(h - l, np.fmax(np.abs(h - anterior), np.abs(l - anterior)))
+        # Média de Wilder, como no RSI (fmax ignora o NaN: a primeira TR é a amplitude do dia)
+        return {"atr": cls.wilder(tr, w)}
+
+    @classmethod
+    def volatilidade(cls, p: dict, w: int) -> dict:
+        c = p["fechamento"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            retornos = np.diff(np.log(c), axis=1)
+        std = cls.rolling_std(retornos, w, ddof=1) * np.sqrt(IndicatorConfig.TRADING_DAYS)
+        return {"volatilidade": np.concatenate([np.full((c.shape[0], 1), np.nan), std], axis=1)}
+
+    @classmethod
+    def drawdown(cls, p: dict, w: int = None) -> dict:
+        c = p["fechamento"]
+        return {"drawdown": c / np.fmax.accumulate(c, axis=1) - 1.0}
+
+    COLUMNS = ["abertura", "maximo", "minimo", "fechamento", "volume"]
+
+    @classmethod
+    def compute(cls, tipo: str, frames: dict, janela: int) -> dict:
+        """
+        Calcula o indicador para vários tickers de uma vez.
+        Devolve {ticker: DataFrame(data_pregao, <séries do indicador>)}.
+        """
+        tickers, lengths, panel = cls.build_panel(frames, cls.COLUMNS)
+        if not tickers:
+            return {}
+        series = getattr(cls, tipo)(panel, janela)
+
+        resultado = {}
+        for i, ticker in enumerate(tickers):
+            n = lengths[i]
+            df = pd.DataFrame({"data_pregao": frames[ticker]["data_pregao"].to_numpy()})
+            for nome, matriz in series.items():
+                df[nome] = matriz[i, :n]
+            resultado[ticker] = df
+        return resultado
+
+class IndicatorService:
+    """Indicadores por ticker com cache LRU por (ticker, indicador, parâmetros, versão dos dados)."""
+
+    def __init__(self, max_items: int = None, version=None):
+        self.max_items = settings.INDICATOR_CACHE_ITEMS if max_items is None else max_items
+        self.version = version or data_version
+        self.market_service = MarketService()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_indicators(self, tickers: list, tipo: str, janela: int) -> dict:
+        versao = self.version.current()
+        resultado, faltantes = {}, []
+        with self._lock:
+            for ticker in tickers:
+                chave = (ticker, tipo, janela, versao)
+                if chave in self._cache:
+                    self._cache.move_to_end(chave)
+                    resultado[ticker] = self._cache[chave]
+                else:
+                    faltantes.append(ticker)
+
+        # Históricos dos que faltam numa única consulta indexada (ticker IN (...)), como em /ativos/lote
+        frames = self.market_service.get_histories(faltantes, IndicatorEngine.COLUMNS) if faltantes else {}
+
+        # Uma única passada vetorizada para todos os tickers que não estavam em cache
+        calculados = IndicatorEngine.compute(tipo, frames, janela)
+        with self._lock:
+            for ticker, df in calculados.items():
+                self._cache[(ticker, tipo, janela, versao)] = df
+                resultado[ticker] = df
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+        return {t: resultado[t] for t in tickers if t in resultado}
+
+# Instância compartilhada (o cache vale para todas as requisições do processo)
+indicator_service = IndicatorService()
@@ -0,0 +1,63 @@
+# services/ingest_manifest.py
+import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from core.database import db_manager
+from core.constants import CacheConstants
+
+class IngestManifest:
+    """Registro dos arquivos COTAHIST já ingeridos (caminho, tamanho, hash e período)."""
+
+    TABLE = CacheConstants.TABLE_MANIFEST
+
+    def __init__(self):
+        db_manager.execute_raw(f"""
+            CREATE TABLE IF NOT EXISTS {self.TABLE} (
+                sha256 VARCHAR(64) PRIMARY KEY,
+                arquivo TEXT NOT NULL,
+                tamanho BIGINT NOT NULL,
+                data_inicio TEXT,
+                data_fim TEXT,
+                registros BIGINT NOT NULL,
+                importado_em TEXT NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def fingerprint(file_path, block_size: int = 1 << 20) -> dict:
+        """Calcula tamanho e SHA-256 do arquivo lendo em blocos."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return {
+            "sha256": digest.hexdigest(),
+            "arquivo": str(Path(file_path).resolve()),
+            "tamanho": os.path.getsize(file_path),
+        }
+
+    def is_ingested(self, fingerprint: dict) -> bool:
+        df = db_manager.get_from_cache(
+            f"SELECT sha256 FROM {self.TABLE} WHERE sha256 = :h", {"h": fingerprint["sha256"]}
+        )
+        return not df.empty
+
+    def record(self, fingerprint: dict, data_inicio, data_fim, registros: int):
+        """Registra (ou atualiza) a ingestão de um arquivo."""
+        db_manager.execute_raw(f"DELETE FROM {self.TABLE} WHERE sha256 = :h", {"h": fingerprint["sha256"]})
+        db_manager.execute_raw(
+            f"""INSERT INTO {self.TABLE} (sha256, arquivo, tamanho, data_inicio, data_fim, registros, importado_em)
+                VALUES (:sha256, :arquivo, :tamanho, :data_inicio, :data_fim, :registros, :importado_em)""",
+            {
+                **fingerprint,
+                "data_inicio": data_inicio,
+                "data_fim": data_fim,
+                "registros": int(registros),
+                "importado_em": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+
+    def clear(self):
+        """Esquece todas as ingestões (usado quando a tabela de cotações é recriada do zero)."""
+        db_manager.execute_raw(f"DELETE FROM {self.TABLE}")
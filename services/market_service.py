@@ -1,34 +1,386 @@
 # services/market_service.py
+import asyncio
+import numpy as np
 import pandas as pd
 from core.database import db_manager
-from core.constants import MarketConstants, CacheConstants
+from core.async_database import async_db_manager
+from core.constants import (
+    MarketConstants, CacheConstants, AdjustmentConfig, ResponseConfig, ErrorMessages, BatchConfig, B3Layout
+)
 from core.config import settings
+from core.schema import from_storage, date_slice, format_dates, to_storage_date
+from services.ticker_cache import ticker_cache
+from services.downsampling import Downsampler
+from services.ticker_index import ticker_index
+from services.market_snapshot import market_snapshot
 
 class MarketService:
-    def list_available_tickers(self, content_limit: int = 500):
-        """Lista tickers que possuem volume financeiro relevante."""
-        
+    @staticmethod
+    def _liquid_filter():
         # Como MarketConstants.ALLOWED_BDI_CODES é ('02', '03')
         # transformamos em uma string pronta para o SQL: "'02', '03'"
         bdi_string = ", ".join([f"'{b}'" for b in MarketConstants.ALLOWED_BDI_CODES])
-        
+        where = f"WHERE volume >= :min_vol AND cod_bdi IN ({bdi_string})"
+        return where, {"min_vol": MarketConstants.DEFAULT_MIN_VOLUME}
+
+    def _tickers_query(self, content_limit: int, offset: int = 0):
+        where, params = self._liquid_filter()
         query = f"""
             SELECT DISTINCT ticker FROM {CacheConstants.TABLE_HISTORICO}
-            WHERE volume >= :min_vol
-            AND cod_bdi IN ({bdi_string})
-            LIMIT :limit
-        """
-        
-        params = {
-            "min_vol": MarketConstants.DEFAULT_MIN_VOLUME,
-            "limit": content_limit
-        }
-        
+            {where}
+            LIMIT :limit OFFSET :offset
+        """
+        return query, {**params, "limit": content_limit, "offset": offset}
+
+    def list_available_tickers(self, content_limit: int = 500, offset: int = 0):
+        """
+        Lista tickers que possuem volume financeiro relevante, do mais para o menos líquido
+        (dimensão de ativos em memória). Sem a dimensão gerada, consulta o histórico diretamente.
+        """
+        universo = ticker_index.load()
+        if universo is not None:
+            return universo.page(offset, content_limit, MarketConstants.DEFAULT_MIN_VOLUME)[1]
         # O SQLite não verá um "?" no lugar da lista, mas sim os valores reais
-        df = db_manager.get_from_cache(query, params)
+        df = db_manager.get_from_cache(*self._tickers_query(content_limit, offset))
         return df['ticker'].tolist() if not df.empty else []
 
-    def get_ticker_data(self, ticker: str):
-        """Busca o histórico completo de um ativo específico."""
-        query = f"SELECT * FROM {CacheConstants.TABLE_HISTORICO} WHERE ticker = :t ORDER BY data_pregao ASC"
-        return db_manager.get_from_cache(query, {"t": ticker.upper()})
\ No newline at end of file
+    async def list_available_tickers_async(self, content_limit: int = 500, offset: int = 0):
+        """Versão assíncrona de list_available_tickers (não ocupa uma thread do servidor)."""
+        universo = await ticker_index.load_async()
+        if universo is not None:
+            return universo.page(offset, content_limit, MarketConstants.DEFAULT_MIN_VOLUME)[1]
+        df = await async_db_manager.get_from_cache(*self._tickers_query(content_limit, offset))
+        return df['ticker'].tolist() if not df.empty else []
+
+    async def count_available_tickers_async(self) -> int:
+        """Total de tickers líquidos (para a paginação de /ativos)."""
+        universo = await ticker_index.load_async()
+        if universo is not None:
+            return universo.page(0, 0, MarketConstants.DEFAULT_MIN_VOLUME)[0]
+        where, params = self._liquid_filter()
+        query = f"SELECT COUNT(DISTINCT ticker) AS total FROM {CacheConstants.TABLE_HISTORICO} {where}"
+        df = await async_db_manager.get_from_cache(query, params)
+        return int(df["total"].iloc[0]) if not df.empty else 0
+
+    async def search_tickers_async(self, q: str, limite: int):
+        """Busca por prefixo/trecho do ticker ou do nome da empresa, ordenada por relevância e liquidez."""
+        universo = await ticker_index.load_async()
+        if universo is None:
+            return []
+        return ticker_index.to_records(universo.search(q, limite))
+
+    ADJUSTMENT_COLUMNS = [AdjustmentConfig.FACTOR_COLUMN, *AdjustmentConfig.ADJUSTED_COLUMNS.values()]
+
+    TICKER_QUERY = f"SELECT * FROM {CacheConstants.TABLE_HISTORICO} WHERE ticker = :t ORDER BY data_pregao ASC"
+
+    def get_ticker_data(self, ticker: str, ajustado: bool = False, inicio: str = None, fim: str = None,
+                        ultimos: int = None, campos=None):
+        """
+        Busca o histórico de um ativo específico: fatia do snapshot publicado pelo ETL quando ele está
+        na versão atual; senão cache em memória e, por fim, o banco.
+        Com `ajustado`, os preços OHLC vêm ajustados por eventos corporativos. Período ('AAAA-MM-DD',
+        inclusivo), `ultimos` pregões e `campos` são aplicados na leitura: só o pedido é lido e convertido.
+        """
+        ticker = ticker.upper()
+        leitura = self._read_args(inicio, fim, ultimos, campos, ajustado)
+        arrays = market_snapshot.get(ticker, **leitura)
+        if arrays is not None:
+            # Snapshot vigente: {} quando o ativo não está nele
+            return self._to_frame(arrays, ajustado) if arrays else pd.DataFrame()
+        arrays = ticker_cache.get(ticker)
+        if arrays is None:
+            if self._is_partial(leitura):
+                # Recorte fora do cache: a consulta já traz só as linhas e colunas pedidas (não vai para o cache)
+                df = db_manager.get_from_cache(*self.history_query(ticker, **leitura))
+                return self._partial_frame(df, leitura, ajustado)
+            arrays = self._cache_rows(ticker, db_manager.get_from_cache(self.TICKER_QUERY, {"t": ticker}))
+            if arrays is None:
+                return pd.DataFrame()
+        return self._to_frame(self._slice(arrays, leitura), ajustado)
+
+    async def get_ticker_data_async(self, ticker: str, ajustado: bool = False, inicio: str = None, fim: str = None,
+                                    ultimos: int = None, campos=None):
+        """Versão assíncrona de get_ticker_data: mesmo snapshot e cache em memória, leitura pelo driver assíncrono."""
+        ticker = ticker.upper()
+        leitura = self._read_args(inicio, fim, ultimos, campos, ajustado)
+        arrays = market_snapshot.get(ticker, **leitura)
+        if arrays is not None:
+            return self._to_frame(arrays, ajustado) if arrays else pd.DataFrame()
+        arrays = ticker_cache.get(ticker)
+        if arrays is None:
+            if self._is_partial(leitura):
+                df = await async_db_manager.get_from_cache(*self.history_query(ticker, **leitura))
+                return self._partial_frame(df, leitura, ajustado)
+            df = await async_db_manager.get_from_cache(self.TICKER_QUERY, {"t": ticker})
+            arrays = self._cache_rows(ticker, df)
+            if arrays is None:
+                return pd.DataFrame()
+        return self._to_frame(self._slice(arrays, leitura), ajustado)
+
+    def _read_args(self, inicio, fim, ultimos, campos, ajustado: bool) -> dict:
+        """Recorte no formato de armazenamento: datas AAAAMMDD e as colunas que precisam ser lidas."""
+        return {
+            "colunas": self.storage_columns(campos, ajustado),
+            "inicio": to_storage_date(inicio) if inicio else None,
+            "fim": to_storage_date(fim) if fim else None,
+            "ultimos": ultimos or None,
+        }
+
+    @staticmethod
+    def _is_partial(leitura: dict) -> bool:
+        return any(v is not None for v in leitura.values())
+
+    def storage_columns(self, campos, ajustado: bool = False):
+        """
+        Colunas lidas para devolver `campos` (None = todas): a data sempre e, com `ajustado`, o preço
+        ajustado de cada preço pedido. Só nomes de ResponseConfig.FIELDS entram na consulta.
+        """
+        if not campos:
+            return None
+        invalidos = [c for c in campos if c not in ResponseConfig.FIELDS]
+        if invalidos:
+            raise ValueError(ErrorMessages.INVALID_FIELDS(invalidos))
+        colunas = ["data_pregao", *dict.fromkeys(campos)]
+        if ajustado:
+            colunas += [AdjustmentConfig.ADJUSTED_COLUMNS[c] for c in colunas if c in AdjustmentConfig.ADJUSTED_COLUMNS]
+        return colunas
+
+    @staticmethod
+    def history_query(ticker: str, colunas=None, inicio: int = None, fim: int = None, ultimos: int = None):
+        """
+        (SQL, parâmetros) do histórico de um ativo com colunas, período e últimos pregões na própria consulta.
+        Ticker e faixa de datas casam com o índice (ticker, data_pregao), que também entrega a ordem:
+        `ultimos` lê o índice de trás para frente e para no LIMIT.
+        """
+        filtros, params = ["ticker = :t"], {"t": ticker}
+        MarketService._date_filters(filtros, params, inicio, fim)
+        query = (f"SELECT {', '.join(colunas) if colunas else '*'} FROM {CacheConstants.TABLE_HISTORICO} "
+                 f"WHERE {' AND '.join(filtros)} ORDER BY data_pregao {'DESC' if ultimos else 'ASC'}")
+        if ultimos:
+            query += " LIMIT :n"
+            params["n"] = ultimos
+        return query, params
+
+    @staticmethod
+    def _date_filters(filtros: list, params: dict, inicio: int = None, fim: int = None):
+        if inicio is not None:
+            filtros.append("data_pregao >= :inicio")
+            params["inicio"] = inicio
+        if fim is not None:
+            filtros.append("data_pregao <= :fim")
+            params["fim"] = fim
+
+    def _partial_frame(self, df: pd.DataFrame, leitura: dict, ajustado: bool) -> pd.DataFrame:
+        if df.empty:
+            return pd.DataFrame()
+        if leitura["ultimos"]:
+            df = df.iloc[::-1].reset_index(drop=True)  # veio do mais recente para o mais antigo
+        for col in self.ADJUSTMENT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(float)
+        return self.apply_adjustment(from_storage(df), ajustado)
+
+    @staticmethod
+    def _slice(arrays: dict, leitura: dict) -> dict:
+        """Recorte dos arrays do cache (ordenados por data) por busca binária, só nas colunas pedidas."""
+        if not MarketService._is_partial(leitura):
+            return arrays
+        recorte = date_slice(arrays["data_pregao"], leitura["inicio"], leitura["fim"], leitura["ultimos"])
+        return {c: arrays[c][recorte] for c in leitura["colunas"] or arrays}
+
+    def _cache_rows(self, ticker: str, df: pd.DataFrame):
+        """Linhas do banco em arrays compactos, guardados no cache por ticker (None se não houver linhas)."""
+        if df.empty:
+            return None
+        # Colunas de ajuste ainda vazias chegam como objetos None
+        for col in self.ADJUSTMENT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(float)
+        arrays = ticker_cache.to_arrays(df)
+        ticker_cache.put(ticker, arrays)
+        return arrays
+
+    def _to_frame(self, arrays: dict, ajustado: bool) -> pd.DataFrame:
+        # Datas AAAAMMDD e centavos do banco viram 'AAAA-MM-DD' e reais
+        return self.apply_adjustment(from_storage(pd.DataFrame(arrays)), ajustado)
+
+    def apply_adjustment(self, df: pd.DataFrame, ajustado: bool) -> pd.DataFrame:
+        """Troca os preços brutos pelos ajustados (se pedido) e tira as colunas de ajuste do resultado."""
+        if ajustado:
+            for bruto, col in AdjustmentConfig.ADJUSTED_COLUMNS.items():
+                if col in df.columns and bruto in df.columns:
+                    # Sem fator gravado, o preço ajustado é o próprio preço bruto
+                    df[bruto] = df[col].fillna(df[bruto])
+        return df.drop(columns=[c for c in self.ADJUSTMENT_COLUMNS if c in df.columns])
+
+    def get_batch(self, tickers, campos=BatchConfig.DEFAULT_FIELDS, inicio: str = None, fim: str = None,
+                  ultimos: int = None, ajustado: bool = False) -> dict:
+        """
+        Histórico de vários ativos alinhado por data: a união das datas negociadas e, por campo, uma matriz
+        ativo x data (NaN onde o ativo não negociou). Vem do snapshot (sem SQL) ou do cache em memória; os
+        que faltarem saem todos de uma única consulta indexada. `ultimos` conta datas do eixo alinhado.
+        """
+        tickers, leitura = self._batch_args(tickers, campos, inicio, fim, ajustado)
+        series, faltantes = self._batch_collect(tickers, leitura)
+        if faltantes:
+            series.update(self._batch_rows(db_manager.get_from_cache(*self.batch_query(faltantes, **leitura))))
+        return self._align(tickers, series, campos, ultimos, ajustado)
+
+    async def get_batch_async(self, tickers, campos=BatchConfig.DEFAULT_FIELDS, inicio: str = None, fim: str = None,
+                              ultimos: int = None, ajustado: bool = False) -> dict:
+        """Versão assíncrona de get_batch; o alinhamento (CPU) roda numa thread."""
+        tickers, leitura = self._batch_args(tickers, campos, inicio, fim, ajustado)
+        series, faltantes = self._batch_collect(tickers, leitura)
+        if faltantes:
+            df = await async_db_manager.get_from_cache(*self.batch_query(faltantes, **leitura))
+            series.update(self._batch_rows(df))
+        return await asyncio.to_thread(self._align, tickers, series, campos, ultimos, ajustado)
+
+    def get_histories(self, tickers, campos=BatchConfig.FIELDS, inicio: str = None, fim: str = None,
+                      ajustado: bool = False) -> dict:
+        """
+        Histórico de vários ativos, cada um nas próprias datas ({ticker: DataFrame}, como get_ticker_data).
+        Mesmas fontes do lote (snapshot, cache e uma única consulta `ticker IN (...)` para os que faltarem),
+        sem o alinhamento: para cálculos por ativo, como os indicadores.
+        """
+        tickers, leitura = self._batch_args(tickers, campos, inicio, fim, ajustado)
+        series, faltantes = self._batch_collect(tickers, leitura)
+        if faltantes:
+            series.update(self._batch_rows(db_manager.get_from_cache(*self.batch_query(faltantes, **leitura))))
+        return {t: self._to_frame(series[t], ajustado) for t in tickers if t in series}
+
+    def _batch_args(self, tickers, campos, inicio, fim, ajustado: bool):
+        invalidos = [c for c in campos if c not in BatchConfig.FIELDS]
+        if invalidos:
+            raise ValueError(ErrorMessages.INVALID_BATCH_FIELDS(invalidos))
+        leitura = self._read_args(inicio, fim, None, campos, ajustado)
+        del leitura["ultimos"]
+        return list(dict.fromkeys(t.upper() for t in tickers)), leitura
+
+    def _batch_collect(self, tickers: list, leitura: dict):
+        """Arrays já recortados de cada ativo vindos do snapshot ou do cache, e os que precisam ir ao banco."""
+        series, faltantes = {}, []
+        for ticker in tickers:
+            arrays = market_snapshot.get(ticker, **leitura)
+            if arrays is None:
+                arrays = ticker_cache.get(ticker)
+                if arrays is None:
+                    faltantes.append(ticker)
+                    continue
+                arrays = self._slice(arrays, {**leitura, "ultimos": None})
+            if arrays and len(arrays["data_pregao"]):
+                series[ticker] = arrays
+        return series, faltantes
+
+    @staticmethod
+    def batch_query(tickers: list, colunas: list, inicio: int = None, fim: int = None):
+        """
+        (SQL, parâmetros) de vários ativos numa consulta: `ticker IN (...)` com a faixa de datas vira uma busca
+        no índice (ticker, data_pregao) por ativo, já na ordem (ticker, data).
+        """
+        params = {f"t{i}": t for i, t in enumerate(tickers)}
+        filtros = [f"ticker IN ({', '.join(f':{p}' for p in params)})"]
+        MarketService._date_filters(filtros, params, inicio, fim)
+        query = (f"SELECT ticker, {', '.join(colunas)} FROM {CacheConstants.TABLE_HISTORICO} "
+                 f"WHERE {' AND '.join(filtros)} ORDER BY ticker, data_pregao")
+        return query, params
+
+    def _batch_rows(self, df: pd.DataFrame) -> dict:
+        """Linhas da consulta do lote (ordenadas por ticker e data) em arrays por ativo, sem agrupar no pandas."""
+        if df.empty:
+            return {}
+        for col in self.ADJUSTMENT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype(float)
+        tickers = df["ticker"].to_numpy().astype(str)
+        inicios = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]])
+        fins = np.r_[inicios[1:], len(tickers)]
+        colunas = {c: df[c].to_numpy() for c in df.columns if c != "ticker"}
+        return {tickers[a]: {c: v[a:b] for c, v in colunas.items()} for a, b in zip(inicios, fins)}
+
+    @staticmethod
+    def _align(tickers: list, series: dict, campos, ultimos: int = None, ajustado: bool = False) -> dict:
+        """Eixo de datas comum (união) e uma matriz ativo x data por campo, preenchida por busca binária."""
+        presentes = [t for t in tickers if t in series]
+        datas = np.unique(np.concatenate([series[t]["data_pregao"] for t in presentes])) if presentes else \
+            np.array([], dtype=np.int64)
+        if ultimos:
+            datas = datas[-ultimos:]
+        valores = {campo: np.full((len(presentes), len(datas)), np.nan) for campo in campos}
+        for j, ticker in enumerate(presentes):
+            arrays = series[ticker]
+            recorte = date_slice(arrays["data_pregao"], int(datas[0]) if len(datas) else None)
+            posicoes = np.searchsorted(datas, arrays["data_pregao"][recorte])
+            for campo in campos:
+                v = arrays[campo][recorte].astype(float)
+                ajuste = AdjustmentConfig.ADJUSTED_COLUMNS.get(campo)
+                if ajustado and ajuste in arrays:
+                    # Sem fator gravado, o preço ajustado é o próprio preço bruto
+                    v = np.where(np.isnan(arrays[ajuste][recorte]), v, arrays[ajuste][recorte])
+                if campo in B3Layout.PRICE_COLUMNS:
+                    v = v / 100.0  # centavos -> reais
+                valores[campo][j, posicoes] = v
+        return {
+            "datas": format_dates(datas),
+            "tickers": presentes,
+            "ausentes": [t for t in tickers if t not in series],
+            "campos": list(campos),
+            "valores": valores,
+        }
+
+    def get_history(self, ticker: str, inicio: str = None, fim: str = None, max_pontos: int = None,
+                    amostragem: str = "lttb", serie: str = "fechamento", ajustado: bool = False,
+                    ultimos: int = None, campos=None):
+        """
+        Histórico recortado por período ('AAAA-MM-DD', inclusivo) ou últimos pregões e reduzido a no máximo
+        `max_pontos`: LTTB sobre `serie` (pregões reais) ou agregação OHLC por faixa de pregões.
+        Com `campos`, só a data e esses campos são lidos e devolvidos.
+        """
+        lidos = self._sampling_fields(campos, max_pontos, amostragem, serie)
+        df = self.get_ticker_data(ticker, ajustado=ajustado, inicio=inicio, fim=fim, ultimos=ultimos, campos=lidos)
+        return self._project(self.slice_and_sample(df, inicio, fim, max_pontos, amostragem, serie), campos)
+
+    async def get_history_async(self, ticker: str, inicio: str = None, fim: str = None, max_pontos: int = None,
+                                amostragem: str = "lttb", serie: str = "fechamento", ajustado: bool = False,
+                                ultimos: int = None, campos=None):
+        """Versão assíncrona de get_history; a redução de pontos (CPU) roda numa thread."""
+        lidos = self._sampling_fields(campos, max_pontos, amostragem, serie)
+        df = await self.get_ticker_data_async(ticker, ajustado=ajustado, inicio=inicio, fim=fim, ultimos=ultimos,
+                                              campos=lidos)
+        if max_pontos and len(df) > max_pontos:
+            df = await asyncio.to_thread(self.slice_and_sample, df, inicio, fim, max_pontos, amostragem, serie)
+        else:
+            df = self.slice_and_sample(df, inicio, fim, max_pontos, amostragem, serie)
+        return self._project(df, campos)
+
+    @staticmethod
+    def _sampling_fields(campos, max_pontos: int, amostragem: str, serie: str):
+        """Campos pedidos mais os que a redução de pontos usa (a série do LTTB, a quantidade do médio no OHLC)."""
+        if not campos or not max_pontos:
+            return campos
+        lidos = list(campos)
+        if amostragem == "lttb" and serie not in lidos:
+            lidos.append(serie)
+        if amostragem == "ohlc" and "medio" in lidos and "qtd_titulos" not in lidos:
+            lidos.append("qtd_titulos")
+        return lidos
+
+    @staticmethod
+    def _project(df: pd.DataFrame, campos) -> pd.DataFrame:
+        if not campos or df.empty:
+            return df
+        return df[["data_pregao", *dict.fromkeys(c for c in campos if c != "data_pregao")]]
+
+    @staticmethod
+    def slice_and_sample(df: pd.DataFrame, inicio: str = None, fim: str = None, max_pontos: int = None,
+                         amostragem: str = "lttb", serie: str = "fechamento") -> pd.DataFrame:
+        if df.empty:
+            return df
+        if inicio:
+            df = df[df["data_pregao"] >= inicio]
+        if fim:
+            df = df[df["data_pregao"] <= fim]
+        df = df.reset_index(drop=True)
+        if amostragem == "ohlc":
+            return Downsampler.ohlc(df, max_pontos)
+        return Downsampler.lttb(df, serie, max_pontos)
@@ -0,0 +1,260 @@
+# services/market_snapshot.py
+import json
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from sqlalchemy import BigInteger, Float, Integer, SmallInteger, String
+from core.database import db_manager
+from core.config import settings
+from core.constants import B3Layout, CacheConstants, SnapshotConfig
+from core.schema import cotacoes_historicas, date_slice
+from services.data_version import data_version
+
+def column_dtype(coluna) -> str:
+    """dtype do snapshot derivado do tipo da coluna no schema (datas int32, preços/volumes int64, textos bytes)."""
+    tipo = coluna.type
+    if isinstance(tipo, SmallInteger):
+        return "<i2"
+    if isinstance(tipo, BigInteger):
+        return "<i8"
+    if isinstance(tipo, Integer):
+        return "<i4"
+    if isinstance(tipo, Float):
+        return "<f8"
+    if isinstance(tipo, String):
+        return f"S{tipo.length}"
+    raise TypeError(f"Coluna sem tipo suportado no snapshot: {coluna.name}")
+
+# Colunas por linha, na ordem da tabela; o ticker fica só na tabela de deslocamentos
+ROW_COLUMNS = [(c.name, column_dtype(c)) for c in cotacoes_historicas.columns if c.name != "ticker"]
+TICKER_DTYPE = column_dtype(cotacoes_historicas.c.ticker)
+
+def _align(offset: int) -> int:
+    return -(-offset // SnapshotConfig.ALIGNMENT) * SnapshotConfig.ALIGNMENT
+
+class SnapshotView:
+    """
+    Um arquivo de snapshot aberto via np.memmap (somente leitura). Todos os arrays são visões do mesmo
+    mapeamento: as páginas vêm do page cache do sistema, compartilhado entre os processos que abrem o arquivo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+        if bytes(self.buffer[:8]) != SnapshotConfig.MAGIC:
+            raise ValueError(f"Arquivo de snapshot inválido: {self.path}")
+        (tamanho,) = struct.unpack("<Q", bytes(self.buffer[8:16]))
+        self.layout = json.loads(bytes(self.buffer[16:16 + tamanho]).decode())
+        self.versao = self.layout["versao"]
+
+        self.tickers = self._array(self.layout["tickers"], len_=self.layout["n_tickers"])
+        self.starts = self._array(self.layout["inicios"], len_=self.layout["n_tickers"] + 1)
+        self.columns = {c["nome"]: self._array(c, len_=self.layout["linhas"]) for c in self.layout["colunas"]}
+        # Busca O(1): ticker -> posição na tabela de deslocamentos
+        self.position = {t.decode(B3Layout.ENCODING): i for i, t in enumerate(self.tickers.tolist())}
+
+    def _array(self, spec: dict, len_: int) -> np.ndarray:
+        dtype = np.dtype(spec["dtype"])
+        inicio = spec["offset"]
+        # ndarray comum sobre o mesmo mapeamento: fatiar não passa pela subclasse np.memmap
+        return np.asarray(self.buffer[inicio:inicio + len_ * dtype.itemsize]).view(dtype)
+
+    def rows(self, ticker: str, colunas=None):
+        """Arrays do ticker como fatias do mapeamento (sem cópia); None se o ticker não estiver no snapshot."""
+        i = self.position.get(ticker)
+        if i is None:
+            return None
+        inicio, fim = int(self.starts[i]), int(self.starts[i + 1])
+        return {nome: self.columns[nome][inicio:fim] for nome in colunas or self.columns}
+
+class MarketSnapshot:
+    """
+    Etapa de saída do ETL: o histórico inteiro num arquivo binário somente leitura, ordenado por
+    (ticker, data), com uma tabela de deslocamentos por ticker e uma coluna contígua por campo.
+    Cada versão dos dados grava o próprio arquivo (nome temporário + os.replace) e só então troca o
+    ponteiro JSON; a API mapeia o arquivo da versão vigente e recorta o histórico de um ticker por fatia.
+    """
+
+    def __init__(self, directory=None, version=None):
+        self.directory = Path(directory or settings.SNAPSHOT_DIR)
+        self.version = version or data_version
+        self._lock = threading.Lock()
+        self._view = None
+        self._key = None
+        self._checked_at = 0.0
+
+    def path(self, versao: int) -> Path:
+        return self.directory / f"mercado_v{versao}.bin"
+
+    @staticmethod
+    def layout(versao: int, n_tickers: int, linhas: int) -> dict:
+        """Posição de cada array no arquivo (após o cabeçalho), todos alinhados."""
+        layout = {"versao": int(versao), "n_tickers": n_tickers, "linhas": linhas}
+        specs = [("tickers", TICKER_DTYPE, n_tickers), ("inicios", "<i8", n_tickers + 1)]
+        specs += [(nome, dtype, linhas) for nome, dtype in ROW_COLUMNS]
+        # O tamanho do cabeçalho depende dos offsets: reserva um teto generoso e alinha o início dos dados
+        offset = _align(16 + 256 + 96 * len(specs))
+        colunas = []
+        for nome, dtype, n in specs:
+            spec = {"nome": nome, "dtype": dtype, "offset": offset}
+            if nome in ("tickers", "inicios"):
+                layout[nome] = spec
+            else:
+                colunas.append(spec)
+            offset = _align(offset + n * np.dtype(dtype).itemsize)
+        layout["colunas"] = colunas
+        layout["tamanho"] = offset
+        return layout
+
+    def publish(self, versao: int = None, batch_tickers: int = SnapshotConfig.BATCH_TICKERS) -> int:
+        """
+        Monta o arquivo em lotes de tickers (a memória fica limitada ao lote), grava com nome temporário
+        e publica com os.replace: leitores nunca veem um arquivo pela metade. Devolve o nº de linhas.
+        """
+        if not settings.SNAPSHOT_ENABLED:
+            return 0
+        versao = self.version.current() if versao is None else versao
+        tabela = CacheConstants.TABLE_HISTORICO
+        contagem = db_manager.get_from_cache(
+            f"SELECT ticker, COUNT(*) AS linhas FROM {tabela} GROUP BY ticker ORDER BY ticker"
+        )
+        if contagem.empty:
+            return 0
+
+        tickers = contagem["ticker"].to_numpy().astype(str)
+        inicios = np.concatenate([[0], np.cumsum(contagem["linhas"].to_numpy(dtype=np.int64))])
+        layout = self.layout(versao, len(tickers), int(inicios[-1]))
+        cabecalho = json.dumps(layout).encode()
+        if 16 + len(cabecalho) > layout["tickers"]["offset"]:
+            raise RuntimeError("Cabeçalho do snapshot maior que o espaço reservado")
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        destino = self.path(versao)
+        temporario = destino.with_name(f".{destino.name}.{os.getpid()}.tmp")
+        with open(temporario, "wb") as f:
+            f.write(SnapshotConfig.MAGIC + struct.pack("<Q", len(cabecalho)) + cabecalho)
+            f.truncate(layout["tamanho"])
+
+        try:
+            mm = np.memmap(temporario, dtype=np.uint8, mode="r+")
+            arrays = {c["nome"]: c for c in layout["colunas"]}
+
+            def destino_de(spec, n):
+                dtype = np.dtype(spec["dtype"])
+                return mm[spec["offset"]:spec["offset"] + n * dtype.itemsize].view(dtype)
+
+            destino_de(layout["tickers"], len(tickers))[:] = np.char.encode(tickers, B3Layout.ENCODING)
+            destino_de(layout["inicios"], len(inicios))[:] = inicios
+            colunas = {nome: destino_de(arrays[nome], layout["linhas"]) for nome, _ in ROW_COLUMNS}
+
+            for lote in range(0, len(tickers), batch_tickers):
+                primeiro, ultimo = tickers[lote], tickers[min(lote + batch_tickers, len(tickers)) - 1]
+                df = db_manager.get_from_cache(
+                    f"SELECT * FROM {tabela} WHERE ticker BETWEEN :a AND :b ORDER BY ticker, data_pregao",
+                    {"a": primeiro, "b": ultimo},
+                )
+                a, b = int(inicios[lote]), int(inicios[min(lote + batch_tickers, len(tickers))])
+                if len(df) != b - a:
+                    raise RuntimeError(f"Snapshot inconsistente no lote {primeiro}..{ultimo}: {len(df)} != {b - a}")
+                for nome, dtype in ROW_COLUMNS:
+                    valores = df[nome]
+                    if dtype.startswith("S"):
+                        valores = valores.fillna("").astype(str).str.encode(B3Layout.ENCODING)
+                    elif dtype.startswith("<f"):
+                        valores = valores.astype(float)
+                    else:
+                        valores = valores.fillna(0)
+                    colunas[nome][a:b] = valores.to_numpy()
+            mm.flush()
+            del mm, colunas
+            os.replace(temporario, destino)
+        finally:
+            if temporario.exists():
+                temporario.unlink()
+
+        ponteiro = self.directory / SnapshotConfig.POINTER
+        tmp = ponteiro.with_name(f".{ponteiro.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"versao": int(versao), "arquivo": destino.name}))
+        os.replace(tmp, ponteiro)
+        self.prune(versao - 1)
+        return layout["linhas"]
+
+    def prune(self, manter: int):
+        """Apaga arquivos de versões anteriores a `manter` (leitores com o mmap aberto mantêm o inode vivo)."""
+        for arquivo in self.directory.glob("mercado_v*.bin"):
+            numero = arquivo.stem.split("_v")[-1]
+            if numero.isdigit() and int(numero) < manter:
+                try:
+                    arquivo.unlink()
+                except OSError:
+                    pass  # Windows: arquivo ainda mapeado por algum worker
+
+    def load(self):
+        """
+        Visão do snapshot da versão vigente dos dados, ou None (sem snapshot, ou ainda não publicado para
+        a versão atual: nesse intervalo a leitura volta ao banco). O ponteiro é relido no máximo a cada
+        DATA_VERSION_POLL_SECONDS enquanto o snapshot não alcança a versão.
+        """
+        if not settings.SNAPSHOT_ENABLED:
+            return None
+        versao = self.version.current()
+        chave = (versao, self.directory)
+        with self._lock:
+            if self._key == chave:
+                return self._view
+            agora = time.monotonic()
+            if self._view is None and self._key == (None, self.directory) and \
+                    agora - self._checked_at < settings.DATA_VERSION_POLL_SECONDS:
+                return None
+            self._checked_at = agora
+
+            ponteiro = self.directory / SnapshotConfig.POINTER
+            try:
+                info = json.loads(ponteiro.read_text())
+                if info["versao"] != versao:
+                    raise FileNotFoundError
+                view = self._view if self._view is not None and self._view.versao == versao else \
+                    SnapshotView(self.directory / info["arquivo"])
+            except (FileNotFoundError, ValueError, KeyError):
+                self._view, self._key = None, (None, self.directory)
+                return None
+            self._view, self._key = view, chave
+            return view
+
+    def get(self, ticker: str, colunas=None, inicio: int = None, fim: int = None, ultimos: int = None):
+        """
+        Histórico do ticker no formato de armazenamento: numéricos como fatias do memmap (sem cópia) e
+        textos decodificados. `colunas` restringe os campos e `inicio`/`fim` (AAAAMMDD) e `ultimos`
+        recortam os pregões por busca binária antes de qualquer decodificação.
+        None sem snapshot vigente; {} se o ticker não existir no snapshot.
+        """
+        view = self.load()
+        if view is None:
+            return None
+        colunas = colunas or cotacoes_historicas.columns.keys()
+        linhas = view.rows(ticker, ["data_pregao", *(c for c in colunas if c not in ("data_pregao", "ticker"))])
+        if linhas is None:
+            return {}
+        recorte = date_slice(linhas["data_pregao"], inicio, fim, ultimos)
+        arrays = {}
+        for nome in colunas:
+            if nome == "ticker":
+                arrays[nome] = np.full(recorte.stop - recorte.start, ticker)
+            elif linhas[nome].dtype.kind == "S":
+                arrays[nome] = np.char.decode(linhas[nome][recorte], B3Layout.ENCODING)
+            else:
+                arrays[nome] = linhas[nome][recorte]
+        return arrays
+
+    def stats(self) -> dict:
+        view = self.load()
+        if view is None:
+            return {"ativo": False}
+        return {"ativo": True, "versao": view.versao, "arquivo": view.path.name, "tickers": len(view.position),
+                "linhas": view.layout["linhas"], "bytes": int(view.buffer.size)}
+
+# Instância compartilhada (cada worker mapeia o mesmo arquivo)
+market_snapshot = MarketSnapshot()
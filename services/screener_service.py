@@ -0,0 +1,141 @@
+# services/screener_service.py
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+from core.database import db_manager
+from core.constants import CacheConstants, MarketConstants, IndicatorConfig, ScreenerConfig
+from core.schema import format_dates
+from services.data_version import data_version
+
+class MarketMatrix:
+    """
+    Último ano de pregões pivotado em matrizes densas (data x ticker), uma por coluna de preço.
+    Os preços são os ajustados por eventos corporativos, para que retornos e máximas não tenham saltos falsos.
+    """
+
+    COLUMNS = ["maximo", "minimo", "fechamento", "volume"]
+
+    def __init__(self, datas: np.ndarray, tickers: np.ndarray, valores: dict):
+        self.datas = datas
+        self.tickers = tickers
+        self.valores = valores
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "MarketMatrix":
+        """Pivota as linhas (data, ticker, colunas...) por indexação direta, sem pivot_table."""
+        datas, i = np.unique(df["data_pregao"].to_numpy(), return_inverse=True)
+        tickers, j = np.unique(df["ticker"].to_numpy().astype(str), return_inverse=True)
+        valores = {}
+        for col in cls.COLUMNS:
+            m = np.full((len(datas), len(tickers)), np.nan)
+            m[i, j] = df[col].to_numpy(dtype=float)
+            valores[col] = m
+        return cls(datas, tickers, valores)
+
+    @staticmethod
+    def ffill(m: np.ndarray) -> np.ndarray:
+        """Propaga o último valor válido de cada coluna para os pregões sem negócio."""
+        idx = np.where(np.isnan(m), 0, np.arange(m.shape[0])[:, None])
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        return m[idx, np.arange(m.shape[1])]
+
+class ScreenerService:
+    """
+    Screener transversal: todas as métricas saem de uma única passada vetorizada sobre a matriz
+    data x ticker, que fica em memória até o ETL publicar uma nova versão dos dados.
+    """
+
+    def __init__(self, version=None):
+        self.version = version or data_version
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def load_matrix(self, bdi_codes: tuple) -> MarketMatrix:
+        versao = self.version.current()
+        chave = (versao, bdi_codes)
+        with self._lock:
+            if chave in self._matrices:
+                return self._matrices[chave]
+
+        bdi_string = ", ".join([f"'{b}'" for b in bdi_codes])
+        query = f"""
+            SELECT data_pregao, ticker, volume,
+                   COALESCE(maximo_aj, maximo) AS maximo,
+                   COALESCE(minimo_aj, minimo) AS minimo,
+                   COALESCE(fechamento_aj, fechamento) AS fechamento
+            FROM {CacheConstants.TABLE_HISTORICO}
+            WHERE cod_bdi IN ({bdi_string})
+            AND data_pregao > (SELECT MAX(data_pregao) FROM {CacheConstants.TABLE_HISTORICO}) - :lookback
+        """
+        df = db_manager.get_from_cache(query, {"lookback": ScreenerConfig.LOOKBACK})
+        matrix = MarketMatrix.from_frame(df) if not df.empty else None
+
+        with self._lock:
+            # Só a versão corrente interessa: matrizes antigas são descartadas
+            self._matrices = {k: v for k, v in self._matrices.items() if k[0] == versao}
+            self._matrices[chave] = matrix
+        return matrix
+
+    @staticmethod
+    def compute(matrix: MarketMatrix, janela: int) -> pd.DataFrame:
+        """Métricas por ticker (colunas da matriz) sobre as últimas `janela` sessões. Preços em centavos."""
+        fech = MarketMatrix.ffill(matrix.valores["fechamento"])
+        maximo, minimo, volume = matrix.valores["maximo"], matrix.valores["minimo"], matrix.valores["volume"]
+        janela = max(1, min(janela, len(matrix.datas) - 1))
+        recente = slice(-janela, None)
+
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            ultimo = fech[-1]
+            retornos = np.diff(np.log(fech[-janela - 1:]), axis=0)
+            maxima = np.nanmax(maximo, axis=0)
+            minima = np.nanmin(minimo, axis=0)
+            metrics = pd.DataFrame({
+                "ticker": matrix.tickers,
+                "ultimo_fechamento": ultimo / 100.0,
+                "retorno": ultimo / fech[-janela - 1] - 1.0,
+                "volume_medio": np.nanmean(volume[recente], axis=0),
+                "volatilidade": np.nanstd(retornos, axis=0, ddof=1) * np.sqrt(IndicatorConfig.TRADING_DAYS),
+                "maxima_52s": maxima / 100.0,
+                "minima_52s": minima / 100.0,
+                "distancia_maxima": ultimo / maxima - 1.0,
+                "distancia_minima": ultimo / minima - 1.0,
+                # Renovou a máxima/mínima do período no último pregão
+                "nova_maxima": maximo[-1] >= maxima,
+                "nova_minima": minimo[-1] <= minima,
+                "sessoes": np.count_nonzero(~np.isnan(matrix.valores["fechamento"][recente]), axis=0),
+            })
+        return metrics
+
+    def screen(self, janela: int = ScreenerConfig.DEFAULT_WINDOW, bdi_codes: list = None,
+               volume_min: float = None, retorno_min: float = None, retorno_max: float = None,
+               nova_maxima: bool = False, nova_minima: bool = False,
+               ordenar: str = "retorno", ordem: str = "desc", limite: int = ScreenerConfig.DEFAULT_LIMIT) -> dict:
+        bdi_codes = tuple(bdi_codes or MarketConstants.ALLOWED_BDI_CODES)
+        matrix = self.load_matrix(bdi_codes)
+        if matrix is None or len(matrix.datas) < 2:
+            return {"data_referencia": None, "total": 0, "ativos": pd.DataFrame()}
+
+        df = self.compute(matrix, janela)
+        filtro = df["sessoes"] > 0
+        if volume_min is not None:
+            filtro &= df["volume_medio"] >= volume_min
+        if retorno_min is not None:
+            filtro &= df["retorno"] >= retorno_min
+        if retorno_max is not None:
+            filtro &= df["retorno"] <= retorno_max
+        if nova_maxima:
+            filtro &= df["nova_maxima"]
+        if nova_minima:
+            filtro &= df["nova_minima"]
+
+        df = df[filtro].sort_values(ordenar, ascending=(ordem == "asc"), na_position="last")
+        return {
+            "data_referencia": format_dates(matrix.datas[-1:])[0],
+            "total": int(filtro.sum()),
+            "ativos": df.head(limite).reset_index(drop=True),
+        }
+
+# Instância compartilhada (a matriz vale para todas as requisições do processo)
+screener_service = ScreenerService()
@@ -0,0 +1,98 @@
+# services/ticker_cache.py
+import threading
+from collections import OrderedDict
+import pandas as pd
+from core.config import settings
+from services.data_version import data_version
+
+class TickerCache:
+    """
+    Cache LRU, limitado por memória, do histórico de cada ticker em forma de arrays NumPy
+    (formato de armazenamento: datas int AAAAMMDD, preços int em centavos).
+    É invalidado por inteiro quando a geração dos dados publicada pelo ETL muda.
+    """
+
+    def __init__(self, max_bytes: int = None, version=None):
+        self.max_bytes = settings.TICKER_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.version = version or data_version
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def to_arrays(df: pd.DataFrame) -> dict:
+        """Converte o DataFrame em arrays compactos: numéricos como estão e texto em largura fixa (sem objetos)."""
+        arrays = {}
+        for col in df.columns:
+            values = df[col].to_numpy()
+            arrays[col] = values if values.dtype.kind in "iufb" else values.astype(str)
+        return arrays
+
+    @staticmethod
+    def size_of(arrays: dict) -> int:
+        return sum(values.nbytes for values in arrays.values())
+
+    def _check_generation(self):
+        generation = self.version.current()
+        if generation != self._generation:
+            self._items.clear()
+            self.bytes = 0
+            self._generation = generation
+
+    def get(self, ticker: str):
+        """Arrays do ticker, ou None se não estiver em cache."""
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            self._check_generation()
+            arrays = self._items.get(ticker)
+            if arrays is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(ticker)
+            self.hits += 1
+            return arrays
+
+    def put(self, ticker: str, arrays: dict):
+        """Guarda os arrays do ticker, descartando os menos usados até caber no orçamento."""
+        size = self.size_of(arrays)
+        if self.max_bytes <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation()
+            anterior = self._items.pop(ticker, None)
+            if anterior is not None:
+                self.bytes -= self.size_of(anterior)
+            self._items[ticker] = arrays
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, removido = self._items.popitem(last=False)
+                self.bytes -= self.size_of(removido)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+            self._generation = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "itens": len(self._items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "geracao": self._generation,
+            }
+
+# Instância compartilhada por todas as requisições do processo
+ticker_cache = TickerCache()
@@ -0,0 +1,168 @@
+# services/ticker_index.py
+import difflib
+import threading
+import numpy as np
+import pandas as pd
+from core.database import db_manager
+from core.async_database import async_db_manager
+from core.constants import CacheConstants, MarketConstants, TickerIndexConfig
+from core.schema import format_dates
+from services.data_version import data_version
+
+class TickerUniverse:
+    """
+    Universo de ativos em memória, já na ordem de liquidez (posição 0 = mais líquido).
+    A busca usa arrays ordenados (searchsorted) de tickers e de palavras do nome: prefixos em O(log n),
+    sem varrer a lista a cada tecla.
+    """
+
+    COLUMNS = ["ticker", "nome_empresa", "cod_bdi", "primeiro_pregao", "ultimo_pregao",
+               "sessoes", "volume_medio", "volume_maximo", "ranking"]
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.sort_values("ranking").reset_index(drop=True)
+        self.frame = df
+        self.tickers = df["ticker"].to_numpy().astype(str)
+        self.volume_maximo = df["volume_maximo"].to_numpy(dtype=float)
+
+        ordem = np.argsort(self.tickers, kind="stable")
+        self.ticker_sorted, self.ticker_pos = self.tickers[ordem], ordem
+
+        # Cada palavra do nome da empresa aponta para a posição do ativo
+        nomes = df["nome_empresa"].fillna("").astype(str).str.upper().to_numpy().astype(str)
+        palavras = [(palavra, i) for i, nome in enumerate(nomes) for palavra in nome.split()]
+        texto = np.array([p for p, _ in palavras], dtype=str)
+        pos = np.array([i for _, i in palavras], dtype=np.int64)
+        ordem = np.argsort(texto, kind="stable")
+        self.word_sorted, self.word_pos = texto[ordem], pos[ordem]
+        self.nomes = nomes
+
+    @staticmethod
+    def _prefix(sorted_values: np.ndarray, positions: np.ndarray, q: str) -> np.ndarray:
+        """Posições cujo valor começa com `q`: faixa contígua do array ordenado."""
+        inicio = np.searchsorted(sorted_values, q, side="left")
+        fim = np.searchsorted(sorted_values, q + "\uffff", side="left")
+        return positions[inicio:fim]
+
+    def search(self, q: str, limite: int = TickerIndexConfig.SEARCH_LIMIT) -> pd.DataFrame:
+        """
+        Ativos que casam com `q`, em camadas: ticker exato, prefixo do ticker, prefixo de uma palavra do nome,
+        trecho do ticker ou do nome e, sem nenhum resultado, tickers parecidos (erros de digitação).
+        Dentro de cada camada, do mais líquido para o menos líquido.
+        """
+        q = q.strip().upper()
+        if not q:
+            return self.frame.head(0)
+
+        camadas = [
+            self._prefix(self.ticker_sorted, self.ticker_pos, q),
+            self._prefix(self.word_sorted, self.word_pos, q),
+        ]
+        if len(np.unique(np.concatenate(camadas))) < limite:
+            # Trecho em qualquer posição: só varre o universo quando os prefixos não bastam
+            camadas.append(np.flatnonzero((np.char.find(self.tickers, q) >= 0) | (np.char.find(self.nomes, q) >= 0)))
+        if not any(len(c) for c in camadas):
+            parecidos = difflib.get_close_matches(q, self.tickers.tolist(), n=limite, cutoff=TickerIndexConfig.FUZZY_CUTOFF)
+            camadas.append(np.flatnonzero(np.isin(self.tickers, parecidos)))
+
+        exato = np.flatnonzero(self.tickers == q)
+        # Ordem final: camada (exato primeiro) e, dentro dela, posição no ranking de liquidez
+        vistos, resultado = set(), []
+        for camada in [exato, *camadas]:
+            for pos in np.sort(camada).tolist():
+                if pos not in vistos:
+                    vistos.add(pos)
+                    resultado.append(pos)
+            if len(resultado) >= limite:
+                break
+        return self.frame.iloc[resultado[:limite]]
+
+    def page(self, offset: int, limite: int, min_volume: float = 0) -> tuple:
+        """(total, página) dos ativos com algum pregão de volume >= min_volume, por liquidez."""
+        posicoes = np.flatnonzero(self.volume_maximo >= min_volume)
+        return len(posicoes), self.tickers[posicoes[offset:offset + limite]].tolist()
+
+class TickerIndex:
+    """
+    Dimensão de ativos (dim_ativos): montada pelo ETL numa única agregação sobre as cotações
+    e carregada pela API em memória uma vez por versão dos dados.
+    """
+
+    TABLE = CacheConstants.TABLE_TICKERS
+    # Só as linhas da versão vigente: durante a publicação a tabela tem linhas da anterior (e das duas misturadas)
+    QUERY = f"SELECT * FROM {CacheConstants.TABLE_TICKERS} WHERE versao = :v"
+
+    def __init__(self, version=None):
+        self.version = version or data_version
+        self._lock = threading.Lock()
+        self._loaded = (None, None)
+
+    def publish(self, versao: int = None, sessoes: int = TickerIndexConfig.LIQUIDITY_SESSIONS) -> int:
+        """Etapa pós-ETL: recalcula a dimensão (upsert por ticker) e remove quem não está mais no universo."""
+        versao = self.version.current() if versao is None else versao
+        historico = CacheConstants.TABLE_HISTORICO
+        bdi_string = ", ".join([f"'{b}'" for b in MarketConstants.ALLOWED_BDI_CODES])
+        df = db_manager.get_from_cache(f"""
+            SELECT ticker, MAX(nome_empresa) AS nome_empresa, MIN(cod_bdi) AS cod_bdi,
+                   MIN(data_pregao) AS primeiro_pregao, MAX(data_pregao) AS ultimo_pregao,
+                   COUNT(*) AS sessoes, MAX(volume) AS volume_maximo,
+                   SUM(CASE WHEN data_pregao >= (
+                       SELECT MIN(data_pregao) FROM (
+                           SELECT DISTINCT data_pregao FROM {historico} ORDER BY data_pregao DESC LIMIT :sessoes
+                       ) AS recentes
+                   ) THEN volume ELSE 0 END) AS volume_recente
+            FROM {historico}
+            WHERE cod_bdi IN ({bdi_string})
+            GROUP BY ticker
+        """, {"sessoes": sessoes})
+        if df.empty:
+            return 0
+
+        # Volume médio diário na janela recente (pregões sem negócio contam como zero)
+        df["volume_medio"] = df.pop("volume_recente").astype(float) / sessoes
+        df = df.sort_values(["volume_medio", "ticker"], ascending=[False, True]).reset_index(drop=True)
+        df["ranking"] = np.arange(1, len(df) + 1)
+        df["versao"] = versao
+        if not db_manager.upsert_to_cache(df, self.TABLE, CacheConstants.TICKERS_KEY):
+            raise RuntimeError("Falha ao gravar a dimensão de ativos")
+        db_manager.execute_raw(f"DELETE FROM {self.TABLE} WHERE versao < :v", {"v": versao})
+        return len(df)
+
+    @staticmethod
+    def build(df: pd.DataFrame):
+        """Universo em memória, ou None se a dimensão ainda não foi gerada (banco anterior ao índice)."""
+        if df.empty or not set(TickerUniverse.COLUMNS) <= set(df.columns):
+            return None
+        return TickerUniverse(df[TickerUniverse.COLUMNS])
+
+    def _store(self, versao: int, universo):
+        """Guarda o universo da versão; vazio (dimensão dessa versão ainda não publicada) não é guardado."""
+        if universo is not None:
+            with self._lock:
+                self._loaded = (versao, universo)
+        return universo
+
+    def load(self):
+        versao = self.version.current()
+        with self._lock:
+            if self._loaded[0] == versao:
+                return self._loaded[1]
+        return self._store(versao, self.build(db_manager.get_from_cache(self.QUERY, {"v": versao})))
+
+    async def load_async(self):
+        versao = self.version.current()
+        with self._lock:
+            if self._loaded[0] == versao:
+                return self._loaded[1]
+        return self._store(versao, self.build(await async_db_manager.get_from_cache(self.QUERY, {"v": versao})))
+
+    @staticmethod
+    def to_records(df: pd.DataFrame) -> list:
+        """Linhas da dimensão para a API (datas 'AAAA-MM-DD')."""
+        df = df.copy()
+        for col in ["primeiro_pregao", "ultimo_pregao"]:
+            df[col] = format_dates(df[col].to_numpy()) if len(df) else df[col]
+        return df.drop(columns=["volume_maximo"]).to_dict(orient="records")
+
+# Instância compartilhada (o universo vale para todas as requisições do processo)
+ticker_index = TickerIndex()
@@ -0,0 +1,83 @@
+# services/warmup.py
+import asyncio
+import logging
+import threading
+import time
+from core.config import settings
+from services.market_service import MarketService
+from services.ticker_index import ticker_index
+from services.chart_renderer import chart_renderer
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """
+    Aquecimento da API na inicialização: carrega o universo de ativos (dim_ativos), o histórico dos mais
+    líquidos no cache de memória e a renderização de gráficos (processos do pool com Matplotlib e fontes).
+    Cada etapa é best-effort: uma falha fica registrada, mas não impede a API de declarar prontidão.
+    """
+
+    def __init__(self, tickers: int = None):
+        self.tickers = settings.PREWARM_TICKERS if tickers is None else tickers
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+        self.errors = {}
+
+    async def _step(self, nome: str, coro):
+        inicio = time.perf_counter()
+        try:
+            resultado = await coro
+        except Exception as e:
+            logger.warning(f"Aquecimento: etapa '{nome}' falhou ({e})")
+            self.errors[nome] = str(e)
+            resultado = None
+        self.steps[nome] = {"ms": round((time.perf_counter() - inicio) * 1000, 1), "resultado": resultado}
+        return resultado
+
+    async def _universe(self):
+        universo = await ticker_index.load_async()
+        return 0 if universo is None else len(universo.tickers)
+
+    async def _history(self):
+        """Histórico dos ativos mais líquidos (ordem do ranking) no cache de memória."""
+        service = MarketService()
+        tickers = await service.list_available_tickers_async(content_limit=self.tickers)
+        for ticker in tickers:
+            await service.get_ticker_data_async(ticker)
+        return len(tickers)
+
+    async def run(self) -> dict:
+        """Roda todas as etapas (a renderização numa thread, em paralelo às leituras do banco)."""
+        with self._lock:
+            self._reset()
+            self.started_at = time.time()
+        if settings.PREWARM_ENABLED:
+            graficos = asyncio.create_task(self._step("graficos", asyncio.to_thread(chart_renderer.warm_up)))
+            await self._step("universo", self._universe())
+            if self.tickers > 0:
+                await self._step("historico", self._history())
+            await graficos
+        with self._lock:
+            self.finished_at = time.time()
+            self.ready = True
+        return self.status()
+
+    def status(self) -> dict:
+        with self._lock:
+            duracao = (self.finished_at or time.time()) - self.started_at if self.started_at else None
+            return {
+                "pronto": self.ready,
+                "aquecimento": settings.PREWARM_ENABLED,
+                "segundos": round(duracao, 3) if duracao is not None else None,
+                "etapas": dict(self.steps),
+                "erros": dict(self.errors),
+            }
+
+# Instância compartilhada (estado de prontidão do processo da API)
+warmup = Warmup()
@@ -35,12 +35,28 @@ function renderAssetList(tickers) {
 
 function setupSearch() {
   const searchInput = document.getElementById("search-input");
+  let timer = null;
   searchInput.addEventListener("input", (e) => {
-    const searchTerm = e.target.value.toUpperCase();
-    const filteredTickers = allTickers.filter((ticker) =>
-      ticker.includes(searchTerm)
-    );
-    renderAssetList(filteredTickers);
+    const searchTerm = e.target.value.trim();
+    clearTimeout(timer);
+    // Campo vazio: volta à lista completa (já ordenada por liquidez)
+    if (!searchTerm) {
+      renderAssetList(allTickers);
+      return;
+    }
+    // Busca no servidor (ticker ou nome da empresa), aguardando uma pausa na digitação
+    timer = setTimeout(async () => {
+      try {
+        const params = new URLSearchParams({ q: searchTerm, limite: 50 });
+        const response = await fetch(`${API_URL}/ativos/busca?${params}`);
+        const data = await response.json();
+        if (searchInput.value.trim() === searchTerm) {
+          renderAssetList(data.ativos.map((ativo) => ativo.ticker));
+        }
+      } catch (err) {
+        console.error("Erro na busca:", err);
+      }
+    }, 150);
   });
 }
 
@@ -55,8 +71,26 @@ async function loadAsset(ticker) {
   document.getElementById("dashboard-view").classList.remove("hidden");
   document.getElementById("active-ticker").innerText = ticker;
 
+  await fetchAssetData();
+}
+
+/**
+ * Busca o histórico já reduzido no servidor: no máximo um ponto por pixel do canvas.
+ * Linhas usam LTTB sobre a série exibida; volume usa agregação por faixa de pregões.
+ */
+async function fetchAssetData() {
+  const canvas = document.getElementById("mainChart");
+  const maxPontos = Math.max(100, Math.round(canvas.clientWidth || 1000));
+  const amostragem = currentMode === "volume" ? "ohlc" : "lttb";
+  const params = new URLSearchParams({
+    max_pontos: maxPontos,
+    amostragem: amostragem,
+    serie: currentMode,
+    formato: "colunas",
+  });
+
   try {
-    const response = await fetch(`${API_URL}/ativos/${ticker}`);
+    const response = await fetch(`${API_URL}/ativos/${currentTicker}?${params}`);
     assetData = await response.json();
 
     // Sempre que carregar um novo ativo, renderiza o gráfico com o modo atual
@@ -79,8 +113,8 @@ function updateDisplay(mode) {
   const activeBtn = document.getElementById(`btn-${mode}`);
   if (activeBtn) activeBtn.classList.add("active");
 
-  // Re-renderiza o gráfico com os dados que já temos na memória
-  renderChart();
+  // A redução de pontos depende da série exibida: busca de novo no servidor
+  if (currentTicker) fetchAssetData();
 }
 
 function renderChart() {
@@ -99,12 +133,13 @@ function renderChart() {
   // const labels = assetData.map((d) =>
   //   new Date(d.data_pregao).toLocaleDateString()
   // );
-  const labels = assetData.map((d) => {
-    // Se d.data_pregao já for "2025-01-02", o split garante o formato BR
-    const data = d.data_pregao.split("-");
+  // Resposta colunar: uma lista por coluna ({"data_pregao": [...], "fechamento": [...]})
+  const labels = assetData.data_pregao.map((d) => {
+    // Se d já for "2025-01-02", o split garante o formato BR
+    const data = d.split("-");
     return `${data[2]}/${data[1]}/${data[0]}`; // Retorna DD/MM/YYYY
   });
-  const values = assetData.map((d) => d[currentMode]);
+  const values = assetData[currentMode];
   const isVolume = currentMode === "volume";
 
   // 3. CONFIGURAÇÃO DO GRÁFICO
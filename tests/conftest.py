@@ -0,0 +1,63 @@
+import pytest
+
+@pytest.fixture(autouse=True)
+def banco_temporario(tmp_path, monkeypatch):
+    """
+    Cada teste grava num SQLite próprio em pasta temporária, nunca em database/b3_cotacoes.db.
+    A versão dos dados e o cache de históricos recomeçam do zero (o banco novo está na versão 0).
+    """
+    from core.database import DatabaseManager, db_manager
+    from core.async_database import async_db_manager
+    from services.data_version import data_version
+    from services.ticker_cache import ticker_cache
+    banco = DatabaseManager(f"sqlite:///{tmp_path / 'testes.db'}")
+    monkeypatch.setattr(db_manager, "engine", banco.engine)
+    monkeypatch.setattr(db_manager, "session_factory", banco.session_factory)
+    monkeypatch.setattr(data_version, "_ready", False)
+    monkeypatch.setattr(data_version, "_cached", 0)
+    monkeypatch.setattr(data_version, "_checked_at", 0.0)
+    ticker_cache.invalidate()
+    yield
+    ticker_cache.invalidate()
+    # O engine assíncrono é criado por URL: o do banco temporário não serve a mais nenhum teste
+    async_db_manager._engines.pop(banco.engine.url.render_as_string(hide_password=True), None)
+    banco.engine.dispose()
+
+@pytest.fixture(autouse=True)
+def matriz_em_diretorio_temporario(tmp_path, monkeypatch):
+    """As matrizes geradas pelo ETL nos testes vão para uma pasta temporária, não para database/."""
+    from services.correlation_service import returns_matrix
+    monkeypatch.setattr(returns_matrix, "directory", tmp_path / "matrizes")
+
+@pytest.fixture(autouse=True)
+def graficos_em_diretorio_temporario(tmp_path, monkeypatch):
+    """
+    O cache de gráficos renderizados dos testes também fica numa pasta temporária e começa vazio.
+    A pré-renderização do ETL fica desligada (só o teste dela liga) e a renderização roda na
+    própria thread, sem subir o pool de processos (testado à parte).
+    """
+    from core.config import settings
+    from services.chart_cache import chart_cache
+    from services.chart_renderer import chart_renderer
+    monkeypatch.setattr(settings, "CHART_PRERENDER_TOP", 0)
+    monkeypatch.setattr(chart_renderer, "workers", 0)
+    monkeypatch.setattr(chart_cache, "directory", tmp_path / "graficos")
+    chart_cache._items.clear()
+    chart_cache.bytes = 0
+
+@pytest.fixture(autouse=True)
+def universo_de_ativos_vazio():
+    """Cada teste carrega a dimensão de ativos do seu próprio banco (versões de bancos diferentes coincidem)."""
+    from services.ticker_index import ticker_index
+    ticker_index._loaded = (None, None)
+    yield
+    ticker_index._loaded = (None, None)
+
+@pytest.fixture(autouse=True)
+def snapshot_em_diretorio_temporario(tmp_path, monkeypatch):
+    """O snapshot binário do ETL vai para uma pasta temporária e nenhum mapeamento passa de um teste a outro."""
+    from services.market_snapshot import market_snapshot
+    monkeypatch.setattr(market_snapshot, "directory", tmp_path / "snapshot")
+    market_snapshot._view, market_snapshot._key = None, None
+    yield
+    market_snapshot._view, market_snapshot._key = None, None
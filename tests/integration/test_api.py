@@ -26,7 +26,7 @@ def test_api_root():
 
 def test_api_get_ativos_error_handling():
     """Testa se a API lida com erros de banco retornando 500."""
-    with patch.object(MarketService, 'list_available_tickers', side_effect=Exception("DB Error")):
+    with patch.object(MarketService, 'list_available_tickers_async', side_effect=Exception("DB Error")):
         response = client.get("/ativos")
         assert response.status_code == 500
         assert "Erro interno" in response.json()["detail"]
@@ -40,3 +40,730 @@ def test_save_and_get_cache():
     
     assert not recovered_df.empty
     assert recovered_df.iloc[0]['ticker'] == "TEST3"
+
+def test_incremental_ingest_is_idempotent(tmp_path):
+    """Reprocessar o mesmo arquivo no modo incremental não duplica nada; arquivos novos só fazem upsert."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    ano = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=5)
+    # Arquivo "diário" que repete os 5 pregões e traz 2 novos
+    diario = write_cotahist(tmp_path / "COTAHIST_D.TXT", n_tickers=4, n_sessoes=7, seed=7)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        assert processor.import_raw_file(ano, incremental=True) == 20
+        assert processor.import_raw_file(ano, incremental=True) == 0
+        assert processor.import_raw_file(diario, incremental=True) == 28
+
+        total = db_manager.get_from_cache("SELECT COUNT(*) AS n FROM cotacoes_historicas")
+        manifest = db_manager.get_from_cache("SELECT * FROM etl_manifest ORDER BY data_fim")
+
+    assert total.iloc[0]["n"] == 28
+    assert len(manifest) == 2
+    assert manifest.iloc[0]["data_inicio"] == "2024-01-02"
+
+def test_parallel_backfill_single_writer(tmp_path):
+    """O backfill paralelo grava o mesmo conteúdo que a ingestão sequencial e reporta tempo por arquivo."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+    from datetime import date
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    write_cotahist(tmp_path / "COTAHIST_A2023.TXT", n_tickers=5, n_sessoes=8, inicio=date(2023, 1, 2))
+    write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=5, n_sessoes=6, inicio=date(2024, 1, 2))
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        # Blocos pequenos forçam vários pedaços por arquivo
+        stats = B3ETLProcessor().backfill(tmp_path, workers=2, chunk_records=7)
+        total = db_manager.get_from_cache("SELECT COUNT(*) AS n FROM cotacoes_historicas")
+
+    assert total.iloc[0]["n"] == 70
+    assert [s["gravados"] for s in stats] == [40, 30]
+    assert all(s["registros_por_segundo"] > 0 for s in stats)
+
+def test_parallel_backfill_splits_zip_into_ranges(tmp_path, capsys):
+    """O .ZIP é descompactado para um TXT temporário e dividido em faixas, como o TXT: nada de arquivo inteiro por processo."""
+    import zipfile
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    origem = tmp_path / "dados"
+    origem.mkdir()
+    txt = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=5, n_sessoes=6)
+    with zipfile.ZipFile(origem / "COTAHIST_A2024.ZIP", "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(txt, arcname="COTAHIST_A2024.TXT")
+    with zipfile.ZipFile(origem / "COTAHIST_A2023.ZIP", "w") as zf:
+        zf.writestr("COTAHIST_A2023.TXT", b"")
+
+    with patch.object(db_manager, 'engine', create_engine(f"sqlite:///{tmp_path / 'etl.db'}")), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        stats = B3ETLProcessor().backfill(origem, workers=2, chunk_records=7)
+        total = db_manager.get_from_cache("SELECT COUNT(*) AS n FROM cotacoes_historicas")
+
+    # 30 cotações + header e trailer em faixas de 7 registros; o membro vazio não gera faixa
+    assert "2 arquivos (2 descompactados), 5 faixas" in capsys.readouterr().out
+    assert total.iloc[0]["n"] == 30
+    assert stats[1]["gravados"] == 30
+
+def test_backfill_rejects_overlapping_periods_before_reset(tmp_path):
+    """Anual + mensal do mesmo ano são recusados antes de esvaziar a tabela; no incremental viram upsert."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+    from datetime import date
+
+    assert B3ETLProcessor.file_period("dados/COTAHIST_A2023.ZIP") == (20230101, 20231231)
+    assert B3ETLProcessor.file_period("COTAHIST_M022023.TXT") == (20230201, 20230231)
+    assert B3ETLProcessor.file_period("COTAHIST_D17102026.TXT") == (20261017, 20261017)
+    assert B3ETLProcessor.file_period("outro.TXT") is None
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    origem = tmp_path / "dados"
+    origem.mkdir()
+    write_cotahist(origem / "COTAHIST_A2022.TXT", n_tickers=3, n_sessoes=4, inicio=date(2022, 1, 3))
+    write_cotahist(origem / "COTAHIST_A2023.TXT", n_tickers=3, n_sessoes=4, inicio=date(2023, 1, 2))
+    write_cotahist(origem / "COTAHIST_M012023.TXT", n_tickers=3, n_sessoes=4, inicio=date(2023, 1, 2))
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        processor.backfill(origem / "COTAHIST_A2022.TXT", workers=1)
+        with pytest.raises(ValueError, match="sobrepostos: COTAHIST_M012023.TXT e COTAHIST_A2023.TXT"):
+            processor.backfill(origem, workers=1)
+        # A carga anterior continua intacta
+        antes = db_manager.get_from_cache("SELECT COUNT(*) AS n FROM cotacoes_historicas")
+
+        processor.backfill(origem, workers=1, incremental=True)
+        depois = db_manager.get_from_cache("SELECT COUNT(*) AS n FROM cotacoes_historicas")
+
+    assert antes.iloc[0]["n"] == 12
+    assert depois.iloc[0]["n"] == 24
+
+def test_bulk_save_sqlite_without_index_column(tmp_path):
+    """A carga em massa no SQLite grava só as colunas do DataFrame e restaura os pragmas."""
+    from core.database import DatabaseManager
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'bulk.db'}")
+    df = pd.DataFrame({"ticker": ["PETR4", "VALE3", None], "fechamento": [35.5, None, 1.0], "volume": [1, 2, 3]})
+
+    assert manager.bulk_save(df, "bulk", if_exists="replace") == 3
+    assert manager.bulk_save(df, "bulk", if_exists="append") == 3
+
+    lido = manager.get_from_cache("SELECT * FROM bulk")
+    assert len(lido) == 6
+    assert "index" not in lido.columns
+    assert lido["fechamento"].isna().sum() == 2
+    with manager.engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() != "memory"
+
+def test_bulk_save_falls_back_to_to_sql(tmp_path):
+    """Se o caminho rápido falhar, a carga cai para o to_sql padrão."""
+    from core.database import DatabaseManager
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'bulk.db'}")
+    df = pd.DataFrame({"ticker": ["PETR4"], "fechamento": [35.5]})
+
+    with patch.object(DatabaseManager, '_bulk_sqlite', side_effect=RuntimeError("sem executemany")):
+        assert manager.bulk_save(df, "bulk", if_exists="replace") == 1
+    assert len(manager.get_from_cache("SELECT * FROM bulk")) == 1
+
+def test_save_to_cache_keeps_schema_table_types_and_indexes(tmp_path):
+    """save_to_cache acrescenta por padrão e, com 'replace', só esvazia a tabela do schema: tipos e índices ficam."""
+    from sqlalchemy import inspect
+    from core.database import DatabaseManager
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'schema.db'}")
+    manager.schema.migrate()
+    linha = {"data_pregao": 20240102, "ticker": "PETR4", "cod_bdi": "02", "tipo_registro": 1,
+             "nome_empresa": "PETROBRAS", "abertura": 3510, "maximo": 3600, "minimo": 3490, "medio": 3540,
+             "fechamento": 3555, "qtd_titulos": 100, "volume": 355000}
+    tipos = lambda: {c["name"]: str(c["type"]) for c in inspect(manager.engine).get_columns("cotacoes_historicas")}
+    indices = lambda: {i["name"] for i in inspect(manager.engine).get_indexes("cotacoes_historicas")}
+    antes_tipos, antes_indices = tipos(), indices()
+
+    assert manager.save_to_cache(pd.DataFrame([linha]), "cotacoes_historicas")
+    assert manager.save_to_cache(pd.DataFrame([{**linha, "data_pregao": 20240103}]), "cotacoes_historicas")
+    assert len(manager.get_from_cache("SELECT * FROM cotacoes_historicas")) == 2
+    assert manager.save_to_cache(pd.DataFrame([linha]), "cotacoes_historicas", if_exists="replace")
+
+    assert len(manager.get_from_cache("SELECT * FROM cotacoes_historicas")) == 1
+    assert tipos() == antes_tipos and antes_indices and indices() == antes_indices
+
+def test_schema_migrates_legacy_table_and_indexes(tmp_path):
+    """As migrações convertem a tabela legada (TEXT/float/index) para o schema tipado com índices."""
+    # Como o ETL antigo gravava: preços em reais, exceto o médio (centavos, sem a divisão por 100)
+    from core.database import DatabaseManager
+    from core.schema import from_storage
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'legado.db'}")
+    legado = pd.DataFrame({
+        "tipo_registro": [1, 1], "data_pregao": ["2024-01-02", "2024-01-03"], "cod_bdi": [2, 2],
+        "ticker": ["PETR4", "PETR4"], "nome_empresa": ["PETROBRAS", "PETROBRAS"],
+        "abertura": [35.1, 35.5], "maximo": [36.0, 36.2], "minimo": [34.9, 35.0], "medio": [3540, 3560],
+        "fechamento": [35.55, 35.9], "qtd_titulos": [100, 200], "volume": [355000, 718000],
+    })
+    legado.to_sql("cotacoes_historicas", manager.engine, index=True)
+
+    assert manager.schema.migrate() == 4
+    assert manager.schema.migrate() == 4  # idempotente
+
+    df = manager.get_from_cache("SELECT * FROM cotacoes_historicas ORDER BY data_pregao")
+    assert "index" not in df.columns
+    assert df["data_pregao"].tolist() == [20240102, 20240103]
+    assert df["fechamento"].tolist() == [3555, 3590]
+    # O médio já vinha em centavos do ETL antigo (só abertura/máxima/mínima/fechamento eram divididos)
+    assert df["medio"].tolist() == [3540, 3560]
+    assert from_storage(df)["medio"].tolist() == [35.4, 35.6]
+    assert df["cod_bdi"].tolist() == ["02", "02"]
+    assert from_storage(df)["data_pregao"].tolist() == ["2024-01-02", "2024-01-03"]
+
+    plano = manager.get_from_cache(
+        "EXPLAIN QUERY PLAN SELECT * FROM cotacoes_historicas WHERE ticker = :t ORDER BY data_pregao", {"t": "PETR4"}
+    )
+    assert "ix_cotacoes_historicas_ticker_data" in " ".join(plano["detail"])
+
+def test_schema_reset_drops_and_rebuilds_indexes(tmp_path):
+    """A recarga completa remove os índices antes da carga e os recria depois."""
+    from core.database import DatabaseManager
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'schema.db'}")
+    manager.schema.migrate()
+
+    indices = lambda: set(manager.get_from_cache(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'cotacoes_historicas'")["name"])
+    assert "ix_cotacoes_historicas_bdi_volume" in indices()
+    manager.schema.reset_table("cotacoes_historicas")
+    assert indices() == set()
+    manager.schema.create_indexes("cotacoes_historicas")
+    assert len(indices()) == 3
+
+def test_parquet_backend_runs_services_unchanged(tmp_path):
+    """Com DB_CONNECTION_STRING=parquet://, o ETL e o MarketService funcionam sem mudanças de código."""
+    from core.database import create_db_manager
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    store = create_db_manager(f"parquet:///{tmp_path / 'parquet'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=5)
+
+    with patch('main.db_manager', store), patch('services.ingest_manifest.db_manager', store), \
+         patch('services.data_version.db_manager', store), \
+         patch('services.analysis_service.db_manager', store), \
+         patch('services.market_service.db_manager', store), \
+         patch('services.correlation_service.db_manager', store), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        assert processor.import_raw_file(path, incremental=True) == 20
+        assert processor.import_raw_file(path, incremental=True) == 0
+
+        service = MarketService()
+        tickers = service.list_available_tickers(content_limit=10)
+        df = service.get_ticker_data(tickers[0])
+
+    assert len(tickers) == 4
+    assert len(df) == 5
+    assert df["data_pregao"].iloc[0] == "2024-01-02"
+    assert isinstance(df["fechamento"].iloc[0], float)
+    # Layout particionado por ano e ticker
+    assert (tmp_path / "parquet" / "cotacoes_historicas" / "ano=2024" / f"ticker={tickers[0]}").is_dir()
+
+def test_parquet_backend_upsert_dedupes(tmp_path):
+    """O upsert reescreve só as partições afetadas, sem duplicar chaves."""
+    from core.database import create_db_manager
+    store = create_db_manager(f"parquet:///{tmp_path / 'parquet'}")
+    chave = ["data_pregao", "ticker", "cod_bdi"]
+    df = pd.DataFrame({"data_pregao": [20240102, 20240103], "ticker": ["PETR4", "PETR4"],
+                       "cod_bdi": ["02", "02"], "fechamento": [3500, 3600]})
+
+    assert store.upsert_to_cache(df, "cotacoes_historicas", chave)
+    assert store.upsert_to_cache(df.assign(fechamento=[3550, 3600]), "cotacoes_historicas", chave)
+
+    lido = store.read_table("cotacoes_historicas", columns=["data_pregao", "fechamento"],
+                            filters=[("ticker", "=", "PETR4")])
+    assert sorted(lido["fechamento"].tolist()) == [3550, 3600]
+    assert "ano" not in lido.columns
+
+def test_parquet_backend_declares_unsupported_operations(tmp_path):
+    """O backend Parquet tem a interface comum, não expõe sessões e recusa DML pontual em tabela particionada."""
+    from core.database import BACKEND_OPERATIONS, create_db_manager
+    store = create_db_manager(f"parquet:///{tmp_path / 'parquet'}")
+
+    assert all(callable(getattr(store, op)) for op in BACKEND_OPERATIONS)
+    assert not hasattr(store, "get_session") and set(store.UNSUPPORTED) == {"get_session", "execute_raw"}
+    with pytest.raises(ValueError, match="cotacoes_historicas"):
+        store.execute_raw("DELETE FROM cotacoes_historicas WHERE ticker = :t", {"t": "PETR4"})
+    # Tabelas pequenas (não particionadas) seguem aceitando DDL/DML
+    store.execute_raw("CREATE TABLE IF NOT EXISTS meta (chave TEXT)")
+    store.execute_raw("INSERT INTO meta VALUES (:c)", {"c": "x"})
+    assert store.get_from_cache("SELECT * FROM meta")["chave"].tolist() == ["x"]
+
+def test_metrics_precomputed_after_etl(tmp_path):
+    """O ETL pré-calcula as métricas de todos os tickers; a leitura é só uma consulta indexada, sem duplicatas."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.analysis_service import AnalysisService
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=3, n_sessoes=10)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        processor.import_raw_file(path)
+        processor.import_raw_file(path)  # recarga: nova versão, a anterior é descartada
+
+        linhas = db_manager.get_from_cache("SELECT * FROM metricas_ativos")
+        historico = MarketService().get_ticker_data(linhas["ticker"].iloc[0])
+        metricas = AnalysisService().get_metrics(linhas["ticker"].iloc[0].lower())
+        plano = db_manager.get_from_cache(
+            "EXPLAIN QUERY PLAN SELECT * FROM metricas_ativos WHERE ticker = :t AND versao <= :v "
+            "ORDER BY versao DESC LIMIT 1", {"t": "X", "v": 1})
+
+    assert len(linhas) == 3
+    assert linhas["versao"].nunique() == 1
+    assert metricas["sessoes"] == 10
+    assert metricas["media_fechamento"] == pytest.approx(historico["fechamento"].mean())
+    assert metricas["volatilidade"] == pytest.approx(historico["fechamento"].std())
+    assert "ux_metricas_ativos_chave" in " ".join(plano["detail"])
+
+def test_screener_endpoint_ranks_universe(tmp_path):
+    """O screener responde sobre todo o universo com uma única consulta e aplica filtros e ordenação."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.screener_service import ScreenerService
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=20, n_sessoes=60)
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]), \
+         patch('api.router.screener_service', ScreenerService()):
+        B3ETLProcessor().import_raw_file(path)
+        with patch.object(db_manager, 'get_from_cache', wraps=db_manager.get_from_cache) as spy:
+            resposta = client.get("/screener?janela=20&ordenar=retorno&limite=5")
+            client.get("/screener?janela=5&ordenar=volume_medio&ordem=asc")
+        filtrada = client.get("/screener?volume_min=1e99")
+        invalida = client.get("/screener?ordenar=preco")
+
+    corpo = resposta.json()
+    retornos = [a["retorno"] for a in corpo["ativos"]]
+    assert resposta.status_code == 200
+    assert spy.call_count == 1  # a segunda chamada reaproveita a matriz da mesma versão dos dados
+    assert corpo["total"] == 20 and len(retornos) == 5
+    assert retornos == sorted(retornos, reverse=True)
+    assert filtrada.json()["total"] == 0
+    assert invalida.status_code == 400
+
+def test_correlation_endpoint_over_returns_matrix(tmp_path):
+    """O ETL publica a matriz de retornos (float32, memory-map) e /correlacao bate com o pandas."""
+    import numpy as np
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.correlation_service import returns_matrix
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=5, n_sessoes=80)
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path)
+        datas, tickers, matriz, _ = returns_matrix.load()
+        par = tickers[:2].tolist()
+        historico = {t: MarketService().get_ticker_data(t).set_index("data_pregao")["fechamento"] for t in par}
+        resposta = client.get(f"/correlacao?tickers={','.join(par)},XPTO3&janela=30")
+        movel = client.get(f"/correlacao?tickers={','.join(par)}&janela=30&modo=movel&pontos=10")
+        invalido = client.get("/correlacao?modo=outro")
+
+    assert isinstance(matriz, np.memmap) and matriz.dtype == np.float32
+    assert matriz.shape == (79, 5)
+
+    retornos = np.log(pd.DataFrame(historico)).diff().iloc[-30:]
+    esperado = retornos.corr().iloc[0, 1]
+    corpo = resposta.json()
+    assert corpo["ausentes"] == ["XPTO3"]
+    assert corpo["correlacao"][0][1] == pytest.approx(esperado, abs=1e-5)
+    assert corpo["covariancia"][0][1] == pytest.approx(retornos.cov().iloc[0, 1], rel=1e-4)
+
+    serie = movel.json()["pares"][f"{par[0]}|{par[1]}"]
+    assert len(serie) == 10
+    assert serie[-1] == pytest.approx(esperado, abs=1e-5)
+    assert serie[0] == pytest.approx(np.log(pd.DataFrame(historico)).diff().iloc[-39:-9].corr().iloc[0, 1], abs=1e-5)
+    assert invalido.status_code == 400
+
+def test_adjusted_prices_stored_and_recomputed_incrementally(tmp_path):
+    """O ETL grava OHLC ajustado ao lado do bruto; só tickers com eventos alterados são recalculados."""
+    import numpy as np
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=3, n_sessoes=10)
+    csv = tmp_path / "eventos.csv"
+    csv.write_text("ticker,data_ex,tipo,valor\nAAAX3,2024-01-08,desdobramento,2\nAABX4,2024-01-05,dividendo,0.5\n")
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(settings, 'CORPORATE_ACTIONS_FILE', csv), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        processor.import_raw_file(path)
+        bruto = MarketService().get_ticker_data("AAAX3")
+        ajustado = client.get("/ativos/aaax3?ajustado=true").json()
+        dividendo = MarketService().get_ticker_data("AABX4", ajustado=True)
+        bruto_div = MarketService().get_ticker_data("AABX4")
+
+        assert processor.apply_adjustments() == 0  # nada mudou
+        csv.write_text("ticker,data_ex,tipo,valor\nAAAX3,2024-01-08,desdobramento,2\nAABX4,2024-01-05,dividendo,0.8\n")
+        with patch.object(db_manager, 'upsert_to_cache', wraps=db_manager.upsert_to_cache) as spy:
+            assert processor.apply_adjustments() == 1
+        reajustado = MarketService().get_ticker_data("AABX4", ajustado=True)
+
+    # Payload padrão inalterado: sem colunas de ajuste
+    assert not any(c.endswith("_aj") or c == "fator_ajuste" for c in bruto.columns)
+
+    antes = bruto["data_pregao"] < "2024-01-08"
+    esperado = np.where(antes, bruto["fechamento"] / 2, bruto["fechamento"])
+    np.testing.assert_allclose([r["fechamento"] for r in ajustado], esperado)
+    np.testing.assert_allclose([r["maximo"] for r in ajustado],
+                               np.where(antes, bruto["maximo"] / 2, bruto["maximo"]))
+
+    fech_anterior = bruto_div.loc[bruto_div["data_pregao"] == "2024-01-04", "fechamento"].iloc[0]
+    assert dividendo["fechamento"].iloc[0] == pytest.approx(bruto_div["fechamento"].iloc[0] * (1 - 0.5 / fech_anterior))
+    assert dividendo["fechamento"].iloc[-1] == bruto_div["fechamento"].iloc[-1]
+    assert reajustado["fechamento"].iloc[0] == pytest.approx(bruto_div["fechamento"].iloc[0] * (1 - 0.8 / fech_anterior))
+
+    gravados = spy.call_args_list[0].args[0]
+    assert set(gravados["ticker"]) == {"AABX4"}
+
+def test_etl_prerenders_charts_served_from_cache(tmp_path):
+    """O ETL renderiza os gráficos dos ativos mais líquidos; a API os serve do disco, com ETag e 304."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.chart_cache import chart_cache
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=30)
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(settings, 'CHART_PRERENDER_TOP', 2), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        processor = B3ETLProcessor()
+        processor.import_raw_file(path)
+        versao = chart_cache.version.current()
+        ativo = ChartService.top_liquid(1)[0]
+        pre_renderizados = len(list((chart_cache.directory / f"v{versao}").glob("*.png")))
+        chart_cache._items.clear()  # força a leitura do nível em disco
+
+        with patch.object(ChartService, 'generate_styled_chart', side_effect=AssertionError("renderizou")):
+            resposta = client.get(f"/ativos/{ativo}/graficos?tipo=volume")
+            revalidada = client.get(f"/ativos/{ativo}/graficos?tipo=volume",
+                                    headers={"If-None-Match": resposta.headers["etag"]})
+        svg = client.get(f"/ativos/{ativo}/graficos?formato=svg&largura=400&altura=300")
+
+        processor.import_raw_file(path)
+        processor.import_raw_file(path)
+        nova = client.get(f"/ativos/{ativo}/graficos?tipo=volume",
+                          headers={"If-None-Match": resposta.headers["etag"]})
+
+    assert pre_renderizados == 6  # 2 ativos x 3 tipos
+    assert resposta.status_code == 200 and resposta.headers["content-type"] == "image/png"
+    assert resposta.content.startswith(b"\x89PNG") and "last-modified" in resposta.headers
+    assert revalidada.status_code == 304 and revalidada.content == b""
+    assert svg.headers["content-type"].startswith("image/svg+xml") and b"<svg" in svg.content
+    # Nova versão dos dados: outro ETag, e só a versão anterior à corrente continua em disco
+    assert nova.status_code == 200 and nova.headers["etag"] != resposta.headers["etag"]
+    assert sorted(p.name for p in chart_cache.directory.iterdir()) == [f"v{versao + 1}", f"v{versao + 2}"]
+
+def test_etl_records_stage_timings(tmp_path):
+    """Cada etapa do ETL (leitura, parse, filtro, conversão, gravação, índices, publicação) entra em /metrics."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from core.instrumentation import ETL_STAGE_SECONDS
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'etapas.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=3, n_sessoes=10)
+    etapas = ["read", "parse", "filter", "convert", "write", "index", "adjust", "publish"]
+    antes = {e: ETL_STAGE_SECONDS.count(stage=e) for e in etapas}
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path, chunk_records=10)
+
+    # 30 registros + header e trailer em blocos de 10: 4 blocos lidos e convertidos
+    assert ETL_STAGE_SECONDS.count(stage="parse") - antes["parse"] == 4
+    assert all(ETL_STAGE_SECONDS.count(stage=e) > antes[e] for e in etapas)
+    assert 'b3_etl_stage_seconds_count{stage="publish"}' in client.get("/metrics").text
+
+def test_async_reads_match_sync_with_pooled_engine(tmp_path):
+    """O caminho assíncrono (aiosqlite, pool configurável) devolve o mesmo que o síncrono, sob concorrência."""
+    import asyncio
+    from core.database import DatabaseManager
+    from core.async_database import AsyncDatabaseManager
+    from services.ticker_cache import ticker_cache
+    from benchmarks.cotahist_sintetico import write_cotahist
+    from main import B3ETLProcessor
+
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'async.db'}")
+    assincrono = AsyncDatabaseManager(manager)
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=3, n_sessoes=15)
+
+    async def carga(tickers):
+        # Sem cache em memória: todas as leituras vão ao banco ao mesmo tempo
+        with patch.object(ticker_cache, 'max_bytes', 0):
+            return await asyncio.gather(*(MarketService().get_ticker_data_async(t) for t in tickers * 20))
+
+    with patch.object(db_manager, 'engine', manager.engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]), \
+         patch.object(settings, 'SNAPSHOT_ENABLED', False), \
+         patch('services.market_service.async_db_manager', assincrono):
+        B3ETLProcessor().import_raw_file(path)
+        tickers = MarketService().list_available_tickers()
+        tickers_async = asyncio.run(MarketService().list_available_tickers_async())
+        sincrono = MarketService().get_ticker_data(tickers[0])
+        resultados = asyncio.run(carga(tickers))
+        status = assincrono.pool_status()
+        erro = asyncio.run(assincrono.get_from_cache("SELECT * FROM tabela_inexistente"))
+        asyncio.run(assincrono.dispose())
+
+    assert sorted(tickers_async) == sorted(tickers) and len(tickers) == 3
+    assert len(resultados) == 60 and all(len(df) == 15 for df in resultados)
+    pd.testing.assert_frame_equal(resultados[0], sincrono)
+    assert manager.engine.pool.size() == settings.DB_POOL_SIZE
+    assert f"Pool size: {settings.DB_POOL_SIZE}" in next(iter(status.values()))
+    assert erro.empty
+
+def test_etl_builds_ticker_dimension_for_search_and_paging(tmp_path):
+    """O ETL publica dim_ativos; /ativos pagina pelo ranking de liquidez e /ativos/busca procura nela."""
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'ativos.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=6, n_sessoes=20)
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path)
+        dimensao = db_manager.get_from_cache("SELECT * FROM dim_ativos ORDER BY ranking")
+        primeira = client.get("/ativos?limit=4").json()
+        segunda = client.get("/ativos?limit=4&offset=4").json()
+        ativo = dimensao["ticker"].iloc[0]
+        busca = client.get(f"/ativos/busca?q={ativo[:3].lower()}").json()
+
+    assert len(dimensao) == 6 and dimensao["ranking"].tolist() == list(range(1, 7))
+    assert dimensao["volume_medio"].is_monotonic_decreasing
+    assert dimensao["sessoes"].eq(20).all() and dimensao["primeiro_pregao"].eq(20240102).all()
+    assert primeira["total"] == 6 and primeira["ativos"] == dimensao["ticker"].tolist()[:4]
+    assert segunda["ativos"] == dimensao["ticker"].tolist()[4:]
+    assert busca["ativos"][0]["ticker"] == ativo and busca["ativos"][0]["primeiro_pregao"] == "2024-01-02"
+    assert "volume_maximo" not in busca["ativos"][0]
+
+def test_benchmark_suite_produces_json_results(tmp_path):
+    """A suíte roda ponta a ponta sobre um COTAHIST sintético e gera um resultado serializável em JSON."""
+    import json
+    from sqlalchemy import create_engine
+    from benchmarks.suite import run_suite, comparar
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'bench.db'}")
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        resultado = run_suite(tickers=3, sessoes=10, tmp=str(tmp_path), repeticoes=3)
+        tabelas = db_manager.get_from_cache("SELECT name FROM sqlite_master WHERE type = 'table'")["name"].tolist()
+
+    resultado = json.loads(json.dumps(resultado))
+    assert resultado["meta"]["tickers"] == 3 and resultado["meta"]["sessoes"] == 10
+    assert resultado["resultados"]["etl"]["linhas"] == 30 and resultado["resultados"]["save_to_cache"]["linhas_s"] > 0
+    for medida in ["get_ticker_data_banco", "get_metrics", "api_historico", "api_grafico_cache", "api_grafico_render"]:
+        assert resultado["resultados"][medida]["p50_ms"] <= resultado["resultados"][medida]["p99_ms"]
+    assert "bench_cotacoes" not in tabelas
+    assert not any(c["regressao"] for c in comparar(resultado, resultado))
+
+def test_startup_warmup_loads_liquid_history_before_ready(tmp_path):
+    """Na inicialização da API, o histórico dos ativos mais líquidos vai para o cache antes de /pronto."""
+    import time
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.ticker_cache import ticker_cache
+    from services.warmup import Warmup
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'aquecimento.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=5, n_sessoes=20)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(settings, 'PREWARM_ENABLED', True), \
+         patch.object(settings, 'SNAPSHOT_ENABLED', False), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]), \
+         patch('api.router.warmup', Warmup(tickers=3)):
+        B3ETLProcessor().import_raw_file(path)
+        ticker_cache.invalidate()
+        with TestClient(app) as cliente:
+            fim = time.monotonic() + 30
+            while (pronto := cliente.get("/pronto")).status_code != 200 and time.monotonic() < fim:
+                time.sleep(0.05)
+            mais_liquidos = cliente.get("/ativos?limit=3").json()["ativos"]
+        itens = ticker_cache.stats()["itens"]
+
+    corpo = pronto.json()
+    assert pronto.status_code == 200 and corpo["erros"] == {}
+    assert corpo["etapas"]["universo"]["resultado"] == 5 and corpo["etapas"]["historico"]["resultado"] == 3
+    assert itens == 3 and len(mais_liquidos) == 3
+
+def test_etl_publishes_market_snapshot_served_without_sql(tmp_path):
+    """Após o ETL, o histórico sai do snapshot (sem consulta ao banco) igual ao lido do banco; nova versão troca o arquivo."""
+    import json
+    from sqlalchemy import create_engine
+    from main import B3ETLProcessor
+    from services.market_snapshot import market_snapshot
+    from services.ticker_cache import ticker_cache
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'snapshot.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=25)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(ticker_cache, 'max_bytes', 0), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path)
+        tickers = MarketService().list_available_tickers()
+        with patch.object(db_manager, 'get_from_cache', wraps=db_manager.get_from_cache) as consultas:
+            do_snapshot = {t: MarketService().get_ticker_data(t, ajustado=True) for t in tickers}
+            ausente = MarketService().get_ticker_data("XPTO11")
+        with patch.object(settings, 'SNAPSHOT_ENABLED', False):
+            do_banco = {t: MarketService().get_ticker_data(t, ajustado=True) for t in tickers}
+        antes = market_snapshot.stats()
+        B3ETLProcessor()._publish()
+        depois = market_snapshot.stats()
+
+    assert len(tickers) == 4 and antes["ativo"] and antes["tickers"] == 4 and antes["linhas"] == 100
+    assert not any(MarketService.TICKER_QUERY in str(c) for c in consultas.call_args_list)
+    assert ausente.empty
+    for t in tickers:
+        pd.testing.assert_frame_equal(do_snapshot[t], do_banco[t], check_dtype=False)
+    assert depois["versao"] == antes["versao"] + 1
+    ponteiro = json.loads((market_snapshot.directory / "snapshot.json").read_text())
+    assert ponteiro["arquivo"] == depois["arquivo"] and not list(market_snapshot.directory.glob(".*.tmp"))
+
+def test_history_pushdown_uses_ticker_date_index_and_matches_every_read_path(tmp_path):
+    """
+    As consultas com período, últimos pregões e campos usam o índice (ticker, data_pregao), sem ordenação
+    à parte; banco, cache em memória e snapshot devolvem o mesmo recorte.
+    """
+    from sqlalchemy import create_engine, text
+    from main import B3ETLProcessor
+    from services.ticker_cache import ticker_cache
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'recorte.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=3, n_sessoes=40)
+    service = MarketService()
+    recortes = [
+        {"inicio": "2024-01-10", "fim": "2024-02-05"},
+        {"ultimos": 7, "campos": ["fechamento", "volume"]},
+        {"inicio": "2024-01-15", "ultimos": 3, "campos": ["abertura", "fechamento"], "ajustado": True},
+    ]
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path)
+        ticker = service.list_available_tickers()[0]
+        completo = service.get_ticker_data(ticker)
+        planos, leituras = [], {"snapshot": [], "cache": [], "banco": []}
+        with engine.connect() as conn:
+            for r in recortes:
+                leitura = service._read_args(r.get("inicio"), r.get("fim"), r.get("ultimos"), r.get("campos"),
+                                             r.get("ajustado", False))
+                query, params = service.history_query(ticker, **leitura)
+                planos.append(" | ".join(str(row[-1]) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), params)))
+        for r in recortes:
+            leituras["snapshot"].append(service.get_ticker_data(ticker, **r))
+        with patch.object(settings, 'SNAPSHOT_ENABLED', False):
+            ticker_cache.invalidate()
+            service.get_ticker_data(ticker)  # histórico inteiro no cache
+            for r in recortes:
+                leituras["cache"].append(service.get_ticker_data(ticker, **r))
+            with patch.object(ticker_cache, 'max_bytes', 0), \
+                 patch.object(db_manager, 'get_from_cache', wraps=db_manager.get_from_cache) as consultas:
+                for r in recortes:
+                    leituras["banco"].append(service.get_ticker_data(ticker, **r))
+
+    for plano in planos:
+        assert "SEARCH cotacoes_historicas USING INDEX ix_cotacoes_historicas_ticker_data (ticker=?" in plano
+        assert "TEMP B-TREE" not in plano
+    assert all("LIMIT" in str(c) or "data_pregao >=" in str(c) for c in consultas.call_args_list)
+    assert leituras["banco"][1]["data_pregao"].tolist() == completo["data_pregao"].tolist()[-7:]
+    assert leituras["banco"][1].columns.tolist() == ["data_pregao", "fechamento", "volume"]
+    assert leituras["banco"][0]["data_pregao"].between("2024-01-10", "2024-02-05").all()
+    for i in range(len(recortes)):
+        assert len(leituras["banco"][i]) > 0
+        pd.testing.assert_frame_equal(leituras["snapshot"][i], leituras["banco"][i], check_dtype=False)
+        pd.testing.assert_frame_equal(leituras["cache"][i], leituras["banco"][i], check_dtype=False)
+
+def test_batch_endpoint_reads_all_tickers_in_one_indexed_query(tmp_path):
+    """/ativos/lote lê todos os ativos numa consulta indexada (ou do snapshot, sem SQL) e bate com /ativos/{ativo}."""
+    from sqlalchemy import create_engine, text
+    from core.async_database import async_db_manager
+    from main import B3ETLProcessor
+    from services.ticker_cache import ticker_cache
+    from benchmarks.cotahist_sintetico import write_cotahist
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'lote.db'}")
+    path = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=5, n_sessoes=30)
+    client = TestClient(app)
+
+    with patch.object(db_manager, 'engine', engine), \
+         patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        B3ETLProcessor().import_raw_file(path)
+        tickers = MarketService().list_available_tickers()[:4]
+        url = f"/ativos/lote?tickers={','.join(tickers)},XPTO3&campos=fechamento,volume&inicio=2024-01-05&ultimos=10"
+        individuais = {t: client.get(f"/ativos/{t}?inicio=2024-01-05").json() for t in tickers}
+        with patch.object(db_manager, 'get_from_cache', wraps=db_manager.get_from_cache) as consultas:
+            do_snapshot = client.get(url).json()
+        sem_sql = consultas.call_count
+        with patch.object(settings, 'SNAPSHOT_ENABLED', False), \
+             patch.object(ticker_cache, 'max_bytes', 0), \
+             patch.object(async_db_manager, 'get_from_cache', wraps=async_db_manager.get_from_cache) as consultas:
+            do_banco = client.get(url + "&layout=matriz").json()
+        lidas = [c.args[0] for c in consultas.call_args_list if "cotacoes_historicas" in c.args[0]]
+        query, params = MarketService.batch_query(tickers, ["data_pregao", "fechamento"], inicio=20240105)
+        with engine.connect() as conn:
+            plano = " | ".join(str(r[-1]) for r in conn.execute(text(f"EXPLAIN QUERY PLAN {query}"), params))
+
+    assert sem_sql == 0 and len(lidas) == 1 and "ticker IN" in lidas[0]
+    assert "ix_cotacoes_historicas_ticker_data" in plano and "TEMP B-TREE" not in plano
+    assert do_snapshot["ausentes"] == ["XPTO3"] and list(do_snapshot["ativos"]) == tickers
+    assert len(do_snapshot["datas"]) == 10 and do_banco["datas"] == do_snapshot["datas"]
+    for j, t in enumerate(tickers):
+        esperado = {r["data_pregao"]: r["fechamento"] for r in individuais[t]}
+        serie = do_snapshot["ativos"][t]["fechamento"]
+        assert serie == [esperado.get(d) for d in do_snapshot["datas"]]
+        assert [linha[j] for linha in do_banco["valores"]["fechamento"]] == serie
@@ -0,0 +1,106 @@
+import pytest
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from core.constants import B3Layout
+from services.cotahist_parser import CotahistParser
+from benchmarks.cotahist_sintetico import write_cotahist, build_record, build_header, build_trailer
+
+##########################
+### COTAHIST_PARSER.PY ###
+##########################
+
+def test_parser_types_and_header_trailer(tmp_path):
+    """Header e trailer são descartados pelo tipo de registro e os tipos saem corretos."""
+    path = write_cotahist(tmp_path / "COTAHIST.TXT", n_tickers=3, n_sessoes=4)
+    cols = CotahistParser().parse_file(path)
+
+    assert len(cols["ticker"]) == 12
+    assert cols["data_pregao"].dtype == np.int32
+    assert cols["fechamento"].dtype == np.int64
+    assert cols["ticker"].dtype == np.dtype("S12")
+    assert (cols["tipo_registro"] == 1).all()
+
+def test_parser_matches_read_fwf(tmp_path):
+    """O parser NumPy produz os mesmos valores que o caminho antigo via read_fwf."""
+    path = write_cotahist(tmp_path / "COTAHIST.TXT", n_tickers=5, n_sessoes=10, newline="\n")
+    parser = CotahistParser()
+    df = parser.to_dataframe(parser.parse_file(path))
+
+    legacy = pd.read_fwf(path, colspecs=B3Layout.LAYOUT["colspecs"], names=B3Layout.LAYOUT["names"],
+                         skiprows=1, skipfooter=1)
+    legacy["data_pregao"] = pd.to_datetime(legacy["data_pregao"], format="%Y%m%d").dt.strftime("%Y-%m-%d")
+
+    assert df["ticker"].tolist() == legacy["ticker"].tolist()
+    assert df["data_pregao"].tolist() == legacy["data_pregao"].tolist()
+    assert np.allclose(df["fechamento"], legacy["fechamento"] / 100.0)
+    assert (df["volume"].to_numpy() == legacy["volume"].to_numpy()).all()
+
+def test_parser_record_without_trailing_newline():
+    """Último registro sem quebra de linha ainda é lido."""
+    linhas = [build_header(2024, "20240102"),
+              build_record("20240102", "PETR4", "PETROBRAS", 3500, 3600, 3400, 3550, 100, 355000)]
+    cols = CotahistParser().parse_bytes("\r\n".join(linhas).encode("latin-1"))
+
+    assert cols["ticker"].tolist() == [b"PETR4       "]
+    assert cols["fechamento"].tolist() == [3550]
+
+def test_parser_rejects_invalid_layout():
+    """Linhas fora do tamanho do layout geram erro explícito."""
+    with pytest.raises(ValueError):
+        CotahistParser().parse_bytes(b"01ABC\n01DEF\n")
+
+def test_parser_chunks_match_full_parse(tmp_path):
+    """Ler em blocos pequenos (cortando no meio do arquivo) dá o mesmo resultado que ler inteiro."""
+    path = write_cotahist(tmp_path / "COTAHIST.TXT", n_tickers=7, n_sessoes=9)
+    parser = CotahistParser()
+    full = parser.parse_file(path)
+    chunks = list(parser.iter_chunks(path, chunk_records=10))
+
+    assert len(chunks) > 1
+    merged = parser.concat(chunks)
+    for name in full:
+        assert (merged[name] == full[name]).all()
+
+def test_parser_reads_zip_without_extracting(tmp_path):
+    """O .ZIP distribuído pela B3 é lido diretamente."""
+    import zipfile
+    txt = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=5)
+    zip_path = tmp_path / "COTAHIST_A2024.ZIP"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(txt, arcname="COTAHIST_A2024.TXT")
+
+    parser = CotahistParser()
+    cols = parser.concat(list(parser.iter_chunks(zip_path, chunk_records=3)))
+    assert (cols["fechamento"] == parser.parse_file(txt)["fechamento"]).all()
+
+def test_parser_extracts_zip_member_and_handles_empty_zip(tmp_path):
+    """O membro do .ZIP é extraído em blocos para um TXT divisível em faixas; um membro vazio não quebra o parse."""
+    import zipfile
+    txt = write_cotahist(tmp_path / "COTAHIST_A2024.TXT", n_tickers=4, n_sessoes=5)
+    zip_path = tmp_path / "COTAHIST_A2024.ZIP"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(txt, arcname="COTAHIST_A2024.TXT")
+    vazio = tmp_path / "VAZIO.ZIP"
+    with zipfile.ZipFile(vazio, "w") as zf:
+        zf.writestr("VAZIO.TXT", b"")
+
+    parser = CotahistParser()
+    extraido = parser.extract_member(zip_path, tmp_path / "extraido.TXT", block_bytes=100)
+    assert Path(extraido).read_bytes() == Path(txt).read_bytes()
+    assert len(parser.split_ranges(extraido, chunk_records=5)) == 5
+    with pytest.raises(ValueError):
+        parser.split_ranges(zip_path, chunk_records=5)
+    assert len(parser.parse_file(vazio)["ticker"]) == 0
+
+def test_parser_filter_bdi_and_volume(tmp_path):
+    """O filtro mantém apenas os BDIs permitidos e o volume mínimo."""
+    path = write_cotahist(tmp_path / "COTAHIST.TXT", n_tickers=6, n_sessoes=3, bdi_codes=("02", "12"))
+    parser = CotahistParser()
+    cols = parser.parse_file(path)
+    filtrado = parser.filter_columns(cols, ["02"], min_volume=0)
+
+    assert set(filtrado["cod_bdi"].tolist()) == {b"02"}
+    assert len(filtrado["ticker"]) == 9
+    assert len(parser.filter_columns(cols, ["02", "12"], min_volume=10**18)["ticker"]) == 0
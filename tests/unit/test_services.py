@@ -1,9 +1,10 @@
 import pytest
 import pandas as pd
+import numpy as np
 import os
 from pathlib import Path
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, PropertyMock, patch
 
 # Importações do projeto
 from core.config import settings
@@ -39,7 +40,7 @@ def test_market_service_list_tickers(mock_get):
 ########################
 
 def test_chart_generation_flow():
-    """Testa se o gerador de gráficos retorna um objeto Figure e fecha o buffer."""
+    """Testa se o gerador de gráficos retorna um objeto Figure e se os mesmos dados viram um PNG."""
     service = ChartService()
     
     # Mock do dado para não precisar de banco real
@@ -52,8 +53,10 @@ def test_chart_generation_flow():
         fig = service.generate_styled_chart("PETR4", "fechamento")
         assert fig is not None
         
-        response = service.create_streaming_response(fig)
-        assert response.media_type == "image/png"
+        # A rota serve os bytes de render_bytes (pool de renderização), sobre os mesmos dados e desenho
+        from services.chart_renderer import render_bytes
+        png = render_bytes(service.chart_spec("PETR4"), *service.chart_data("PETR4"))
+        assert png.startswith(b"\x89PNG")
 
 #######################
 ### EXTRAS          ###
@@ -79,4 +82,790 @@ def test_chart_service_invalid_figure_handling():
     # Tenta gerar gráfico para algo que retorna None
     with patch.object(MarketService, 'get_ticker_data', return_value=pd.DataFrame()):
         fig = service.generate_styled_chart("ERRO4")
-        assert fig is None
\ No newline at end of file
+        assert fig is None
+
+@patch('main.IngestManifest')
+@patch('main.ticker_index')
+@patch('main.ChartService')
+@patch('main.AdjustmentService')
+@patch('main.returns_matrix')
+@patch('main.AnalysisService')
+@patch('main.data_version')
+@patch('core.database.DatabaseManager.schema', new_callable=PropertyMock)
+@patch('core.database.db_manager.save_to_cache', return_value=True)
+def test_etl_streaming_writes_in_chunks(mock_save, mock_schema, mock_version, mock_analysis, mock_matrix,
+                                       mock_adjustment, mock_charts, mock_index, mock_manifest, tmp_path):
+    """O ETL grava bloco a bloco, com a tabela esvaziada antes e os índices criados só no final."""
+    from main import B3ETLProcessor
+    from benchmarks.cotahist_sintetico import write_cotahist
+    path = write_cotahist(tmp_path / "COTAHIST.TXT", n_tickers=5, n_sessoes=6)
+
+    eventos = []
+    schema = mock_schema.return_value
+    schema.reset_table.side_effect = lambda t: eventos.append("reset")
+    schema.create_indexes.side_effect = lambda t: eventos.append("indices")
+    mock_save.side_effect = lambda *a, **k: eventos.append("bloco") or True
+
+    with patch.object(MarketConstants, 'DEFAULT_MIN_VOLUME', 0), \
+         patch.object(MarketConstants, 'ALLOWED_BDI_CODES', ["02"]):
+        gravados = B3ETLProcessor().import_raw_file(path, chunk_records=8)
+
+    assert gravados == 30
+    assert eventos[0] == "reset" and eventos[-1] == "indices"
+    assert set(eventos[1:-1]) == {"bloco"}
+    assert all(c.kwargs["if_exists"] == 'append' for c in mock_save.call_args_list)
+    assert all(len(c.args[0]) <= 8 for c in mock_save.call_args_list)
+    # Gravado no formato do schema: data int AAAAMMDD e preços em centavos
+    primeiro = mock_save.call_args_list[0].args[0]
+    assert primeiro["data_pregao"].dtype.kind == "i"
+    assert primeiro["fechamento"].dtype.kind == "i"
+
+#######################
+### TICKER_CACHE.PY ###
+#######################
+
+class FakeVersion:
+    def __init__(self):
+        self.valor = 1
+
+    def current(self):
+        return self.valor
+
+def test_ticker_cache_lru_eviction_and_counters():
+    """O cache respeita o orçamento de memória descartando o menos usado e conta hits/misses."""
+    from services.ticker_cache import TickerCache
+    arrays = lambda: {"data_pregao": np.arange(100, dtype=np.int32), "fechamento": np.arange(100, dtype=np.int64)}
+    cache = TickerCache(max_bytes=2 * 1200, version=FakeVersion())
+
+    cache.put("PETR4", arrays())
+    cache.put("VALE3", arrays())
+    assert cache.get("PETR4") is not None      # PETR4 passa a ser o mais recente
+    cache.put("ITUB4", arrays())               # estoura o orçamento: sai VALE3
+
+    assert cache.get("VALE3") is None
+    assert cache.get("ITUB4") is not None
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+
+def test_ticker_cache_invalidated_by_generation():
+    """Quando o ETL publica uma nova geração, nada do que foi lido antes é servido."""
+    from services.ticker_cache import TickerCache
+    versao = FakeVersion()
+    cache = TickerCache(max_bytes=10_000, version=versao)
+    cache.put("PETR4", {"fechamento": np.array([3500])})
+    assert cache.get("PETR4") is not None
+
+    versao.valor = 2
+    assert cache.get("PETR4") is None
+
+@patch('core.database.db_manager.get_from_cache')
+def test_market_service_uses_ticker_cache(mock_get):
+    """A segunda leitura do mesmo ticker sai do cache, sem nova consulta ao banco."""
+    from services.ticker_cache import TickerCache
+    mock_get.return_value = pd.DataFrame({"data_pregao": [20240102, 20240103], "ticker": ["PETR4", "PETR4"],
+                                          "fechamento": [3500, 3610]})
+    # Sem snapshot publicado (a versão dos dados não é consultada no banco simulado)
+    with patch('services.market_service.market_snapshot.get', return_value=None), \
+         patch('services.market_service.ticker_cache', TickerCache(max_bytes=10_000, version=FakeVersion())):
+        primeiro = MarketService().get_ticker_data("petr4")
+        segundo = MarketService().get_ticker_data("PETR4")
+
+    assert mock_get.call_count == 1
+    assert segundo["data_pregao"].tolist() == ["2024-01-02", "2024-01-03"]
+    assert segundo["fechamento"].tolist() == [35.0, 36.1]
+    assert primeiro.equals(segundo)
+
+############################
+### INDICATOR_SERVICE.PY ###
+############################
+
+def _historico(n, seed):
+    rng = np.random.default_rng(seed)
+    fechamento = 30 + np.cumsum(rng.normal(0, 0.5, n))
+    return pd.DataFrame({
+        "data_pregao": pd.date_range("2024-01-01", periods=n).strftime("%Y-%m-%d"),
+        "abertura": fechamento + rng.normal(0, 0.1, n),
+        "maximo": fechamento + 0.5,
+        "minimo": fechamento - 0.5,
+        "fechamento": fechamento,
+        "volume": rng.integers(1_000, 5_000, n).astype(float),
+    })
+
+def test_indicator_engine_matches_pandas_reference():
+    """Os indicadores vetorizados (vários tickers de tamanhos diferentes) batem com o cálculo do pandas."""
+    from services.indicator_service import IndicatorEngine
+    frames = {"PETR4": _historico(120, 1), "VALE3": _historico(45, 2)}
+    w = 14
+
+    sma = IndicatorEngine.compute("sma", frames, w)
+    ema = IndicatorEngine.compute("ema", frames, w)
+    bb = IndicatorEngine.compute("bollinger", frames, w)
+    dd = IndicatorEngine.compute("drawdown", frames, w)
+    vol = IndicatorEngine.compute("volatilidade", frames, w)
+    atr = IndicatorEngine.compute("atr", frames, w)
+    rsi = IndicatorEngine.compute("rsi", frames, w)
+
+    for ticker, df in frames.items():
+        c = df["fechamento"]
+        assert len(sma[ticker]) == len(df)
+        np.testing.assert_allclose(sma[ticker]["sma"], c.rolling(w).mean())
+        np.testing.assert_allclose(ema[ticker]["ema"][w - 1:], c.ewm(span=w, adjust=False).mean()[w - 1:])
+        np.testing.assert_allclose(bb[ticker]["bb_superior"], c.rolling(w).mean() + 2 * c.rolling(w).std(ddof=0))
+        np.testing.assert_allclose(dd[ticker]["drawdown"], c / c.cummax() - 1)
+        retornos = np.log(c).diff()
+        np.testing.assert_allclose(vol[ticker]["volatilidade"], retornos.rolling(w).std() * np.sqrt(252))
+
+        tr = pd.concat([df["maximo"] - df["minimo"], (df["maximo"] - c.shift()).abs(),
+                        (df["minimo"] - c.shift()).abs()], axis=1).max(axis=1)
+        # ATR de Wilder: semente na média simples das `w` primeiras TRs, depois alpha = 1/w
+        assert atr[ticker]["atr"][:w - 1].isna().all()
+        assert atr[ticker]["atr"][w - 1] == pytest.approx(tr[:w].mean())
+        esperado = [tr[:w].mean()]
+        for valor in tr[w:]:
+            esperado.append((esperado[-1] * (w - 1) + valor) / w)
+        np.testing.assert_allclose(atr[ticker]["atr"][w - 1:], esperado)
+
+        # RSI de Wilder: médias semeadas com a média simples dos `w` primeiros ganhos/perdas
+        delta = np.diff(c.to_numpy())
+        ganho, perda = delta[:w].clip(min=0).mean(), (-delta[:w]).clip(min=0).mean()
+        esperado = [100 - 100 / (1 + ganho / perda)]
+        for d in delta[w:]:
+            ganho = (ganho * (w - 1) + max(d, 0)) / w
+            perda = (perda * (w - 1) + max(-d, 0)) / w
+            esperado.append(100 - 100 / (1 + ganho / perda))
+        np.testing.assert_allclose(rsi[ticker]["rsi"][w:], esperado)
+        assert rsi[ticker]["rsi"][:w].isna().all()
+
+def test_indicator_service_caches_per_data_version():
+    """Resultado em cache por (ticker, indicador, janela, versão); uma nova versão recalcula."""
+    from services.indicator_service import IndicatorService
+    versao = FakeVersion()
+    service = IndicatorService(max_items=10, version=versao)
+    service.market_service = MagicMock()
+    service.market_service.get_histories.side_effect = lambda tickers, campos: {t: _historico(30, 3) for t in tickers}
+
+    service.get_indicators(["PETR4", "VALE3"], "sma", 5)
+    service.get_indicators(["PETR4"], "sma", 5)
+    # Os dois ativos numa leitura só; a segunda chamada sai inteira do cache
+    assert service.market_service.get_histories.call_count == 1
+    assert service.market_service.get_histories.call_args.args[0] == ["PETR4", "VALE3"]
+
+    service.get_indicators(["PETR4"], "sma", 10)
+    versao.valor = 2
+    resultado = service.get_indicators(["PETR4"], "sma", 5)
+    assert service.market_service.get_histories.call_count == 3
+    assert list(resultado["PETR4"].columns) == ["data_pregao", "sma"]
+
+@patch('core.database.db_manager.get_from_cache')
+def test_market_service_histories_in_one_query(mock_get):
+    """Os históricos dos ativos fora do snapshot e do cache vêm de uma única consulta `ticker IN (...)`."""
+    from services.ticker_cache import TickerCache
+    mock_get.return_value = pd.DataFrame({"ticker": ["PETR4", "PETR4", "VALE3"],
+                                          "data_pregao": [20240102, 20240103, 20240103],
+                                          "fechamento": [3000, 3100, 6000]})
+    with patch('services.market_service.market_snapshot.get', return_value=None), \
+         patch('services.market_service.ticker_cache', TickerCache(max_bytes=10_000, version=FakeVersion())):
+        frames = MarketService().get_histories(["petr4", "VALE3", "XPTO3"], ["fechamento"])
+
+    assert mock_get.call_count == 1
+    query, params = mock_get.call_args.args
+    assert "ticker IN (:t0, :t1, :t2)" in query and params == {"t0": "PETR4", "t1": "VALE3", "t2": "XPTO3"}
+    assert list(frames) == ["PETR4", "VALE3"]
+    assert frames["PETR4"].to_dict(orient="list") == {"data_pregao": ["2024-01-02", "2024-01-03"],
+                                                      "fechamento": [30.0, 31.0]}
+
+def test_api_indicators_endpoint():
+    """O endpoint valida o tipo e serializa o aquecimento da janela como null."""
+    from api.router import get_indicator_service
+    fake = MagicMock()
+    fake.get_indicators.return_value = {"PETR4": pd.DataFrame({"data_pregao": ["2024-01-01", "2024-01-02"],
+                                                               "sma": [np.nan, 35.5]})}
+    app.dependency_overrides[get_indicator_service] = lambda: fake
+    try:
+        response = client.get("/ativos/petr4,vale3/indicadores?tipo=SMA&janela=2")
+        invalido = client.get("/ativos/PETR4/indicadores?tipo=macd")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert fake.get_indicators.call_args.args == (["PETR4", "VALE3"], "sma", 2)
+    assert response.json()["ativos"]["PETR4"] == [{"data_pregao": "2024-01-01", "sma": None},
+                                                 {"data_pregao": "2024-01-02", "sma": 35.5}]
+    assert invalido.status_code == 400
+
+###########################
+### SCREENER_SERVICE.PY ###
+###########################
+
+def test_screener_metrics_in_one_pass():
+    """A matriz data x ticker trata pregões sem negócio e as métricas batem com o cálculo direto."""
+    from services.screener_service import MarketMatrix, ScreenerService
+    df = pd.DataFrame({
+        "data_pregao": [20240102, 20240103, 20240104, 20240102, 20240104],
+        "ticker": ["PETR4", "PETR4", "PETR4", "VALE3", "VALE3"],
+        "maximo": [1100, 1200, 1300, 6000, 5900],
+        "minimo": [900, 1000, 1100, 5500, 5000],
+        "fechamento": [1000, 1100, 1300, 5800, 5200],
+        "volume": [10, 20, 30, 100, 300],
+    })
+    matrix = MarketMatrix.from_frame(df)
+    metrics = ScreenerService.compute(matrix, janela=2).set_index("ticker")
+
+    assert matrix.valores["fechamento"].shape == (3, 2)
+    assert metrics.loc["PETR4", "retorno"] == pytest.approx(0.3)
+    # VALE3 não negociou em 03/01: o fechamento anterior é propagado
+    assert metrics.loc["VALE3", "retorno"] == pytest.approx(5200 / 5800 - 1)
+    assert metrics.loc["VALE3", "volume_medio"] == 300
+    assert metrics.loc["VALE3", "sessoes"] == 1
+    assert bool(metrics.loc["PETR4", "nova_maxima"]) and not bool(metrics.loc["VALE3", "nova_maxima"])
+    assert bool(metrics.loc["VALE3", "nova_minima"])
+    assert metrics.loc["PETR4", "ultimo_fechamento"] == 13.0
+
+##############################
+### CORRELATION_SERVICE.PY ###
+##############################
+
+def test_returns_matrix_ignores_pointer_from_previous_version(tmp_path):
+    """Com a versão já incrementada e a matriz nova ainda não publicada, a anterior não é servida nem guardada."""
+    from services.correlation_service import ReturnsMatrix
+    versao = MagicMock()
+    versao.current.return_value = 1
+    matriz = ReturnsMatrix(tmp_path, version=versao)
+    retornos = np.zeros((2, 2), dtype=np.float32)
+    matriz.publish(1, np.array([20240102, 20240103]), np.array(["PETR4", "VALE3"]), retornos)
+    antes = matriz.load()
+
+    versao.current.return_value = 2
+    durante = matriz.load()
+    matriz.publish(2, np.array([20240102, 20240103]), np.array(["PETR4", "VALE3"]), retornos + 1)
+    depois = matriz.load()
+
+    assert antes is not None and durante is None
+    assert depois is not None and float(depois[2][0, 0]) == 1.0
+
+#############################
+### ADJUSTMENT_SERVICE.PY ###
+#############################
+
+def test_adjustment_factors_backward_cumulative_product(tmp_path):
+    """Fatores por produto acumulado de trás para frente, por ticker, valendo antes da data ex."""
+    from services.adjustment_service import AdjustmentService
+    csv = tmp_path / "eventos.csv"
+    csv.write_text(
+        "ticker,data_ex,tipo,valor\n"
+        "petr4,2024-01-04,desdobramento,2\n"
+        "PETR4,2024-01-03,dividendo,1.00\n"
+        "VALE3,2024-01-03,grupamento,10\n"
+        "VALE3,2023-12-01,bonificacao,0.1\n"   # antes de todo o histórico: sem efeito
+    )
+    precos = pd.DataFrame({
+        "ticker": ["VALE3", "PETR4", "PETR4", "PETR4", "VALE3"],
+        "data_pregao": [20240102, 20240102, 20240103, 20240104, 20240103],
+        "fechamento": [500, 2000, 1900, 950, 4900],
+    })
+    eventos = AdjustmentService(csv).load_events()
+    fatores = AdjustmentService.compute_factors(precos, eventos)
+
+    dividendo = 1 - 100 / 2000
+    np.testing.assert_allclose(fatores, [10.0, 0.5 * dividendo, 0.5, 1.0, 1.0])
+    assert eventos["ticker"].tolist() == ["PETR4", "PETR4", "VALE3", "VALE3"]
+    assert eventos["data_ex"].tolist()[2] == 20231201
+
+def test_adjustment_rejects_unknown_event_type(tmp_path):
+    """Tipos de evento fora da lista aceita interrompem a etapa com erro claro."""
+    from services.adjustment_service import AdjustmentService
+    csv = tmp_path / "eventos.csv"
+    csv.write_text("ticker,data_ex,tipo,valor\nPETR4,2024-01-04,cisao,0.3\n")
+    with pytest.raises(ValueError, match="cisao"):
+        AdjustmentService(csv).load_events()
+
+#######################
+### DOWNSAMPLING.PY ###
+#######################
+
+def _lttb_referencia(y, n):
+    """LTTB clássico, ponto a ponto, usado como referência."""
+    escolhidos, a = [0], 0
+    tamanho = (len(y) - 2) / (n - 2)
+    for i in range(n - 2):
+        inicio, fim = int(i * tamanho) + 1, int((i + 1) * tamanho) + 1
+        prox_ini, prox_fim = fim, min(int((i + 2) * tamanho) + 1, len(y) - 1)
+        if i == n - 3:
+            cx, cy = len(y) - 1, y[-1]
+        else:
+            cx, cy = (prox_ini + prox_fim - 1) / 2, np.mean(y[prox_ini:prox_fim])
+        areas = [abs((a - cx) * (y[j] - y[a]) - (a - j) * (cy - y[a])) for j in range(inicio, fim)]
+        a = inicio + int(np.argmax(areas))
+        escolhidos.append(a)
+    return escolhidos + [len(y) - 1]
+
+def test_lttb_matches_reference_and_keeps_extremes():
+    """O LTTB vetorizado escolhe os mesmos pregões da implementação clássica e preserva a amplitude."""
+    from services.downsampling import Downsampler
+    y = np.cumsum(np.random.default_rng(7).normal(size=5_000))
+    idx = Downsampler.lttb_indices(y, 200)
+
+    assert len(idx) == 200 and idx[0] == 0 and idx[-1] == 4_999
+    assert list(idx) == _lttb_referencia(y, 200)
+    assert np.ptp(y[idx]) >= 0.95 * np.ptp(y)  # amplitude da série preservada
+    assert list(Downsampler.lttb_indices(y[:50], 200)) == list(range(50))
+
+def test_ohlc_bucketing_aggregates_candles():
+    """Cada faixa vira um candle: abre no primeiro, fecha no último, máxima/mínima da faixa e volume somado."""
+    from services.downsampling import Downsampler
+    df = pd.DataFrame({
+        "data_pregao": [f"2024-01-{d:02d}" for d in range(1, 7)],
+        "abertura": [10.0, 11, 12, 13, 14, 15], "maximo": [12.0, 15, 13, 14, 20, 16],
+        "minimo": [9.0, 10, 8, 12, 13, 14], "fechamento": [11.0, 12, 13, 14, 15, 16],
+        "volume": [100, 200, 300, 400, 500, 600],
+    })
+    out = Downsampler.ohlc(df, 2)
+
+    assert out["data_pregao"].tolist() == ["2024-01-03", "2024-01-06"]
+    assert out["abertura"].tolist() == [10.0, 13.0]
+    assert out["fechamento"].tolist() == [13.0, 16.0]
+    assert out["maximo"].tolist() == [15.0, 20.0]
+    assert out["minimo"].tolist() == [8.0, 12.0]
+    assert out["volume"].tolist() == [600, 1500]
+
+@patch.object(MarketService, 'get_ticker_data_async')
+def test_api_history_range_and_max_points(mock_data):
+    """/ativos/{ativo} recorta o período e limita a quantidade de pontos devolvidos."""
+    datas = pd.date_range("2020-01-01", periods=2_000).strftime("%Y-%m-%d")
+    mock_data.return_value = pd.DataFrame({"data_pregao": datas, "fechamento": np.arange(2_000.0),
+                                           "volume": np.ones(2_000)})
+
+    completo = client.get("/ativos/PETR4").json()
+    reduzido = client.get("/ativos/PETR4?max_pontos=100&inicio=2021-01-01&fim=2021-12-31").json()
+    candles = client.get("/ativos/PETR4?max_pontos=10&amostragem=ohlc").json()
+    invalido = client.get("/ativos/PETR4?amostragem=media")
+
+    assert len(completo) == 2_000
+    assert len(reduzido) == 100
+    assert reduzido[0]["data_pregao"] == "2021-01-01" and reduzido[-1]["data_pregao"] == "2021-12-31"
+    assert len(candles) == 10 and sum(c["volume"] for c in candles) == 2_000
+    assert invalido.status_code == 400
+
+####################
+### RESPONSES.PY ###
+####################
+
+@patch.object(MarketService, 'get_ticker_data_async')
+def test_api_history_columnar_arrow_and_compression(mock_data):
+    """Formatos colunas/arrow devolvem os mesmos dados; a compressão segue o Accept-Encoding."""
+    import pyarrow as pa
+    datas = pd.date_range("2020-01-01", periods=500).strftime("%Y-%m-%d")
+    mock_data.return_value = pd.DataFrame({"data_pregao": datas, "ticker": "PETR4",
+                                           "fechamento": np.r_[np.nan, np.arange(1.0, 500)]})
+
+    registros = client.get("/ativos/PETR4", headers={"Accept-Encoding": "identity"})
+    colunas = client.get("/ativos/PETR4?formato=colunas").json()
+    arrow = client.get("/ativos/PETR4?formato=arrow", headers={"Accept-Encoding": "identity"})
+    br = client.get("/ativos/PETR4?formato=colunas", headers={"Accept-Encoding": "gzip, br"})
+    gz = client.get("/ativos/PETR4?formato=colunas", headers={"Accept-Encoding": "gzip, br;q=0"})
+
+    assert "content-encoding" not in registros.headers
+    assert registros.json()[0] == {"data_pregao": "2020-01-01", "ticker": "PETR4", "fechamento": None}
+    assert colunas["data_pregao"] == list(datas) and colunas["fechamento"][:2] == [None, 1.0]
+
+    tabela = pa.ipc.open_stream(arrow.content).read_all().to_pandas()
+    assert arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    pd.testing.assert_frame_equal(tabela, mock_data.return_value)
+
+    assert br.headers["content-encoding"] == "br" and "Accept-Encoding" in br.headers["vary"]
+    assert int(br.headers["content-length"]) < len(br.content)  # httpx já descomprime o corpo
+    assert gz.headers["content-encoding"] == "gzip" and gz.json() == colunas
+    assert client.get("/ativos/PETR4?formato=xml").status_code == 400
+
+@patch.object(MarketService, 'get_ticker_data_async')
+def test_api_arrow_without_pyarrow_is_501_and_accept_falls_back_to_json(mock_data):
+    """Sem pyarrow, formato=arrow responde 501 com a causa; o Accept do Arrow só negocia e cai no JSON."""
+    mock_data.return_value = pd.DataFrame({"data_pregao": ["2024-01-02"], "fechamento": [30.0]})
+    with patch('api.router.arrow_available', return_value=False), \
+         patch('api.responses.arrow_available', return_value=False):
+        explicito = client.get("/ativos/PETR4?formato=arrow")
+        negociado = client.get("/ativos/PETR4", headers={"Accept": "application/vnd.apache.arrow.stream"})
+
+    assert explicito.status_code == 501 and "pyarrow" in explicito.json()["detail"]
+    assert negociado.status_code == 200 and negociado.json() == [{"data_pregao": "2024-01-02", "fechamento": 30.0}]
+
+######################
+### CHART_CACHE.PY ###
+######################
+
+def test_chart_cache_memory_and_disk_tiers(tmp_path):
+    """A memória é um LRU limitado por bytes; o que sai dela continua no disco da mesma versão."""
+    from services.chart_cache import ChartCache
+    cache = ChartCache(directory=tmp_path, max_bytes=10, version=MagicMock())
+    chave_a, chave_b = ChartCache.key(1, ticker="A"), ChartCache.key(1, ticker="B")
+
+    cache.put(1, chave_a, "png", b"123456")
+    cache.put(1, chave_b, "png", b"abcdef")  # não cabe junto: A sai da memória
+
+    assert ChartCache.key(1, ticker="A", tipo="x") == ChartCache.key(1, tipo="x", ticker="A")
+    assert ChartCache.key(2, ticker="A") != chave_a
+    assert cache.get(1, chave_a, "png")[0] == b"123456" and cache.disk_hits == 1
+    assert cache.get(2, chave_a, "png") is None  # outra versão dos dados
+    assert cache.stats()["itens"] == 0 and cache.misses == 1
+
+@patch.object(MarketService, 'get_ticker_data')
+def test_api_chart_rendered_once_and_revalidated(mock_data):
+    """O gráfico é renderizado uma vez por versão; If-Modified-Since e If-None-Match devolvem 304."""
+    mock_data.return_value = pd.DataFrame({"data_pregao": ["2023-01-01", "2023-01-02"],
+                                           "fechamento": [10.0, 11.0], "volume": [1.0, 2.0]})
+
+    from services.chart_renderer import chart_renderer
+    from services.data_version import data_version
+    with patch.object(chart_renderer, 'render_async', wraps=chart_renderer.render_async) as render, \
+         patch.object(data_version, 'current', return_value=1):
+        primeira = client.get("/ativos/PETR4/graficos?formato=svg")
+        segunda = client.get("/ativos/PETR4/graficos?formato=svg")
+        por_data = client.get("/ativos/PETR4/graficos?formato=svg",
+                              headers={"If-Modified-Since": primeira.headers["last-modified"]})
+        outro_tamanho = client.get("/ativos/PETR4/graficos?formato=svg&largura=500")
+
+    assert render.call_count == 2  # a primeira e a de outro tamanho
+    assert segunda.content == primeira.content and segunda.headers["etag"] == primeira.headers["etag"]
+    assert por_data.status_code == 304
+    assert outro_tamanho.headers["etag"] != primeira.headers["etag"]
+    assert client.get("/ativos/PETR4/graficos?formato=gif").status_code == 400
+
+#########################
+### CHART_RENDERER.PY ###
+#########################
+
+def test_chart_renderer_process_pool_matches_inline():
+    """O pool recebe só arrays NumPy e devolve os mesmos bytes que a renderização local, também de forma assíncrona."""
+    import asyncio
+    from services.chart_renderer import ChartRenderer, RendererBusy, render_bytes
+    spec = ChartService.chart_spec("PETR4", "fechamento", formato="svg", largura=400, altura=200)
+    x = np.arange("2024-01-01", "2024-03-01", dtype="datetime64[D]")
+    y = np.linspace(10, 20, len(x))
+
+    renderer = ChartRenderer(workers=1, max_pending=2, timeout=60)
+    try:
+        conteudo = renderer.render(spec, x, y)
+        # A rota aguarda o mesmo pool no event loop; acima do tempo limite vira RendererBusy (503)
+        assincrono = asyncio.run(renderer.render_async(spec, x, y))
+        renderer.timeout = 1e-6
+        with pytest.raises(RendererBusy):
+            asyncio.run(renderer.render_async(spec, x, y))
+    finally:
+        renderer.shutdown()
+
+    assert conteudo == render_bytes(spec, x, y) == assincrono
+    assert renderer.stats()["rendered"] == 2
+
+def test_chart_renderer_backpressure_returns_503():
+    """Sem vaga na fila o renderizador recusa na hora, e a rota responde 503 com Retry-After."""
+    from services.chart_renderer import ChartRenderer, RendererBusy, chart_renderer
+    renderer = ChartRenderer(workers=0, max_pending=1)
+    renderer._slots.acquire()  # vaga ocupada por outra renderização
+    with pytest.raises(RendererBusy):
+        renderer.render({}, np.array([]), np.array([]))
+    assert renderer.stats()["rejected"] == 1
+
+    dados = pd.DataFrame({"data_pregao": ["2023-01-01", "2023-01-02"], "fechamento": [10.0, 11.0]})
+    with patch.object(MarketService, 'get_ticker_data', return_value=dados), \
+         patch.object(chart_renderer, 'render_async', side_effect=RendererBusy):
+        resposta = client.get("/ativos/PETR4/graficos")
+
+    assert resposta.status_code == 503
+    assert resposta.headers["retry-after"] == "2"
+
+#######################
+### TICKER_INDEX.PY ###
+#######################
+
+def _universo():
+    from services.ticker_index import TickerUniverse
+    return TickerUniverse(pd.DataFrame({
+        "ticker": ["VALE3", "PETR4", "PETR3", "ITUB4", "PRIO3"],
+        "nome_empresa": ["VALE", "PETROBRAS", "PETROBRAS", "ITAUUNIBANCO", "PETRO RIO"],
+        "cod_bdi": ["02"] * 5,
+        "primeiro_pregao": [20240102] * 5,
+        "ultimo_pregao": [20240131] * 5,
+        "sessoes": [21] * 5,
+        "volume_medio": [9e8, 8e8, 3e8, 5e8, 1e8],
+        "volume_maximo": [2e9, 1e9, 5e8, 7e8, 1e5],
+        "ranking": [1, 2, 4, 3, 5],
+    }))
+
+def test_ticker_universe_search_layers_by_liquidity():
+    """Exato primeiro; depois prefixo do ticker, prefixo do nome, trecho e, por fim, tickers parecidos."""
+    universo = _universo()
+    assert universo.search("petr3")["ticker"].tolist() == ["PETR3"]
+    assert universo.search("PETR")["ticker"].tolist() == ["PETR4", "PETR3", "PRIO3"]  # PRIO3: palavra "PETRO"
+    assert universo.search("RIO")["ticker"].tolist() == ["PRIO3"]  # prefixo de palavra do nome
+    assert universo.search("UNIBANCO")["ticker"].tolist() == ["ITUB4"]  # trecho do nome
+    assert universo.search("VLE3")["ticker"].tolist() == ["VALE3"]  # erro de digitação
+    assert universo.search("PETR", limite=1)["ticker"].tolist() == ["PETR4"]
+    assert universo.search("ZZZZ9").empty and universo.search("  ").empty
+
+def test_ticker_universe_pages_in_liquidity_order():
+    """Paginação pelo ranking, só com ativos que passaram do volume mínimo em algum pregão."""
+    universo = _universo()
+    assert universo.page(0, 10) == (5, ["VALE3", "PETR4", "ITUB4", "PETR3", "PRIO3"])
+    assert universo.page(1, 2, min_volume=1e6) == (4, ["PETR4", "ITUB4"])
+
+def test_ticker_index_loads_only_current_version_and_skips_unpublished():
+    """Só entram as linhas da versão vigente; sem dimensão publicada para ela, nada fica em cache."""
+    from services.ticker_index import TickerIndex
+    # Publicação da versão 2 em andamento: linhas antigas ainda na tabela ao lado das novas
+    frame = _universo().frame
+    linhas = pd.concat([frame.assign(versao=1), frame.head(2).assign(versao=2)], ignore_index=True)
+    versao = MagicMock()
+    versao.current.return_value = 2
+    indice = TickerIndex(version=versao)
+
+    def banco(query, params=None):
+        assert "versao = :v" in query
+        return linhas[linhas["versao"] == params["v"]].reset_index(drop=True)
+
+    with patch('services.ticker_index.db_manager.get_from_cache', side_effect=banco) as consultas:
+        vigente = indice.load()
+        versao.current.return_value = 3
+        antes_de_publicar = [indice.load(), indice.load()]
+
+    assert vigente.tickers.tolist() == ["VALE3", "PETR4"]
+    assert antes_de_publicar == [None, None] and consultas.call_count == 3
+
+def test_api_search_route_is_not_a_ticker():
+    """/ativos/busca é a busca (não o histórico de um ativo chamado BUSCA)."""
+    resultado = pd.DataFrame([{"ticker": "PETR4", "nome_empresa": "PETROBRAS"}])
+    with patch.object(MarketService, 'search_tickers_async', return_value=resultado.to_dict(orient="records")) as busca:
+        resposta = client.get("/ativos/busca?q=pet&limite=5")
+    assert resposta.status_code == 200
+    assert resposta.json() == {"q": "pet", "total": 1, "ativos": [{"ticker": "PETR4", "nome_empresa": "PETROBRAS"}]}
+    busca.assert_called_once_with("pet", 5)
+    assert client.get("/ativos/busca?q=pet&limite=1000").status_code == 422
+
+#####################
+### BENCHMARKS    ###
+#####################
+
+def test_benchmark_comparison_respects_metric_direction():
+    """Latência maior e vazão menor são regressões; o inverso não, e medidas sem base são ignoradas."""
+    from benchmarks.suite import comparar
+    base = {"resultados": {"etl": {"linhas_s": 1000.0}, "api": {"p50_ms": 10.0, "p99_ms": 20.0}}}
+    atual = {"resultados": {"etl": {"linhas_s": 700.0}, "api": {"p50_ms": 8.0, "p99_ms": 30.0},
+                            "nova": {"p50_ms": 1.0}}}
+
+    linhas = {(c["medida"], c["metrica"]): c for c in comparar(atual, base, tolerancia=0.2)}
+
+    assert set(linhas) == {("etl", "linhas_s"), ("api", "p50_ms"), ("api", "p99_ms")}
+    assert linhas[("etl", "linhas_s")]["regressao"] and linhas[("api", "p99_ms")]["regressao"]
+    assert not linhas[("api", "p50_ms")]["regressao"] and linhas[("api", "p50_ms")]["variacao"] == -0.2
+
+##########################
+### INSTRUMENTATION.PY ###
+##########################
+
+def test_metrics_endpoint_exposes_route_and_query_histograms():
+    """/metrics no formato do Prometheus: latência pelo modelo da rota e leituras pela forma da consulta."""
+    from core.instrumentation import sql_shape, observe_query
+    observe_query("SELECT * FROM t WHERE cod_bdi IN ('02', '03') AND volume >= 100", 0.002, 7)
+    with patch.object(MarketService, 'get_history_async', return_value=pd.DataFrame()):
+        client.get("/ativos/PETR4")
+    client.get("/rota/inexistente")
+
+    resposta = client.get("/metrics")
+    texto = resposta.text
+
+    assert resposta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert sql_shape("SELECT *  FROM t WHERE a = 'x' AND b IN (1, 2, 3)") == "SELECT * FROM t WHERE a = ? AND b IN (?)"
+    assert 'b3_http_request_duration_seconds_count{method="GET",route="/ativos/{ativo}",status="404"}' in texto
+    assert 'route="<sem rota>",status="404"' in texto and "/rota/inexistente" not in texto
+    assert 'b3_db_query_rows_total{query="SELECT * FROM t WHERE cod_bdi IN (?) AND volume >= ?"}' in texto
+    assert '# TYPE b3_chart_cache_hits_total counter' in texto
+
+def test_profiler_header_captures_folded_stacks_for_slow_requests():
+    """Com o cabeçalho X-Profile, requisições lentas deixam um perfil "folded" em /perfis/{id}; rápidas não."""
+    import time
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.middleware import InstrumentationMiddleware
+
+    def calculo_pesado():
+        fim = time.perf_counter() + 0.15
+        while time.perf_counter() < fim:
+            sum(range(1000))
+
+    mini = FastAPI()
+    mini.add_middleware(InstrumentationMiddleware, profiling=True, slow_ms=100, interval_ms=2)
+    mini.get("/lento")(lambda: calculo_pesado() or {"ok": True})
+    mini.get("/rapido")(lambda: {"ok": True})
+    mini_client = TestClient(mini)
+
+    lento = mini_client.get("/lento", headers={"X-Profile": "1"})
+    rapido = mini_client.get("/rapido", headers={"X-Profile": "1"})
+    sem_cabecalho = mini_client.get("/lento")
+
+    assert lento.json() == {"ok": True} and "x-profile-id" in lento.headers
+    assert "x-profile-id" not in rapido.headers and "x-profile-id" not in sem_cabecalho.headers
+    folded = client.get(f"/perfis/{lento.headers['x-profile-id']}").text
+    linhas = folded.strip().splitlines()
+    assert linhas and all(linha.rsplit(" ", 1)[1].isdigit() for linha in linhas)
+    assert "test_services.py:calculo_pesado" in folded
+    assert client.get("/perfis/999999").status_code == 404
+
+#################
+### WARMUP.PY ###
+#################
+
+def test_api_import_is_lazy_about_matplotlib_and_logging():
+    """Importar a API não carrega o Matplotlib nem configura o logging raiz (isso fica para a inicialização)."""
+    import subprocess, sys
+    script = ("import logging, sys; import api.router; "
+              "print('matplotlib' in sys.modules, bool(logging.getLogger().handlers))")
+    saida = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                           cwd=str(Path(__file__).resolve().parents[2]))
+    assert saida.stdout.split() == ["False", "False"]
+
+def test_readiness_reports_warmup_steps_and_tolerates_failures():
+    """/pronto responde 503 até o aquecimento terminar; uma etapa com falha é registrada sem bloquear a prontidão."""
+    import asyncio
+    from services.warmup import Warmup
+    from services.ticker_index import ticker_index
+    from services.chart_renderer import chart_renderer
+
+    aquecimento = Warmup(tickers=2)
+    with patch('api.router.warmup', aquecimento):
+        antes = client.get("/pronto")
+        with patch.object(settings, 'PREWARM_ENABLED', True), \
+             patch.object(ticker_index, 'load_async', side_effect=RuntimeError("sem dim_ativos")), \
+             patch.object(MarketService, 'list_available_tickers_async', return_value=["PETR4", "VALE3"]), \
+             patch.object(MarketService, 'get_ticker_data_async', return_value=pd.DataFrame()) as historico, \
+             patch.object(chart_renderer, 'warm_up', return_value=0) as graficos:
+            asyncio.run(aquecimento.run())
+        depois = client.get("/pronto")
+
+    assert antes.status_code == 503 and antes.json()["pronto"] is False
+    assert depois.status_code == 200
+    corpo = depois.json()
+    assert corpo["pronto"] and set(corpo["etapas"]) == {"universo", "historico", "graficos"}
+    assert corpo["etapas"]["historico"]["resultado"] == 2 and historico.call_count == 2
+    assert corpo["erros"] == {"universo": "sem dim_ativos"}
+    graficos.assert_called_once()
+
+##########################
+### MARKET_SNAPSHOT.PY ###
+##########################
+
+def _snapshot_rows(ticker, datas, base):
+    """Linhas de cotacoes_historicas no formato de armazenamento (datas AAAAMMDD, centavos)."""
+    from core.constants import AdjustmentConfig
+    n = len(datas)
+    return pd.DataFrame({
+        "data_pregao": datas, "ticker": [ticker] * n, "cod_bdi": ["02"] * n, "tipo_registro": [1] * n,
+        "nome_empresa": [f"EMPRESA {ticker[:4]}"] * n,
+        **{c: [base + i for i in range(n)] for c in ["abertura", "maximo", "minimo", "medio", "fechamento"]},
+        "qtd_titulos": [100] * n, "volume": [10**12 + i for i in range(n)],
+        **{c: [None] * n for c in [AdjustmentConfig.FACTOR_COLUMN, *AdjustmentConfig.ADJUSTED_COLUMNS.values()]},
+    })
+
+def test_market_snapshot_round_trip_is_zero_copy_and_atomic(tmp_path):
+    """O snapshot devolve o mesmo histórico gravado, como fatias do memory-map, e a publicação não deixa temporários."""
+    from services.market_snapshot import MarketSnapshot
+    from core.constants import AdjustmentConfig
+    linhas = {"PETR4": _snapshot_rows("PETR4", [20240102, 20240103, 20240104], 3000),
+              "VALE3": _snapshot_rows("VALE3", [20240102, 20240104], 6000)}
+    versao = MagicMock()
+    versao.current.return_value = 2
+
+    def banco(query, params=None):
+        if "COUNT(*)" in query:
+            return pd.DataFrame({"ticker": list(linhas), "linhas": [len(df) for df in linhas.values()]})
+        return pd.concat([df for t, df in linhas.items() if params["a"] <= t <= params["b"]], ignore_index=True)
+
+    snapshot = MarketSnapshot(tmp_path, version=versao)
+    (tmp_path / "mercado_v0.bin").write_bytes(b"antigo")
+    with patch('services.market_snapshot.db_manager.get_from_cache', side_effect=banco):
+        total = snapshot.publish(batch_tickers=1)
+
+    petr4, vale3 = snapshot.get("PETR4"), snapshot.get("VALE3")
+    assert total == 5 and snapshot.get("ITUB4") == {}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["mercado_v2.bin", "snapshot.json"]
+    assert list(petr4["data_pregao"]) == [20240102, 20240103, 20240104] and list(vale3["fechamento"]) == [6000, 6001]
+    assert petr4["data_pregao"].dtype == np.int32 and petr4["volume"].dtype == np.int64
+    assert list(petr4["nome_empresa"]) == ["EMPRESA PETR"] * 3 and np.isnan(vale3[AdjustmentConfig.FACTOR_COLUMN]).all()
+    # Sem cópia: as colunas são visões do mesmo mapeamento do arquivo
+    assert np.shares_memory(petr4["fechamento"], snapshot.load().buffer)
+    assert snapshot.stats()["tickers"] == 2
+
+    # Outra versão dos dados ainda sem snapshot: a leitura volta ao banco
+    versao.current.return_value = 3
+    snapshot._checked_at = 0
+    assert snapshot.get("PETR4") is None
+
+def test_history_query_pushes_down_range_last_sessions_and_fields():
+    """Período, últimos pregões e campos entram na consulta; campos fora da lista nunca chegam ao SQL."""
+    from core.constants import AdjustmentConfig
+    service = MarketService()
+    colunas = service.storage_columns(["fechamento", "volume"], ajustado=True)
+    query, params = service.history_query("PETR4", colunas, inicio=20240101, ultimos=5)
+
+    assert colunas == ["data_pregao", "fechamento", "volume", AdjustmentConfig.ADJUSTED_COLUMNS["fechamento"]]
+    assert query.startswith(f"SELECT {', '.join(colunas)} FROM cotacoes_historicas")
+    assert "data_pregao >= :inicio" in query and "data_pregao <= :fim" not in query
+    assert query.endswith("ORDER BY data_pregao DESC LIMIT :n") and params == {"t": "PETR4", "inicio": 20240101, "n": 5}
+    assert service.history_query("PETR4") == (MarketService.TICKER_QUERY, {"t": "PETR4"})
+    with pytest.raises(ValueError):
+        service.storage_columns(["fechamento; DROP TABLE x"])
+
+@patch.object(MarketService, 'get_ticker_data_async')
+def test_api_history_last_sessions_and_fields(mock_data):
+    """/ativos/{ativo} repassa `ultimos` e `campos` à leitura e devolve só a data e os campos pedidos."""
+    mock_data.return_value = pd.DataFrame({"data_pregao": ["2024-01-02", "2024-01-03"], "ticker": ["PETR4"] * 2,
+                                           "fechamento": [30.5, 31.0], "volume": [1e9, 2e9]})
+
+    resposta = client.get("/ativos/petr4?ultimos=2&campos=fechamento")
+    invalido = client.get("/ativos/PETR4?campos=fechamento,senha")
+
+    assert resposta.json() == [{"data_pregao": "2024-01-02", "fechamento": 30.5},
+                               {"data_pregao": "2024-01-03", "fechamento": 31.0}]
+    assert mock_data.call_args.kwargs["ultimos"] == 2 and mock_data.call_args.kwargs["campos"] == ["fechamento"]
+    assert invalido.status_code == 400 and "senha" in invalido.json()["detail"]
+
+def test_batch_aligns_tickers_on_union_of_dates():
+    """O lote alinha os ativos na união das datas (NaN onde não negociou), com `ultimos` no eixo comum e ajuste."""
+    from core.constants import AdjustmentConfig
+    ajuste = AdjustmentConfig.ADJUSTED_COLUMNS["fechamento"]
+    series = {
+        "PETR4": {"data_pregao": np.array([20240102, 20240103, 20240105]), "fechamento": np.array([3000, 3100, 3200]),
+                  ajuste: np.array([1500.0, np.nan, np.nan])},
+        "VALE3": {"data_pregao": np.array([20240103, 20240104]), "fechamento": np.array([6000, 6100]),
+                  ajuste: np.array([np.nan, np.nan])},
+    }
+
+    lote = MarketService._align(["PETR4", "VALE3", "XPTO3"], series, ["fechamento"], ajustado=True)
+    ultimos = MarketService._align(["PETR4", "VALE3"], series, ["fechamento"], ultimos=2)
+
+    assert lote["datas"].tolist() == ["2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    assert lote["tickers"] == ["PETR4", "VALE3"] and lote["ausentes"] == ["XPTO3"]
+    np.testing.assert_array_equal(lote["valores"]["fechamento"],
+                                  [[15.0, 31.0, np.nan, 32.0], [np.nan, 60.0, 61.0, np.nan]])
+    assert ultimos["datas"].tolist() == ["2024-01-04", "2024-01-05"]
+    np.testing.assert_array_equal(ultimos["valores"]["fechamento"], [[np.nan, 32.0], [61.0, np.nan]])
+
+@patch.object(MarketService, 'get_batch_async')
+def test_api_batch_layouts_and_validation(mock_batch):
+    """/ativos/lote devolve séries por ativo ou a matriz data x ativo (null onde faltou) e valida a entrada."""
+    mock_batch.return_value = {
+        "datas": np.array(["2024-01-02", "2024-01-03"], dtype=object), "tickers": ["PETR4", "VALE3"],
+        "ausentes": ["XPTO3"], "campos": ["fechamento", "volume"],
+        "valores": {"fechamento": np.array([[30.0, 31.0], [np.nan, 60.0]]),
+                    "volume": np.array([[1e9, 2e9], [np.nan, 3e9]])},
+    }
+
+    colunas = client.get("/ativos/lote?tickers=petr4,VALE3,XPTO3,PETR4&campos=fechamento,volume").json()
+    matriz = client.get("/ativos/lote?tickers=PETR4,VALE3&campos=fechamento,volume&layout=matriz").json()
+    muitos = client.get("/ativos/lote?tickers=" + ",".join(f"T{i:03d}" for i in range(51)))
+    invalido = client.get("/ativos/lote?tickers=PETR4&campos=nome_empresa")
+
+    assert mock_batch.call_args_list[0].args[0] == ["PETR4", "VALE3", "XPTO3"]
+    assert colunas["datas"] == ["2024-01-02", "2024-01-03"] and colunas["ausentes"] == ["XPTO3"]
+    assert colunas["ativos"]["VALE3"] == {"fechamento": [None, 60.0], "volume": [None, 3e9]}
+    assert matriz["tickers"] == ["PETR4", "VALE3"] and matriz["valores"]["fechamento"] == [[30.0, None], [31.0, 60.0]]
+    assert muitos.status_code == 400 and invalido.status_code == 400